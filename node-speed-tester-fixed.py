@@ -11,12 +11,31 @@ import os
 import time
 import json
 import base64
+import csv
 import socket
 import ssl
 import argparse
+import asyncio
+import errno
 from datetime import datetime
 import subprocess
 import importlib
+import hashlib
+import signal
+import queue
+import multiprocessing
+import threading
+import itertools
+import struct
+import selectors
+import math
+from collections import deque
+from array import array
+
+try:
+    import resource  # 仅Unix
+except ImportError:
+    resource = None
 
 # ═══════════════════════════════════════════════════════════════
 # PIP 安装检测
@@ -215,8 +234,9 @@ except ImportError:
 import urllib.parse
 import urllib.request
 import urllib.error
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed, wait
 from typing import List, Dict, Tuple, Optional
+import ipaddress
 
 # ═══════════════════════════════════════════════════════════════
 # 美化输出函数
@@ -294,6 +314,1083 @@ def create_progress_bar(total, desc="Processing"):
         
         return SimpleProgress(total, desc)
 
+# ═══════════════════════════════════════════════════════════════
+# 订阅下载
+# ═══════════════════════════════════════════════════════════════
+
+class SubscriptionCache:
+    """订阅磁盘缓存 - 按URL保存ETag/Last-Modified元数据，解码后的节点逐行存放在同名.nodes文件中"""
+    
+    def __init__(self, directory='subscribe_cache', ttl=0):
+        self.directory = directory
+        self.ttl = ttl  # 秒，缓存在此时间内直接使用，不发请求
+    
+    def _path(self, url, suffix='.json'):
+        return os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest() + suffix)
+    
+    def get(self, url):
+        """读取缓存条目，不存在、损坏或缺少节点文件时返回None"""
+        try:
+            with open(self._path(url), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url or not os.path.exists(self._path(url, '.nodes')):
+            return None
+        return entry
+    
+    def is_fresh(self, entry):
+        """是否在TTL内"""
+        return self.ttl > 0 and time.time() - entry.get('fetched_at', 0) < self.ttl
+    
+    def nodes(self, url):
+        """逐行读取缓存的节点"""
+        try:
+            with open(self._path(url, '.nodes'), 'r', encoding='utf-8') as f:
+                for line in f:
+                    node = line.strip()
+                    if node:
+                        yield node
+        except OSError:
+            return
+    
+    def tee(self, url, etag, last_modified, nodes):
+        """透传节点并逐行写入缓存：全部产出且至少有一个节点时，节点文件与元数据原子替换；中途停止则丢弃"""
+        nodes_path = self._path(url, '.nodes')
+        tmp_path = f"{nodes_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        f = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            f = open(tmp_path, 'w', encoding='utf-8')
+        except OSError:
+            pass
+        
+        count = 0
+        try:
+            for node in nodes:
+                if f is not None:
+                    try:
+                        f.write(node + '\n')
+                    except OSError:
+                        f.close()
+                        f = None
+                count += 1
+                yield node
+            
+            if f is not None and count:
+                f.close()
+                try:
+                    os.replace(tmp_path, nodes_path)
+                except OSError:
+                    return
+                self._write(url, {
+                    'url': url,
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'fetched_at': time.time(),
+                })
+        finally:
+            if f is not None:
+                f.close()
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    
+    def touch(self, url, entry):
+        """304时刷新缓存时间"""
+        entry['fetched_at'] = time.time()
+        self._write(url, entry)
+    
+    def _write(self, url, entry):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(url)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+
+class SubscriptionFetcher:
+    """并发订阅下载器 - 按来源复用长连接，限制单主机与全局并发"""
+    
+    def __init__(self, timeout=10, max_in_flight=32, per_host=4, user_agent='Mozilla/5.0', max_retries=3,
+                 cache=None, offline=False):
+        self.timeout = timeout
+        self.cache = cache
+        self.offline = offline  # 离线模式：只使用缓存
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.per_host = max(int(per_host), 1)
+        self.max_retries = max_retries
+        self.headers = {'User-Agent': user_agent}
+        self.timings = []  # (链接, 耗时秒, 是否成功, 来源)
+        self.wall_time = 0
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        
+        # requests.Session为每个来源维护keep-alive连接池；urllib无连接复用
+        self.session = None
+        if HAS_REQUESTS:
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=64, pool_maxsize=self.per_host)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+    
+    @staticmethod
+    def origin(link):
+        """来源标识 (scheme, host:port)"""
+        parts = urllib.parse.urlsplit(link)
+        return parts.scheme, parts.netloc
+    
+    def _host_slot(self, link):
+        origin = self.origin(link)
+        with self._lock:
+            slot = self._host_slots.get(origin)
+            if slot is None:
+                slot = self._host_slots[origin] = threading.BoundedSemaphore(self.per_host)
+        return slot
+    
+    def _get(self, link, headers):
+        """发送GET请求，返回 (状态码, 内容, ETag, Last-Modified)"""
+        if self.session is not None:
+            response = self.session.get(link, timeout=self.timeout, headers=headers)
+            response.raise_for_status()
+            return (response.status_code, response.text,
+                    response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        
+        req = urllib.request.Request(link, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return (response.status, response.read().decode('utf-8'),
+                        response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return 304, '', None, None
+            raise
+    
+    def _record(self, link, elapsed, result):
+        ok = result['content'] is not None or result['nodes'] is not None
+        with self._lock:
+            self.timings.append((link, elapsed, ok, result['source']))
+    
+    def timed_fetch(self, link):
+        """下载单个订阅（失败重试），返回 (结果, 耗时秒)
+        
+        结果中content为新下载的正文；命中缓存(TTL内/304/离线)时nodes为缓存的节点列表
+        """
+        result = {'content': None, 'nodes': None, 'status': None,
+                  'etag': None, 'last_modified': None, 'source': 'network'}
+        
+        entry = self.cache.get(link) if self.cache else None
+        if entry is not None and (self.offline or self.cache.is_fresh(entry)):
+            result.update(nodes=list(self.cache.nodes(link)), source='cache')
+            self._record(link, 0, result)
+            return result, 0
+        
+        if self.offline:
+            print_info(f"离线模式下无缓存: {link}", "warning")
+            self._record(link, 0, result)
+            return result, 0
+        
+        # 条件请求
+        headers = dict(self.headers)
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        
+        start_time = time.time()
+        
+        for attempt in range(self.max_retries):
+            try:
+                with self._host_slot(link):
+                    status, content, etag, last_modified = self._get(link, headers)
+                if status == 304 and entry is not None:
+                    self.cache.touch(link, entry)
+                    result.update(nodes=list(self.cache.nodes(link)), status=status, source='304')
+                else:
+                    result.update(content=content, status=status, etag=etag, last_modified=last_modified)
+                break
+            except Exception as e:
+                if attempt < self.max_retries - 1:
+                    time.sleep(2 ** attempt)
+                else:
+                    print_info(f"获取订阅失败: {str(e)}", "warning")
+        
+        elapsed = time.time() - start_time
+        self._record(link, elapsed, result)
+        return result, elapsed
+    
+    def interleave(self, links):
+        """按来源轮转排列，避免全局并发槽被同一主机占满"""
+        by_origin = {}
+        for link in links:
+            by_origin.setdefault(self.origin(link), []).append(link)
+        return [link for group in itertools.zip_longest(*by_origin.values())
+                for link in group if link is not None]
+    
+    def fetch_all(self, links):
+        """并发下载，按完成顺序产出 (链接, 结果, 耗时秒)"""
+        if not links:
+            return
+        
+        start_time = time.time()
+        executor = ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(links)))
+        try:
+            futures = {executor.submit(self.timed_fetch, link): link for link in self.interleave(links)}
+            for future in as_completed(futures):
+                result, elapsed = future.result()
+                yield futures[future], result, elapsed
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.wall_time += time.time() - start_time
+    
+    def summary(self):
+        """下载统计：数量、成功数、缓存命中、实际耗时、串行耗时之和"""
+        with self._lock:
+            timings = list(self.timings)
+        return {
+            'count': len(timings),
+            'ok': sum(1 for t in timings if t[2]),
+            'cached': sum(1 for t in timings if t[3] != 'network'),
+            'wall': self.wall_time,
+            'total': sum(t[1] for t in timings),
+        }
+
+# ═══════════════════════════════════════════════════════════════
+# DNS解析
+# ═══════════════════════════════════════════════════════════════
+
+class DNSResolver:
+    """DNS解析阶段 - 独立线程池并行解析唯一主机名，带TTL与失败缓存"""
+    
+    def __init__(self, workers=32, ttl=300, negative_ttl=30):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.executor = ThreadPoolExecutor(max_workers=max(int(workers), 1))
+        self.cache = {}     # 主机 -> (IP或None, 过期时间, 解析耗时ms)
+        self.inflight = {}  # 主机 -> Future
+        self.lock = threading.Lock()
+        
+        # 统计
+        self.lookups = 0
+        self.hits = 0
+        self.failures = 0
+        self.total_ms = 0.0
+    
+    @staticmethod
+    def is_ip(host):
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+    
+    @staticmethod
+    def _done(value):
+        future = Future()
+        future.set_result(value)
+        return future
+    
+    def submit(self, host):
+        """提交解析，返回结果为IP(失败为None)的Future；同一主机只解析一次"""
+        host = str(host) if host else ''
+        if not host or self.is_ip(host):
+            return self._done(host or None)
+        
+        with self.lock:
+            cached = self.cache.get(host)
+            if cached is not None and cached[1] > time.time():
+                self.hits += 1
+                return self._done(cached[0])
+            
+            future = self.inflight.get(host)
+            if future is None:
+                future = self.inflight[host] = self.executor.submit(self._lookup, host)
+            else:
+                self.hits += 1
+            return future
+    
+    def _lookup(self, host):
+        start_ns = time.perf_counter_ns()
+        ip = None
+        try:
+            infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+            # 优先IPv4
+            infos.sort(key=lambda info: info[0] != socket.AF_INET)
+            ip = infos[0][4][0] if infos else None
+        except (OSError, UnicodeError):
+            ip = None
+        elapsed = (time.perf_counter_ns() - start_ns) / 1e6
+        
+        with self.lock:
+            self.lookups += 1
+            self.total_ms += elapsed
+            if ip is None:
+                self.failures += 1
+            self.cache[host] = (ip, time.time() + (self.ttl if ip else self.negative_ttl), elapsed)
+            self.inflight.pop(host, None)
+        return ip
+    
+    def resolve(self, host):
+        """阻塞解析，返回IP或None"""
+        return self.submit(host).result()
+    
+    def prefetch(self, hosts):
+        """并行解析一批主机，全部完成后返回"""
+        wait([self.submit(host) for host in set(hosts)])
+    
+    def elapsed(self, host):
+        """主机的解析耗时(ms)：IP字面量为0，尚未解析为None"""
+        if not host or self.is_ip(host):
+            return 0.0
+        with self.lock:
+            cached = self.cache.get(host)
+        return cached[2] if cached else None
+    
+    def summary(self):
+        """解析统计"""
+        with self.lock:
+            return {
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'failures': self.failures,
+                'avg_ms': self.total_ms / self.lookups if self.lookups else 0,
+            }
+
+# ═══════════════════════════════════════════════════════════════
+# 套接字预算
+# ═══════════════════════════════════════════════════════════════
+
+class SocketBudget:
+    """套接字资源预算 - 提升文件描述符上限、限制在途套接字、RST关闭与源地址轮换"""
+    
+    # 本机资源耗尽类错误（不是节点的问题）
+    RESOURCE_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.EADDRNOTAVAIL, errno.ENOBUFS, errno.ENOMEM}
+    
+    def __init__(self, reserve=64, max_sockets=0, source_addresses=None, rst_close=True, retries=2):
+        self.rst_close = rst_close
+        self.retries = retries
+        self.fd_before, self.fd_limit = self.raise_fd_limit()
+        
+        # 预留部分描述符给DNS线程、缓存文件等
+        capacity = self.fd_limit - reserve if self.fd_limit else 4096
+        if max_sockets:
+            capacity = min(capacity, max_sockets)
+        self.capacity = max(capacity, 16)
+        
+        # 源地址按地址族轮换
+        v4 = [addr for addr in source_addresses or [] if ':' not in addr]
+        v6 = [addr for addr in source_addresses or [] if ':' in addr]
+        self.sources = {
+            socket.AF_INET: itertools.cycle(v4) if v4 else None,
+            socket.AF_INET6: itertools.cycle(v6) if v6 else None,
+        }
+        
+        self.exhausted = 0  # 本机资源耗尽次数（不计入节点失败）
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def raise_fd_limit(target=65536):
+        """把软上限提升到硬上限(最多target)，返回 (原软上限, 当前软上限)"""
+        if resource is None:
+            return None, None
+        try:
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        except (ValueError, OSError):
+            return None, None
+        
+        if soft == resource.RLIM_INFINITY:
+            return soft, target
+        wanted = target if hard == resource.RLIM_INFINITY else min(target, hard)
+        
+        # macOS的内核上限(OPEN_MAX)低于硬上限时setrlimit会失败，退一步再试
+        for limit in (wanted, min(wanted, 10240)):
+            if limit <= soft:
+                break
+            try:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+                return soft, limit
+            except (ValueError, OSError):
+                continue
+        return soft, soft
+    
+    def cap(self, concurrency):
+        """把并发数限制在套接字预算内（每个工作者同时最多持有一个套接字）"""
+        return max(min(int(concurrency), self.capacity), 1)
+    
+    def source_for(self, host):
+        """轮换选取与目标同地址族的源地址，未配置时返回None"""
+        family = socket.AF_INET6 if ':' in str(host) else socket.AF_INET
+        sources = self.sources[family]
+        return (next(sources), 0) if sources else None
+    
+    def prepare(self, sock):
+        """SO_LINGER=0：关闭时直接发RST，不留TIME_WAIT占用本地端口"""
+        if self.rst_close and sock is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            except OSError:
+                pass
+    
+    def is_exhaustion(self, error):
+        """是否为本机资源耗尽（描述符/端口/缓冲区），是则计数"""
+        if getattr(error, 'errno', None) not in self.RESOURCE_ERRNOS:
+            return False
+        with self.lock:
+            self.exhausted += 1
+        return True
+    
+    def connect(self, host, port, timeout):
+        """建立探测用TCP连接；本机资源耗尽时退避重试，其余错误原样抛出"""
+        for attempt in range(self.retries + 1):
+            try:
+                sock = socket.create_connection((str(host), int(port)), timeout=timeout,
+                                                source_address=self.source_for(host))
+                self.prepare(sock)
+                return sock
+            except OSError as e:
+                if attempt == self.retries or not self.is_exhaustion(e):
+                    raise
+                time.sleep(0.1 * (attempt + 1))
+
+# ═══════════════════════════════════════════════════════════════
+# TLS探测
+# ═══════════════════════════════════════════════════════════════
+
+class TLSProbe:
+    """TLS探测上下文 - 每种配置(ALPN, 最低版本)只构建一次SSLContext供所有工作者共用，可选测量会话复用握手"""
+    
+    VERSIONS = {'TLSv1.2': ssl.TLSVersion.TLSv1_2, 'TLSv1.3': ssl.TLSVersion.TLSv1_3}
+    
+    def __init__(self, min_version='TLSv1.2', resumption=False, ticket_wait=0.2):
+        self.min_version = self.VERSIONS.get(min_version, ssl.TLSVersion.TLSv1_2)
+        self.resumption = resumption
+        self.ticket_wait = ticket_wait  # 等待TLS 1.3会话票据的时间(秒)
+        self.contexts = {}  # ALPN -> SSLContext
+        self.sessions = {}  # (主机, 端口, SNI, ALPN) -> SSLSession
+        self.lock = threading.Lock()
+        
+        # 统计
+        self.resume_attempts = 0
+        self.resumed = 0
+    
+    def context(self, alpn=''):
+        """取共享上下文，alpn为逗号分隔的协议列表"""
+        ctx = self.contexts.get(alpn)
+        if ctx is None:
+            with self.lock:
+                ctx = self.contexts.get(alpn)
+                if ctx is None:
+                    ctx = self.contexts[alpn] = self._build(alpn)
+        return ctx
+    
+    def _build(self, alpn):
+        # 不校验证书，也就不必加载系统CA证书库
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+        ctx.minimum_version = self.min_version
+        if alpn:
+            try:
+                ctx.set_alpn_protocols([proto for proto in alpn.split(',') if proto])
+            except (NotImplementedError, ssl.SSLError):
+                pass
+        return ctx
+    
+    def handshake(self, sock, server_hostname, alpn='', session=None):
+        """在已连接的套接字上握手，返回 (SSLSocket, 握手耗时ms)"""
+        start_ns = time.perf_counter_ns()
+        ssock = self.context(alpn).wrap_socket(sock, server_hostname=server_hostname, session=session)
+        return ssock, (time.perf_counter_ns() - start_ns) / 1e6
+    
+    def remember(self, key, ssock):
+        """复用模式：收取会话票据并缓存会话"""
+        if not self.resumption:
+            return
+        try:
+            # TLS 1.3的NewSessionTicket在握手后才到达，需读一次让OpenSSL处理
+            ssock.settimeout(self.ticket_wait)
+            ssock.recv(1)
+        except (OSError, ssl.SSLError):
+            pass
+        session = ssock.session
+        if session is not None:
+            with self.lock:
+                self.sessions[key] = session
+    
+    def measure_resumed(self, connect, key, server_hostname, alpn=''):
+        """用缓存会话重新握手，返回复用握手耗时(ms)；无会话时先完整握手一次，服务端未复用返回None；会话用后即删除"""
+        try:
+            if key not in self.sessions:
+                with connect() as sock:
+                    ssock, _ = self.handshake(sock, server_hostname, alpn)
+                    with ssock:
+                        self.remember(key, ssock)
+            
+            # 每个会话只用于本次复用测量，取出即删除，缓存不随节点数增长
+            with self.lock:
+                session = self.sessions.pop(key, None)
+            if session is None:
+                return None
+            
+            with connect() as sock:
+                ssock, elapsed = self.handshake(sock, server_hostname, alpn, session)
+                with ssock:
+                    reused = ssock.session_reused
+        except (OSError, ssl.SSLError, ValueError):
+            return None
+        
+        with self.lock:
+            self.resume_attempts += 1
+            if reused:
+                self.resumed += 1
+        return elapsed if reused else None
+    
+    def summary(self):
+        with self.lock:
+            return {'contexts': len(self.contexts), 'attempts': self.resume_attempts, 'resumed': self.resumed}
+
+# ═══════════════════════════════════════════════════════════════
+# TCP初筛
+# ═══════════════════════════════════════════════════════════════
+
+class TCPScreen:
+    """TCP初筛 - 单线程非阻塞connect批量探测端点，连不上的节点不进入深度测试"""
+    
+    def __init__(self, timeout=1.5, concurrency=500, budget=None):
+        self.timeout = timeout
+        self.budget = budget
+        self.concurrency = budget.cap(concurrency) if budget else max(int(concurrency), 1)
+    
+    def _open(self, endpoint):
+        """发起非阻塞连接，返回套接字"""
+        host, port = endpoint
+        sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setblocking(False)
+            source = self.budget.source_for(host) if self.budget else None
+            if source:
+                sock.bind(source)
+            code = sock.connect_ex((host, port))
+            if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                raise OSError(code, os.strerror(code))
+        except Exception:
+            sock.close()
+            raise
+        return sock
+    
+    def _close(self, sock):
+        if self.budget:
+            self.budget.prepare(sock)
+        sock.close()
+    
+    def run(self, endpoints):
+        """探测全部 (IP, 端口)，返回 {端点: 建连耗时ms}，连接失败或超时为None"""
+        results = {}
+        pending = deque(endpoints)
+        inflight = {}  # 套接字 -> (端点, 发起时间)，按发起顺序排列
+        timeout_ns = int(self.timeout * 1e9)
+        selector = selectors.DefaultSelector()
+        
+        try:
+            while pending or inflight:
+                # 补足在途连接
+                while pending and len(inflight) < self.concurrency:
+                    endpoint = pending.popleft()
+                    try:
+                        sock = self._open(endpoint)
+                    except OSError as e:
+                        if inflight and self.budget and self.budget.is_exhaustion(e):
+                            # 本机资源耗尽：等在途连接释放后再试
+                            pending.appendleft(endpoint)
+                            break
+                        results[endpoint] = None
+                        continue
+                    inflight[sock] = (endpoint, time.perf_counter_ns())
+                    selector.register(sock, selectors.EVENT_WRITE)
+                
+                if not inflight:
+                    continue
+                
+                # 最多等到最早发起的连接超时
+                oldest = next(iter(inflight.values()))[1]
+                wait_s = max(oldest + timeout_ns - time.perf_counter_ns(), 0) / 1e9
+                events = selector.select(wait_s)
+                now = time.perf_counter_ns()
+                
+                # 可写即连接完成，SO_ERROR区分成功与失败
+                for key, _ in events:
+                    sock = key.fileobj
+                    endpoint, started = inflight.pop(sock)
+                    selector.unregister(sock)
+                    failed = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    results[endpoint] = None if failed else (now - started) / 1e6
+                    self._close(sock)
+                
+                # 超时的连接按发起顺序从头淘汰
+                while inflight:
+                    sock, (endpoint, started) = next(iter(inflight.items()))
+                    if now - started < timeout_ns:
+                        break
+                    del inflight[sock]
+                    selector.unregister(sock)
+                    results[endpoint] = None
+                    self._close(sock)
+        finally:
+            for sock in inflight:
+                sock.close()
+            selector.close()
+        
+        return results
+
+# ═══════════════════════════════════════════════════════════════
+# 异步探测引擎
+# ═══════════════════════════════════════════════════════════════
+
+class AsyncProbeEngine:
+    """asyncio探测引擎 - 单线程内维持大量并发连接"""
+    
+    def __init__(self, timeout=5, concurrency=1000, budget=None, tls=None):
+        self.timeout = timeout
+        self.budget = budget  # 套接字预算，None时不限制
+        self.concurrency = budget.cap(concurrency) if budget else max(int(concurrency), 1)
+        self.tls = tls or TLSProbe()  # 共享SSL上下文
+    
+    async def open_connection(self, host, port, **kwargs):
+        """建立连接；本机资源耗尽时退避重试，其余错误原样抛出"""
+        retries = self.budget.retries if self.budget else 0
+        for attempt in range(retries + 1):
+            try:
+                return await asyncio.wait_for(
+                    asyncio.open_connection(str(host), int(port),
+                                            local_addr=self.budget.source_for(host) if self.budget else None,
+                                            **kwargs),
+                    timeout=self.timeout
+                )
+            except OSError as e:
+                if attempt == retries or not self.budget.is_exhaustion(e):
+                    raise
+                await asyncio.sleep(0.1 * (attempt + 1))
+    
+    def close(self, writer):
+        """立即关闭连接（按预算设置RST关闭）"""
+        if self.budget:
+            self.budget.prepare(writer.get_extra_info('socket'))
+        writer.transport.abort()
+    
+    async def tcp_latency(self, host, port):
+        """单次TCP连接延迟(ms)，失败返回None"""
+        try:
+            start_ns = time.perf_counter_ns()
+            reader, writer = await self.open_connection(host, port)
+            latency = (time.perf_counter_ns() - start_ns) / 1e6
+            self.close(writer)
+            return latency
+        except Exception:
+            return None
+    
+    async def tls_handshake(self, host, port, server_hostname):
+        """TLS握手耗时(ms，不含TCP建连)，失败返回None"""
+        try:
+            reader, writer = await self.open_connection(host, port)
+        except Exception:
+            return None
+        
+        try:
+            start_ns = time.perf_counter_ns()
+            transport = await asyncio.wait_for(
+                asyncio.get_running_loop().start_tls(writer.transport, writer.transport.get_protocol(),
+                                                     self.tls.context(), server_hostname=server_hostname),
+                timeout=self.timeout
+            )
+            elapsed = (time.perf_counter_ns() - start_ns) / 1e6
+            cipher = transport.get_extra_info('cipher')
+            transport.abort()
+            return elapsed if cipher is not None else None
+        except Exception:
+            return None
+        finally:
+            self.close(writer)
+    
+    async def _worker(self, source, handler, on_result, on_error):
+        for item in source:
+            try:
+                result = await handler(item)
+            except Exception:
+                # 出错的节点也要回调，否则计数与进度条对不上总数
+                result = on_error(item)
+            on_result(result)
+    
+    def run(self, items, handler, on_result, on_error):
+        """并发执行handler协程，on_result在事件循环线程中回调；handler抛出异常时回调on_error(item)的结果"""
+        async def main():
+            source = iter(items)
+            await asyncio.gather(*[
+                self._worker(source, handler, on_result, on_error)
+                for _ in range(self.concurrency)
+            ])
+        
+        asyncio.run(main())
+
+# ═══════════════════════════════════════════════════════════════
+# 延迟直方图
+# ═══════════════════════════════════════════════════════════════
+
+class LatencyHistogram:
+    """对数分桶延迟直方图 - 固定内存，O(1)记录，给出整轮的精确计数、均值与分位数（相对误差不超过precision）"""
+    
+    def __init__(self, lowest=0.01, highest=60000, precision=0.01):
+        self.lowest = lowest
+        self.precision = precision
+        self.log_base = math.log1p(precision)
+        self.counts = [0] * (self.index(highest) + 1)  # 1%精度下约1600个桶
+        self.total = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.lock = threading.Lock()
+    
+    def index(self, value):
+        """值所在的桶：第i个桶覆盖 [lowest·(1+p)^i, lowest·(1+p)^(i+1))"""
+        if value <= self.lowest:
+            return 0
+        return int(math.log(value / self.lowest) / self.log_base)
+    
+    def bucket_value(self, index):
+        """桶的代表值（几何中点）"""
+        return self.lowest * (1 + self.precision) ** (index + 0.5)
+    
+    def record(self, value):
+        """记录一个延迟(ms)，超出上限的计入最后一个桶"""
+        index = min(self.index(value), len(self.counts) - 1)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += 1
+            self.sum += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+    
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+    
+    def percentiles(self, points=(50, 90, 99)):
+        """一次扫描求多个分位数，返回 {p: ms}；结果夹在实际最小/最大值之间"""
+        with self.lock:
+            if not self.total:
+                return {}
+            ranks = sorted((max(math.ceil(p / 100 * self.total), 1), p) for p in points)
+            result = {}
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                while ranks and seen >= ranks[0][0]:
+                    result[ranks.pop(0)[1]] = min(max(self.bucket_value(index), self.min), self.max)
+                if not ranks:
+                    break
+            return result
+    
+    def count_between(self, low, high):
+        """[low, high) 区间内的记录数（按桶代表值归属，误差在边界桶内）"""
+        def first_above(value):
+            # 代表值不小于value的第一个桶
+            if value <= self.lowest:
+                return 0
+            return max(int(math.log(value / self.lowest) / self.log_base + 0.5), 0)
+        
+        with self.lock:
+            return sum(self.counts[first_above(low):first_above(high)])
+    
+    def summary(self):
+        """计数、均值、最小/最大与p50/p90/p99"""
+        pct = self.percentiles()
+        return {
+            'count': self.total,
+            'mean': round(self.mean(), 2),
+            'min': round(self.min, 2) if self.total else None,
+            'max': round(self.max, 2) if self.total else None,
+            'p50': round(pct[50], 2) if pct else None,
+            'p90': round(pct[90], 2) if pct else None,
+            'p99': round(pct[99], 2) if pct else None,
+        }
+    
+    def to_dict(self):
+        """导出为JSON可序列化的字典，只保留非空桶 [下界ms, 上界ms, 计数]"""
+        with self.lock:
+            buckets = [[round(self.lowest * (1 + self.precision) ** i, 3),
+                        round(self.lowest * (1 + self.precision) ** (i + 1), 3), count]
+                       for i, count in enumerate(self.counts) if count]
+        return dict(self.summary(), unit='ms', precision=self.precision, buckets=buckets)
+    
+    def merge(self, other):
+        """并入另一个同参数的直方图"""
+        with other.lock:
+            counts = list(other.counts)
+            total, total_sum, low, high = other.total, other.sum, other.min, other.max
+        with self.lock:
+            self.counts = [mine + theirs for mine, theirs in zip(self.counts, counts)]
+            self.total += total
+            self.sum += total_sum
+            self.min = min(self.min, low)
+            self.max = max(self.max, high)
+    
+    def export(self, path):
+        """写出JSON文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+# ═══════════════════════════════════════════════════════════════
+# 分片计数
+# ═══════════════════════════════════════════════════════════════
+
+class ProbeCounters:
+    """分片计数器 - 每个线程只写自己的分片（计数、延迟直方图、最近节点环形缓冲），探测热路径不争用共享锁；
+    UI线程与结束统计时汇总各分片，总数精确"""
+    
+    def __init__(self, recent=100):
+        self.local = threading.local()
+        self.shards = []
+        self.recent_size = recent
+        self.sequence = itertools.count()  # 跨分片的完成顺序
+        self.lock = threading.Lock()  # 仅在线程首次登记分片时使用
+    
+    def shard(self):
+        """当前线程的分片，首次调用时创建并登记"""
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = {'counts': {}, 'histogram': LatencyHistogram(), 'recent': deque(maxlen=self.recent_size)}
+            with self.lock:
+                self.shards.append(shard)
+            self.local.shard = shard
+        return shard
+    
+    def add(self, *keys):
+        """各计数键加一"""
+        counts = self.shard()['counts']
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+    
+    def record_latency(self, latency, info=None):
+        """记录延迟，传入节点信息时同时放入最近节点缓冲"""
+        shard = self.shard()
+        shard['histogram'].record(latency)
+        if info is not None:
+            shard['recent'].append((next(self.sequence), info))
+    
+    def totals(self):
+        """汇总各分片计数（dict复制在C层完成，不会读到写了一半的分片）"""
+        total = {}
+        for shard in list(self.shards):
+            for key, value in dict(shard['counts']).items():
+                total[key] = total.get(key, 0) + value
+        return total
+    
+    def total(self, key):
+        return sum(shard['counts'].get(key, 0) for shard in list(self.shards))
+    
+    def histogram(self):
+        """合并各分片的延迟直方图"""
+        merged = LatencyHistogram()
+        for shard in list(self.shards):
+            merged.merge(shard['histogram'])
+        return merged
+    
+    def recent(self, count=None):
+        """各分片最近节点按完成顺序合并，返回最后count个"""
+        items = []
+        for shard in list(self.shards):
+            items.extend(list(shard['recent']))
+        items.sort(key=lambda item: item[0])
+        return [info for _, info in items[-count if count else 0:]]
+
+# ═══════════════════════════════════════════════════════════════
+# 紧凑节点存储
+# ═══════════════════════════════════════════════════════════════
+
+class NodeArena:
+    """原始链接字节区 - 全部链接UTF-8编码后顺序追加进一个bytearray，只用偏移数组定位；
+    十万到百万级节点时省去每个链接一个str对象（对象头+列表槽位），按下标取出时才解码"""
+    
+    def __init__(self, nodes=()):
+        self.data = bytearray()
+        self.offsets = array('Q', [0])  # 第i条链接位于 data[offsets[i]:offsets[i+1]]
+        self.extend(nodes)
+    
+    def append(self, raw):
+        self.data += raw.encode('utf-8', 'surrogatepass')
+        self.offsets.append(len(self.data))
+    
+    def extend(self, nodes):
+        for raw in nodes:
+            self.append(raw)
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # 切片（分片进程）得到新的字节区
+            return NodeArena(self[i] for i in range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('NodeArena index out of range')
+        return self.data[self.offsets[index]:self.offsets[index + 1]].decode('utf-8', 'surrogatepass')
+    
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class NodeRecord:
+    """紧凑节点记录 - __slots__代替每节点一个dict，主机名驻留为共享字符串，原始链接可只记字节区下标；
+    保留 info['键'] / info.get / '键' in info / info.update 的dict式用法，未赋值的字段视为不存在"""
+    
+    FIELDS = ('type', 'name', 'server', 'port', 'country', 'network',
+              'screen_ms', 'dns_ms', 'tcp_ms', 'tls_ms', 'tls_resumed_ms', 'latency')
+    KEYS = frozenset(FIELDS + ('raw',))
+    __slots__ = FIELDS + ('_raw', '_arena', '_index')
+    
+    def __init__(self, raw='', **fields):
+        self._raw = raw
+        self._arena = None
+        self._index = 0
+        for key, value in fields.items():
+            self[key] = value
+    
+    @property
+    def raw(self):
+        return self._raw if self._arena is None else self._arena[self._index]
+    
+    def bind(self, arena, index):
+        """原始链接改为引用字节区中的第index条，释放独立的字符串"""
+        self._raw, self._arena, self._index = None, arena, index
+    
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def __setitem__(self, key, value):
+        if key == 'raw':
+            self._raw, self._arena = value, None
+        elif key in self.KEYS:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+    
+    def __contains__(self, key):
+        return key in self.KEYS and hasattr(self, key)
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def update(self, fields):
+        for key, value in fields.items():
+            self[key] = value
+    
+    def __getstate__(self):
+        """跨进程回传时展开原始链接，不连带整个字节区"""
+        state = {key: getattr(self, key) for key in self.FIELDS if hasattr(self, key)}
+        state['raw'] = self.raw
+        return state
+    
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+# ═══════════════════════════════════════════════════════════════
+# 流式导出
+# ═══════════════════════════════════════════════════════════════
+
+class ResultExporter:
+    """流式结果导出 - 每个结果到达即追加：JSON Lines / CSV 一行一个节点，订阅文件为base64编码的链接列表；
+    按行刷新到磁盘，长时间运行时下游工具可以边测边读"""
+    
+    FILES = {'json': 'node.jsonl', 'csv': 'node.csv', 'sub': 'node_sub.txt'}
+    COLUMNS = ('time', 'name', 'protocol', 'server', 'port', 'country', 'available', 'latency',
+               'dns_ms', 'screen_ms', 'tcp_ms', 'tls_ms', 'tls_resumed_ms', 'raw')
+    
+    def __init__(self, formats):
+        self.formats = [fmt for fmt in self.FILES if fmt in formats]
+        self.files = {}
+        self.csv = None
+        self.pending = b''  # base64按3字节一组编码，不足一组的尾部留到下次
+        self.lock = threading.Lock()
+    
+    def open(self):
+        for fmt in self.formats:
+            if fmt == 'sub':
+                self.files[fmt] = open(self.FILES[fmt], 'wb')
+            else:
+                self.files[fmt] = open(self.FILES[fmt], 'w', encoding='utf-8', newline='', buffering=1)
+        if 'csv' in self.files:
+            self.csv = csv.writer(self.files['csv'], lineterminator='\n')
+            self.csv.writerow(self.COLUMNS)
+    
+    @staticmethod
+    def row(node, available):
+        """单个节点的完整探测信息"""
+        phase = lambda key: round(node[key], 2) if node.get(key) is not None else None
+        return {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'name': node.get('name', ''),
+            'protocol': node.get('type', ''),
+            'server': node.get('server', ''),
+            'port': node.get('port', 0),
+            'country': node.get('country', ''),
+            'available': available,
+            'latency': phase('latency'),
+            'dns_ms': phase('dns_ms'),
+            'screen_ms': phase('screen_ms'),
+            'tcp_ms': phase('tcp_ms'),
+            'tls_ms': phase('tls_ms'),
+            'tls_resumed_ms': phase('tls_resumed_ms'),
+            'raw': node['raw'],
+        }
+    
+    def write(self, node, available=True):
+        """追加一个结果；订阅文件只收可用节点"""
+        if not self.formats:
+            return
+        row = self.row(node, available)
+        with self.lock:
+            if not self.files:
+                return
+            if 'json' in self.files:
+                self.files['json'].write(json.dumps(row, ensure_ascii=False) + '\n')
+            if self.csv is not None:
+                self.csv.writerow([row[column] for column in self.COLUMNS])
+            if 'sub' in self.files and available:
+                data = self.pending + (row['raw'] + '\n').encode('utf-8')
+                cut = len(data) - len(data) % 3
+                self.files['sub'].write(base64.b64encode(data[:cut]))
+                self.files['sub'].flush()
+                self.pending = data[cut:]
+    
+    def close(self):
+        """写出订阅文件的base64尾部并关闭全部文件，返回导出的文件名"""
+        with self.lock:
+            if 'sub' in self.files and self.pending:
+                self.files['sub'].write(base64.b64encode(self.pending))
+                self.pending = b''
+            for f in self.files.values():
+                f.close()
+            paths = [self.FILES[fmt] for fmt in self.files]
+            self.files = {}
+            self.csv = None
+        return paths
+
 # ═══════════════════════════════════════════════════════════════
 # 主测速类
 # ═══════════════════════════════════════════════════════════════
@@ -307,31 +1404,77 @@ class NodeSpeedTester:
             'max_latency': 1000,
             'test_mode': 'standard',
             'output_format': 'txt',
+            'engine': 'thread',
+            'async_concurrency': 1000,
+            'processes': 1,
             'save_unavailable': False,
             'ping_count': 3,
             'http_test_timeout': 10,
             'tls_test_host': 'www.google.com',
-            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'fetch_in_flight': 32,
+            'fetch_per_host': 4,
+            'use_cache': True,
+            'cache_dir': 'subscribe_cache',
+            'cache_ttl': 0,
+            'offline': False,
+            'dns_workers': 32,
+            'dns_ttl': 300,
+            'dns_negative_ttl': 30,
+            'max_sockets': 0,
+            'fd_reserve': 64,
+            'source_addresses': [],
+            'rst_close': True,
+            'tls_min_version': 'TLSv1.2',
+            'tls_resumption': False,
+            'funnel': True,  # 两阶段测速：TCP初筛后只深测存活节点
+            'screen_timeout': 1.5,  # 初筛连接超时(秒)
+            'screen_concurrency': 500,  # 初筛在途连接数
+            'histogram_json': ''  # 导出延迟直方图的JSON文件，空=不导出
         }
         
         if config:
             self.config.update(config)
         
+        self.cache = None
+        if self.config['use_cache'] or self.config['offline']:
+            self.cache = SubscriptionCache(self.config['cache_dir'], self.config['cache_ttl'])
+        self.resolver = DNSResolver(
+            workers=self.config['dns_workers'],
+            ttl=self.config['dns_ttl'],
+            negative_ttl=self.config['dns_negative_ttl']
+        )
+        self.budget = SocketBudget(
+            reserve=self.config['fd_reserve'],
+            max_sockets=self.config['max_sockets'],
+            source_addresses=self.config['source_addresses'],
+            rst_close=self.config['rst_close']
+        )
+        self.tls = TLSProbe(self.config['tls_min_version'], self.config['tls_resumption'])
+        self.fetcher = SubscriptionFetcher(
+            timeout=self.config['http_test_timeout'],
+            max_in_flight=self.config['fetch_in_flight'],
+            per_host=self.config['fetch_per_host'],
+            user_agent=self.config['user_agent'],
+            cache=self.cache,
+            offline=self.config['offline']
+        )
+        
         self.available_nodes = []
         self.unavailable_nodes = []
+        # -f json/csv/sub 为流式导出，all 包含全部格式
+        formats = ResultExporter.FILES if self.config['output_format'] == 'all' else [self.config['output_format']]
+        self.exporter = ResultExporter(formats)
         self.total_nodes = 0
-        self.tested_nodes = 0
+        # 测试计数、类型/地区分布与延迟直方图按线程分片，记录时不争用锁
+        self.counters = ProbeCounters()
         self.start_time = None
         self.end_time = None
         self.progress_bar = None
         
-        self.stats = {
-            'by_type': {},
-            'by_country': {},
-            'avg_latency': 0,
-            'min_latency': float('inf'),
-            'max_latency': 0
-        }
+        # 两阶段各自的耗时（节点数在分片计数器中）
+        self.stages = {'screen_time': 0.0, 'deep_time': 0.0}
+        
     
     def read_subscribe_links(self, filename="subscribe.txt"):
         """读取订阅链接文件"""
@@ -355,47 +1498,37 @@ class NodeSpeedTester:
             print_info(f"读取文件时发生错误: {str(e)}", "error")
             return []
     
+    def decode_subscribe_content(self, content):
+        """解码订阅内容（base64或明文）"""
+        try:
+            decoded = base64.b64decode(content).decode('utf-8')
+            nodes = decoded.split('\n')
+        except:
+            nodes = content.split('\n')
+        
+        return [node.strip() for node in nodes if node.strip()]
+    
+    def nodes_from_fetch(self, link, result):
+        """从下载结果取节点：命中缓存直接复用，否则解码并写入缓存"""
+        if result['nodes'] is not None:
+            return result['nodes']
+        if not result['content']:
+            return []
+        
+        nodes = self.decode_subscribe_content(result['content'])
+        if nodes and self.cache is not None and result['status'] == 200:
+            nodes = list(self.cache.tee(link, result['etag'], result['last_modified'], nodes))
+        return nodes
+    
     def decode_subscribe_link(self, link, max_retries=3):
         """解码订阅链接"""
         nodes = []
         
         try:
             if link.startswith('http'):
-                if HAS_REQUESTS:
-                    for attempt in range(max_retries):
-                        try:
-                            response = requests.get(
-                                link, 
-                                timeout=self.config['http_test_timeout'],
-                                headers={'User-Agent': self.config['user_agent']}
-                            )
-                            response.raise_for_status()
-                            content = response.text
-                            
-                            try:
-                                decoded = base64.b64decode(content).decode('utf-8')
-                                nodes = decoded.split('\n')
-                            except:
-                                nodes = content.split('\n')
-                            
-                            if nodes:
-                                break
-                        except Exception as e:
-                            if attempt < max_retries - 1:
-                                time.sleep(2 ** attempt)
-                            else:
-                                print_info(f"获取订阅失败: {str(e)}", "warning")
-                else:
-                    # urllib fallback
-                    req = urllib.request.Request(link, headers={'User-Agent': self.config['user_agent']})
-                    with urllib.request.urlopen(req, timeout=self.config['http_test_timeout']) as response:
-                        content = response.read().decode('utf-8')
-                    
-                    try:
-                        decoded = base64.b64decode(content).decode('utf-8')
-                        nodes = decoded.split('\n')
-                    except:
-                        nodes = content.split('\n')
+                self.fetcher.max_retries = max_retries
+                result, elapsed = self.fetcher.timed_fetch(link)
+                nodes = self.nodes_from_fetch(link, result)
             else:
                 # base64 encoded
                 try:
@@ -409,17 +1542,25 @@ class NodeSpeedTester:
             
         return [node.strip() for node in nodes if node.strip()]
     
+    def iter_subscriptions(self, links):
+        """产出 (链接, 节点列表, 耗时秒)：HTTP订阅并发下载、按完成顺序产出"""
+        http_links = [link for link in links if link.startswith('http')]
+        
+        for link in links:
+            if not link.startswith('http'):
+                yield link, self.decode_subscribe_link(link), 0
+        
+        for link, result, elapsed in self.fetcher.fetch_all(http_links):
+            nodes = []
+            try:
+                nodes = self.nodes_from_fetch(link, result)
+            except Exception as e:
+                print_info(f"解码订阅链接时发生错误: {str(e)}", "error")
+            yield link, nodes, elapsed
+    
     def parse_node_info(self, node):
-        """解析节点信息"""
-        info = {
-            'type': '',
-            'name': '',
-            'server': '',
-            'port': 0,
-            'raw': node,
-            'country': '',
-            'network': ''
-        }
+        """解析节点信息（紧凑记录，主机名驻留）"""
+        info = NodeRecord(node, type='', name='', server='', port=0, country='', network='')
         
         try:
             if node.startswith('vmess://'):
@@ -429,7 +1570,7 @@ class NodeSpeedTester:
                 data = json.loads(decoded)
                 
                 info['name'] = data.get('ps', data.get('add', ''))
-                info['server'] = data.get('add', '')
+                info['server'] = sys.intern(data.get('add', ''))
                 info['port'] = int(data.get('port', 0))
                 
                 # 国家识别
@@ -463,7 +1604,7 @@ class NodeSpeedTester:
                         break
                 
                 parsed = urllib.parse.urlparse(node)
-                info['server'] = parsed.hostname or ''
+                info['server'] = sys.intern(parsed.hostname or '')
                 info['port'] = parsed.port or 443
                 info['name'] = urllib.parse.unquote(parsed.fragment or '')
                     
@@ -481,15 +1622,10 @@ class NodeSpeedTester:
         
         for _ in range(self.config['ping_count']):
             try:
-                start_time = time.time()
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(self.config['timeout'])
-                
-                result = sock.connect_ex((str(host), int(port)))
-                
-                if result == 0:
-                    latency = (time.time() - start_time) * 1000
-                    latencies.append(latency)
+                start_ns = time.perf_counter_ns()
+                sock = self.budget.connect(host, port, self.config['timeout'])
+                latency = (time.perf_counter_ns() - start_ns) / 1e6
+                latencies.append(latency)
                 sock.close()
                 
             except Exception:
@@ -498,80 +1634,260 @@ class NodeSpeedTester:
         return sum(latencies) / len(latencies) if latencies else None
     
     def test_tls_handshake(self, host, port):
-        """测试TLS握手"""
+        """测试TLS握手，返回握手耗时(ms，不含TCP建连)，失败返回None"""
         try:
-            context = ssl.create_default_context()
-            context.check_hostname = False
-            context.verify_mode = ssl.CERT_NONE
-            
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self.config['timeout'])
-            sock.connect((str(host), int(port)))
-            
-            secure_sock = context.wrap_socket(sock, server_hostname=self.config['tls_test_host'])
-            cipher = secure_sock.cipher()
-            secure_sock.close()
-            
-            return cipher is not None
+            with self.budget.connect(host, port, self.config['timeout']) as sock:
+                secure_sock, elapsed = self.tls.handshake(sock, self.config['tls_test_host'])
+                with secure_sock:
+                    self.tls.remember((host, port, self.config['tls_test_host'], ''), secure_sock)
+                    return elapsed if secure_sock.cipher() is not None else None
         except:
-            return False
+            return None
+    
+    def test_resumed_handshake(self, host, port):
+        """会话复用握手耗时(ms)，服务端不支持复用时返回None"""
+        return self.tls.measure_resumed(
+            lambda: self.budget.connect(host, port, self.config['timeout']),
+            (host, port, self.config['tls_test_host'], ''),
+            self.config['tls_test_host']
+        )
+    
+    def needs_tls_check(self, node_info):
+        """标准/深度模式下对TLS常用端口做握手验证"""
+        return (self.config['test_mode'] in ['standard', 'deep']
+                and node_info['port'] in [443, 2053, 2083, 2087, 2096, 8443])
+    
+    def finish_availability(self, node_info, tcp_ms, tls_ms):
+        """记录分段耗时并判定可用性，返回 (延迟, 是否可用)
+        
+        有TLS握手的节点按TCP+TLS握手排序（会话可用的时间），其余按TCP连接
+        """
+        node_info['tcp_ms'] = tcp_ms
+        node_info['tls_ms'] = tls_ms
+        if tcp_ms is None:
+            return None, False
+        
+        is_available = tls_ms is not None if self.needs_tls_check(node_info) else True
+        latency = tcp_ms + (tls_ms or 0)
+        
+        is_available = is_available and latency <= self.config['max_latency']
+        
+        return latency, is_available
     
     def test_node_availability(self, node_info):
         """测试节点可用性"""
         if not node_info['server'] or not node_info['port']:
             return None, False
         
-        latency = self.test_tcp_latency(node_info['server'], node_info['port'])
-        if latency is None:
+        # 使用预解析的IP，DNS耗时单独记录，不计入延迟
+        ip = self.resolver.resolve(node_info['server'])
+        node_info['dns_ms'] = self.resolver.elapsed(node_info['server'])
+        if not ip:
             return None, False
         
-        is_available = True
+        tcp_ms = self.test_tcp_latency(ip, node_info['port'])
+        tls_ms = None
+        if tcp_ms is not None and self.needs_tls_check(node_info):
+            tls_ms = self.test_tls_handshake(ip, node_info['port'])
+            if tls_ms is not None and self.tls.resumption:
+                node_info['tls_resumed_ms'] = self.test_resumed_handshake(ip, node_info['port'])
         
-        if self.config['test_mode'] in ['standard', 'deep']:
-            if node_info['port'] in [443, 2053, 2083, 2087, 2096, 8443]:
-                is_available = self.test_tls_handshake(node_info['server'], node_info['port'])
+        return self.finish_availability(node_info, tcp_ms, tls_ms)
+    
+    async def test_node_availability_async(self, node_info, engine):
+        """测试节点可用性（asyncio引擎）"""
+        if not node_info['server'] or not node_info['port']:
+            return None, False
         
-        is_available = is_available and latency <= self.config['max_latency']
+        ip = await asyncio.wrap_future(self.resolver.submit(node_info['server']))
+        node_info['dns_ms'] = self.resolver.elapsed(node_info['server'])
+        if not ip:
+            return None, False
         
-        return latency, is_available
+        latencies = []
+        for _ in range(self.config['ping_count']):
+            latency = await engine.tcp_latency(ip, node_info['port'])
+            if latency is not None:
+                latencies.append(latency)
+        
+        tcp_ms = sum(latencies) / len(latencies) if latencies else None
+        tls_ms = None
+        if tcp_ms is not None and self.needs_tls_check(node_info):
+            tls_ms = await engine.tls_handshake(ip, node_info['port'], self.config['tls_test_host'])
+            if tls_ms is not None and self.tls.resumption:
+                # asyncio握手不支持指定会话，复用握手在线程池中测量
+                node_info['tls_resumed_ms'] = await asyncio.get_running_loop().run_in_executor(
+                    None, self.test_resumed_handshake, ip, node_info['port'])
+        
+        return self.finish_availability(node_info, tcp_ms, tls_ms)
     
-    def process_single_node(self, node):
-        """处理单个节点"""
-        node_info = self.parse_node_info(node)
+    def measure_node(self, node):
+        """解析（或直接使用已解析的节点信息）并测试单个节点，返回 (节点信息, 延迟, 是否可用)"""
+        node_info = node if isinstance(node, NodeRecord) else self.parse_node_info(node)
         latency, is_available = self.test_node_availability(node_info)
+        return node_info, latency, is_available
+    
+    async def measure_node_async(self, node, engine):
+        """解析并测试单个节点（asyncio引擎）"""
+        node_info = node if isinstance(node, NodeRecord) else self.parse_node_info(node)
+        latency, is_available = await self.test_node_availability_async(node_info, engine)
+        return node_info, latency, is_available
+    
+    def failed_result(self, node):
+        """测试过程出错的节点按不可用回调，保证每个节点都被计数"""
+        node_info = node if isinstance(node, NodeRecord) else self.parse_node_info(node)
+        return node_info, None, False
+    
+    def process_single_node(self, node):
+        """处理单个节点（可在工作线程中调用）"""
+        return self.record_result(*self.measure_node(node))
+    
+    @property
+    def tested_nodes(self):
+        return self.counters.total('tested')
+    
+    def record_result(self, node_info, latency, is_available):
+        """更新进度与统计；计数写入当前线程的分片，任意线程调用都不会丢失计数"""
+        keys = ['tested']
+        
+        # 初筛统计（分片模式下由父进程汇总）
+        if 'screen_ms' in node_info:
+            keys.append('screened')
+            if node_info['screen_ms'] is not None:
+                keys.append('passed')
+        
+        # 类型/地区分布
+        if node_info['type']:
+            keys.append(('type', node_info['type']))
+        if node_info['country']:
+            keys.append(('country', node_info['country']))
+        
+        self.counters.add(*keys)
         
-        self.tested_nodes += 1
+        # 直方图只统计可用节点，超过max_latency或TLS失败的不计入分位数
+        if is_available and latency:
+            self.counters.record_latency(latency)
         
-        # 更新进度条
+        # 更新进度条（tqdm自带锁）
         if self.progress_bar:
             self.progress_bar.update(1)
         
-        # 更新统计
-        if node_info['type']:
-            self.stats['by_type'][node_info['type']] = self.stats['by_type'].get(node_info['type'], 0) + 1
+        node_info['latency'] = latency
+        return node_info, latency, is_available
+    
+    def measure_all(self, all_nodes, on_result):
+        """用配置的引擎并发测速，on_result在调度线程中回调"""
+        if self.config['engine'] == 'async':
+            engine = AsyncProbeEngine(self.config['timeout'], self.config['async_concurrency'], self.budget, self.tls)
+            engine.run(all_nodes, lambda node: self.measure_node_async(node, engine), on_result, self.failed_result)
+            return
         
-        if node_info['country']:
-            self.stats['by_country'][node_info['country']] = self.stats['by_country'].get(node_info['country'], 0) + 1
+        with ThreadPoolExecutor(max_workers=self.budget.cap(min(self.config['max_workers'], len(all_nodes)))) as executor:
+            future_to_node = {
+                executor.submit(self.measure_node, node): node 
+                for node in all_nodes
+            }
+            
+            for future in as_completed(future_to_node):
+                try:
+                    result = future.result(timeout=self.config['timeout'] * 2)
+                except Exception:
+                    result = self.failed_result(future_to_node[future])
+                on_result(result)
+    
+    def screen_nodes(self, all_nodes, on_result):
+        """第一阶段：TCP初筛，连不上的节点直接回调为不可用，返回通过初筛的节点信息"""
+        start_time = time.time()
+        infos = []
+        for index, node in enumerate(all_nodes):
+            info = self.parse_node_info(node)
+            if isinstance(all_nodes, NodeArena):
+                info.bind(all_nodes, index)
+            infos.append(info)
+        self.resolver.prefetch(info['server'] for info in infos if info['server'])
         
-        if latency:
-            if self.stats['avg_latency'] == 0:
-                self.stats['avg_latency'] = latency
+        endpoints = {}
+        for info in infos:
+            info['screen_ms'] = None
+            if info['server'] and info['port']:
+                ip = self.resolver.resolve(info['server'])
+                if ip:
+                    endpoints.setdefault((ip, info['port']), []).append(info)
+        
+        screen = TCPScreen(self.config['screen_timeout'], self.config['screen_concurrency'], self.budget)
+        for endpoint, tcp_ms in screen.run(endpoints).items():
+            for info in endpoints[endpoint]:
+                info['screen_ms'] = tcp_ms
+        
+        survivors = []
+        for info in infos:
+            if info['screen_ms'] is None:
+                info['dns_ms'] = self.resolver.elapsed(info['server']) if info['server'] else None
+                on_result((info, None, False))
             else:
-                self.stats['avg_latency'] = (self.stats['avg_latency'] * (self.tested_nodes - 1) + latency) / self.tested_nodes
-            
-            self.stats['min_latency'] = min(self.stats['min_latency'], latency)
-            self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+                survivors.append(info)
         
-        node_info['latency'] = latency
-        return node_info, latency, is_available
+        self.stages['screen_time'] = time.time() - start_time
+        return survivors
+    
+    def probe_nodes(self, all_nodes, on_result):
+        """测速入口：两阶段模式下先初筛，只对存活节点做TLS与多次采样的深度测试"""
+        if self.config['funnel']:
+            all_nodes = self.screen_nodes(all_nodes, on_result)
+        
+        start_time = time.time()
+        self.measure_all(all_nodes, on_result)
+        self.stages['deep_time'] = time.time() - start_time
+    
+    def test_all(self, all_nodes, on_result):
+        """并发测速全部节点，结果逐个回调（不保留全部结果，失败节点测完即释放）"""
+        if self.config['processes'] > 1 and ShardedProbeRunner.available():
+            # 分片进程各自解析所在分片的主机
+            runner = ShardedProbeRunner(self.config, min(self.config['processes'], len(all_nodes)))
+            for result in runner.run(all_nodes):
+                on_result(*self.record_result(*result))
+        else:
+            if not self.config['funnel']:
+                # 初筛阶段本身会解析节点并预解析主机，不必多走一遍
+                self.resolve_hosts(all_nodes)
+            self.probe_nodes(all_nodes, lambda result: on_result(*self.record_result(*result)))
+    
+    def collect_result(self, node_info, latency, is_available):
+        """按可用性归档测速结果"""
+        if is_available and latency is not None:
+            self.available_nodes.append(node_info)
+            self.exporter.write(node_info)
+        elif self.config['save_unavailable']:
+            self.unavailable_nodes.append(node_info)
+            self.exporter.write(node_info, available=False)
+    
+    def resolve_hosts(self, all_nodes):
+        """DNS阶段：测速前并行解析全部唯一主机名"""
+        hosts = {self.parse_node_info(node)['server'] for node in all_nodes}
+        hosts.discard('')
+        if not hosts:
+            return
+        
+        start_time = time.time()
+        self.resolver.prefetch(hosts)
+        dns = self.resolver.summary()
+        print_info(f"DNS解析: {len(hosts)} 个主机, 耗时 {time.time() - start_time:.1f}s, "
+                   f"平均 {dns['avg_ms']:.0f}ms, 失败 {dns['failures']}", "info")
+    
+    @staticmethod
+    def format_phases(node):
+        """分段耗时，如 " (DNS 3.1 / TCP 40.2 / TLS 85.0 ms)"；无数据时为空"""
+        parts = [f"{label} {node[phase]:.1f}"
+                 for phase, label in (('dns_ms', 'DNS'), ('tcp_ms', 'TCP'), ('tls_ms', 'TLS'),
+                                      ('tls_resumed_ms', 'TLS复用'))
+                 if node.get(phase) is not None]
+        return f" ({' / '.join(parts)} ms)" if parts else ""
     
     def save_results(self):
         """保存测试结果"""
         self.available_nodes.sort(key=lambda x: x.get('latency', float('inf')))
         
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # 保存TXT
+        # 保存TXT（其余格式已在测速过程中流式导出）
         if self.config['output_format'] in ['txt', 'all']:
             try:
                 with open('node.txt', 'w', encoding='utf-8') as f:
@@ -581,12 +1897,26 @@ class NodeSpeedTester:
                     f.write(f"# 最大延迟: {self.config['max_latency']}ms\n\n")
                     
                     for node in self.available_nodes:
+                        f.write(f"# {node.get('name', '')} - {node.get('latency', 0):.0f}ms{self.format_phases(node)}\n")
                         f.write(f"{node['raw']}\n")
                 
                 print_info("已保存可用节点到 node.txt", "success")
             except Exception as e:
                 print_info(f"保存TXT文件失败: {str(e)}", "error")
     
+    def format_stage(self, stage):
+        """两阶段统计行：节点数、并发与耗时（分片模式下子进程耗时不回传，不显示）"""
+        totals = self.counters.totals()
+        if stage == 'screen':
+            text = (f"{totals.get('passed', 0)}/{totals.get('screened', 0)} 存活, "
+                    f"并发 {self.budget.cap(self.config['screen_concurrency'])}")
+        else:
+            concurrency = (self.config['async_concurrency'] if self.config['engine'] == 'async'
+                           else self.config['max_workers'])
+            text = f"{totals.get('passed', 0)} 个节点, 并发 {self.budget.cap(concurrency)}"
+        elapsed = self.stages[f'{stage}_time']
+        return f"{text}, 耗时 {elapsed:.1f}s" if elapsed else text
+    
     def print_summary(self):
         """打印测试摘要"""
         duration = (self.end_time - self.start_time).total_seconds() if self.end_time and self.start_time else 0
@@ -601,13 +1931,26 @@ class NodeSpeedTester:
             table.add_row("可用节点", f"{len(self.available_nodes)} ({len(self.available_nodes)/self.total_nodes*100:.1f}%)")
             table.add_row("不可用节点", str(len(self.unavailable_nodes)))
             table.add_row("测试耗时", f"{duration:.1f}秒")
+            table.add_row("测速速度", f"{self.tested_nodes / max(duration, 0.001):.1f} 节点/秒 ({self.config['engine']})")
+            dns = self.resolver.summary()
+            if dns['lookups']:
+                table.add_row("DNS解析", f"{dns['lookups']} 个主机, 平均 {dns['avg_ms']:.0f}ms, 失败 {dns['failures']}")
+            if self.counters.total('screened'):
+                table.add_row("TCP初筛", self.format_stage('screen'))
+                table.add_row("深度测试", self.format_stage('deep'))
+            if self.budget.exhausted:
+                table.add_row("资源耗尽重试", f"{self.budget.exhausted} 次 (不计入节点失败)")
+            if self.tls.resumption:
+                tls = self.tls.summary()
+                table.add_row("会话复用", f"{tls['resumed']}/{tls['attempts']} 次握手成功复用")
             
-            if self.stats['avg_latency'] > 0:
-                table.add_row("平均延迟", f"{self.stats['avg_latency']:.0f}ms")
-                if self.stats['min_latency'] != float('inf'):
-                    table.add_row("最低延迟", f"{self.stats['min_latency']:.0f}ms")
-                if self.stats['max_latency'] > 0:
-                    table.add_row("最高延迟", f"{self.stats['max_latency']:.0f}ms")
+            histogram = self.counters.histogram()
+            if histogram.total:
+                latency = histogram.summary()
+                table.add_row("平均延迟", f"{latency['mean']:.0f}ms")
+                table.add_row("P50/P90/P99", f"{latency['p50']:.0f} / {latency['p90']:.0f} / {latency['p99']:.0f}ms")
+                table.add_row("最低延迟", f"{latency['min']:.0f}ms")
+                table.add_row("最高延迟", f"{latency['max']:.0f}ms")
             
             console.print(table)
             
@@ -618,12 +1961,13 @@ class NodeSpeedTester:
                 fast_table.add_column("节点名称", style="white", width=30)
                 fast_table.add_column("地区", style="green", width=5)
                 fast_table.add_column("延迟", style="yellow", width=10)
+                fast_table.add_column("分段耗时", style="dim")
                 
                 for i, node in enumerate(self.available_nodes[:10], 1):
                     name = node.get('name', '') or f"{node.get('server', '')}:{node.get('port', '')}"
                     country = node.get('country', 'N/A')
                     latency = f"{node.get('latency', 0):.0f}ms" if node.get('latency') else "N/A"
-                    fast_table.add_row(str(i), name[:30], country, latency)
+                    fast_table.add_row(str(i), name[:30], country, latency, self.format_phases(node).strip(' ()'))
                 
                 console.print(fast_table)
         else:
@@ -635,13 +1979,26 @@ class NodeSpeedTester:
             print(f"可用节点: {len(self.available_nodes)} ({len(self.available_nodes)/self.total_nodes*100:.1f}%)")
             print(f"不可用节点: {len(self.unavailable_nodes)}")
             print(f"测试耗时: {duration:.1f}秒")
+            print(f"测速速度: {self.tested_nodes / max(duration, 0.001):.1f} 节点/秒 ({self.config['engine']})")
+            dns = self.resolver.summary()
+            if dns['lookups']:
+                print(f"DNS解析: {dns['lookups']} 个主机, 平均 {dns['avg_ms']:.0f}ms, 失败 {dns['failures']}")
+            if self.counters.total('screened'):
+                print(f"TCP初筛: {self.format_stage('screen')}")
+                print(f"深度测试: {self.format_stage('deep')}")
+            if self.budget.exhausted:
+                print(f"资源耗尽重试: {self.budget.exhausted} 次 (不计入节点失败)")
+            if self.tls.resumption:
+                tls = self.tls.summary()
+                print(f"会话复用: {tls['resumed']}/{tls['attempts']} 次握手成功复用")
             
-            if self.stats['avg_latency'] > 0:
-                print(f"平均延迟: {self.stats['avg_latency']:.0f}ms")
-                if self.stats['min_latency'] != float('inf'):
-                    print(f"最低延迟: {self.stats['min_latency']:.0f}ms")
-                if self.stats['max_latency'] > 0:
-                    print(f"最高延迟: {self.stats['max_latency']:.0f}ms")
+            histogram = self.counters.histogram()
+            if histogram.total:
+                latency = histogram.summary()
+                print(f"平均延迟: {latency['mean']:.0f}ms")
+                print(f"P50/P90/P99: {latency['p50']:.0f} / {latency['p90']:.0f} / {latency['p99']:.0f}ms")
+                print(f"最低延迟: {latency['min']:.0f}ms")
+                print(f"最高延迟: {latency['max']:.0f}ms")
             
             if self.available_nodes:
                 print("\n🏆 最快的10个节点:")
@@ -649,7 +2006,7 @@ class NodeSpeedTester:
                     name = node.get('name', '') or f"{node.get('server', '')}:{node.get('port', '')}"
                     country = f" [{node['country']}]" if node.get('country') else ""
                     latency = f"{node.get('latency', 0):.0f}ms" if node.get('latency') else "N/A"
-                    print(f"{i:2d}. {name[:30]:<30}{country} - {latency}")
+                    print(f"{i:2d}. {name[:30]:<30}{country} - {latency}{self.format_phases(node)}")
     
     def run(self):
         """主运行函数"""
@@ -658,6 +2015,9 @@ class NodeSpeedTester:
         print_banner()
         print_info(f"Python版本: {sys.version.split()[0]}", "info")
         print_info(f"测试模式: {self.config['test_mode']}", "info")
+        print_info(f"探测引擎: {self.config['engine']} × {self.config['processes']} 进程", "info")
+        if self.budget.fd_limit:
+            print_info(f"文件描述符: {self.budget.fd_before} → {self.budget.fd_limit}, 套接字预算 {self.budget.capacity}", "info")
         
         if not dependencies_ok:
             print_info("运行在基础模式（部分功能可能受限）", "warning")
@@ -673,14 +2033,18 @@ class NodeSpeedTester:
         
         print_info(f"找到 {len(subscribe_links)} 个订阅链接", "success")
         
-        # 解析所有节点
-        all_nodes = []
-        for i, link in enumerate(subscribe_links, 1):
-            print_info(f"正在解析订阅 {i}/{len(subscribe_links)}...", "loading")
-            nodes = self.decode_subscribe_link(link)
+        # 并发下载并解析所有订阅
+        print_info("正在下载订阅...", "loading")
+        all_nodes = NodeArena()  # 原始链接紧凑存放
+        for i, (link, nodes, elapsed) in enumerate(self.iter_subscriptions(subscribe_links), 1):
             if nodes:
                 all_nodes.extend(nodes)
-                print_info(f"  获取到 {len(nodes)} 个节点", "success")
+                print_info(f"  [{i}/{len(subscribe_links)}] 获取到 {len(nodes)} 个节点 ({elapsed:.2f}s)", "success")
+        
+        fetch = self.fetcher.summary()
+        if fetch['count']:
+            print_info(f"订阅下载完成: {fetch['ok']}/{fetch['count']} 成功 (缓存 {fetch['cached']}), "
+                       f"耗时 {fetch['wall']:.1f}s (逐个下载需 {fetch['total']:.1f}s)", "info")
         
         self.total_nodes = len(all_nodes)
         if self.total_nodes == 0:
@@ -693,42 +2057,107 @@ class NodeSpeedTester:
         # 创建进度条
         self.progress_bar = create_progress_bar(self.total_nodes, "测速进度")
         
-        # 并发测速
-        results = []
-        
-        with ThreadPoolExecutor(max_workers=min(self.config['max_workers'], self.total_nodes)) as executor:
-            future_to_node = {
-                executor.submit(self.process_single_node, node): node 
-                for node in all_nodes
-            }
-            
-            for future in as_completed(future_to_node):
-                try:
-                    result = future.result(timeout=self.config['timeout'] * 2)
-                    results.append(result)
-                except Exception:
-                    pass
+        # 并发测速（json/csv/订阅格式边测边写）
+        try:
+            self.exporter.open()
+        except OSError as e:
+            print_info(f"创建导出文件失败: {str(e)}", "error")
+        self.test_all(all_nodes, self.collect_result)
+        exported = self.exporter.close()
         
         if self.progress_bar:
             self.progress_bar.close()
         
-        # 处理结果
-        for node_info, latency, is_available in results:
-            if is_available and latency is not None:
-                self.available_nodes.append(node_info)
-            else:
-                if self.config['save_unavailable']:
-                    self.unavailable_nodes.append(node_info)
+        for path in exported:
+            print_info(f"已导出测速结果到 {path}", "success")
         
         self.end_time = datetime.now()
         
         # 保存结果
         if self.available_nodes:
             self.save_results()
+        if self.config['histogram_json']:
+            try:
+                self.counters.histogram().export(self.config['histogram_json'])
+                print_info(f"已导出延迟直方图到 {self.config['histogram_json']}", "success")
+            except OSError as e:
+                print_info(f"导出延迟直方图失败: {str(e)}", "error")
         
         # 打印摘要
         self.print_summary()
 
+# ═══════════════════════════════════════════════════════════════
+# 多进程分片测速
+# ═══════════════════════════════════════════════════════════════
+
+def shard_worker(config, shard, result_queue, flush_size=100):
+    """分片工作进程：结果分批回传父进程"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    tester = NodeSpeedTester(config)
+    buffer = []
+    
+    def on_result(result):
+        buffer.append(result)
+        if len(buffer) >= flush_size:
+            result_queue.put(buffer[:])
+            buffer.clear()
+    
+    try:
+        tester.probe_nodes(shard, on_result)
+    finally:
+        if buffer:
+            result_queue.put(buffer)
+        result_queue.put(None)
+
+
+class ShardedProbeRunner:
+    """多进程分片调度器"""
+    
+    def __init__(self, config, processes):
+        self.processes = max(int(processes), 1)
+        self.worker_config = dict(config, processes=1)
+    
+    @staticmethod
+    def available():
+        """分片依赖fork启动方式（通过管道运行的脚本无法spawn）"""
+        return 'fork' in multiprocessing.get_all_start_methods()
+    
+    def run(self, nodes):
+        """启动分片进程，逐个产出 (节点信息, 延迟, 是否可用)"""
+        ctx = multiprocessing.get_context('fork')
+        result_queue = ctx.Queue(maxsize=self.processes * 64)
+        workers = [
+            ctx.Process(target=shard_worker,
+                        args=(self.worker_config, nodes[i::self.processes], result_queue),
+                        daemon=True)
+            for i in range(self.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        
+        finished = 0
+        try:
+            while finished < len(workers):
+                try:
+                    batch = result_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers):
+                        break
+                    continue
+                
+                if batch is None:
+                    finished += 1
+                    continue
+                
+                for item in batch:
+                    yield item
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            for worker in workers:
+                worker.join(timeout=1)
+
 # ═══════════════════════════════════════════════════════════════
 # 主函数
 # ═══════════════════════════════════════════════════════════════
@@ -739,10 +2168,26 @@ def main():
     parser.add_argument('-w', '--workers', type=int, default=50, help='并发线程数')
     parser.add_argument('-m', '--mode', choices=['fast', 'standard', 'deep'], default='standard', 
                        help='测试模式')
-    parser.add_argument('-f', '--format', choices=['txt', 'json', 'csv', 'all'], default='txt',
-                       help='输出格式')
+    parser.add_argument('-f', '--format', choices=['txt', 'json', 'csv', 'sub', 'all'], default='txt',
+                       help='输出格式: txt / json(JSON Lines) / csv / sub(base64订阅) / all，后三种边测边写')
     parser.add_argument('-l', '--max-latency', type=int, default=1000, help='最大延迟（毫秒）')
     parser.add_argument('--skip-deps', action='store_true', help='跳过依赖检查')
+    parser.add_argument('-e', '--engine', choices=['thread', 'async'], default='thread',
+                       help='探测引擎: thread(线程池) / async(asyncio)')
+    parser.add_argument('--concurrency', type=int, default=1000, help='async引擎并发连接数')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='分片进程数(0=CPU核心数)')
+    parser.add_argument('--cache-ttl', type=int, default=0, help='订阅缓存有效期(秒)，期内不重新请求')
+    parser.add_argument('--offline', action='store_true', help='离线模式：只使用订阅缓存')
+    parser.add_argument('--no-cache', action='store_true', help='禁用订阅缓存')
+    parser.add_argument('--max-sockets', type=int, default=0, help='在途套接字上限(0=按文件描述符上限)')
+    parser.add_argument('--source-address', action='append', default=[], help='本地源地址，可多次指定以轮换')
+    parser.add_argument('--no-rst', action='store_true', help='正常关闭探测连接(默认RST关闭，不留TIME_WAIT)')
+    parser.add_argument('--tls-min', choices=['TLSv1.2', 'TLSv1.3'], default='TLSv1.2', help='探测握手的最低TLS版本')
+    parser.add_argument('--tls-resume', action='store_true', help='额外测量会话复用握手延迟(客户端实际体验)')
+    parser.add_argument('--histogram-json', default='', metavar='文件', help='导出整轮延迟直方图(含p50/p90/p99)为JSON')
+    parser.add_argument('--no-funnel', action='store_true', help='关闭TCP初筛，全部节点直接深度测试')
+    parser.add_argument('--screen-timeout', type=float, default=1.5, help='TCP初筛连接超时（秒）')
+    parser.add_argument('--screen-concurrency', type=int, default=500, help='TCP初筛在途连接数')
     
     args = parser.parse_args()
     
@@ -751,7 +2196,22 @@ def main():
         'max_workers': args.workers,
         'test_mode': args.mode,
         'output_format': args.format,
-        'max_latency': args.max_latency
+        'max_latency': args.max_latency,
+        'engine': args.engine,
+        'async_concurrency': args.concurrency,
+        'processes': args.processes or multiprocessing.cpu_count(),
+        'cache_ttl': args.cache_ttl,
+        'offline': args.offline,
+        'use_cache': not args.no_cache,
+        'max_sockets': args.max_sockets,
+        'source_addresses': args.source_address,
+        'rst_close': not args.no_rst,
+        'tls_min_version': args.tls_min,
+        'tls_resumption': args.tls_resume,
+        'funnel': not args.no_funnel,
+        'screen_timeout': args.screen_timeout,
+        'screen_concurrency': args.screen_concurrency,
+        'histogram_json': args.histogram_json
     }
     
     tester = NodeSpeedTester(config)
@@ -11,24 +11,41 @@ import os
 import time
 import json
 import base64
+import codecs
+import csv
 import socket
 import ssl
 import argparse
+import asyncio
+import errno
 from datetime import datetime, timedelta
 import subprocess
-import gc
 import signal
 import threading
 import queue
 import urllib.parse
 import urllib.request
+import urllib.error
+import hashlib
+import tempfile
+import sqlite3
 from typing import List, Dict, Optional, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed, TimeoutError as FutureTimeoutError
 import multiprocessing
+import ipaddress
 import random
+import itertools
+import heapq
 from collections import deque
 import statistics
 import re
+import struct
+import shutil
+
+try:
+    import resource  # 仅Unix
+except ImportError:
+    resource = None
 
 # ═══════════════════════════════════════════════════════════════
 # 终端颜色和样式定义
@@ -277,6 +294,202 @@ class UIComponents:
             result += char
         return result
 
+    ANSI_ESCAPE = re.compile(r'\033\[[0-9;?]*[A-Za-z]')
+
+    @staticmethod
+    def clip_ansi(text, max_width):
+        """按显示宽度截断含颜色转义的行：转义序列不占宽度、原样保留，截断后补一个RESET"""
+        if UIComponents.get_display_width(UIComponents.ANSI_ESCAPE.sub('', text)) <= max_width:
+            return text
+
+        width = 0
+        pos = 0
+        result = []
+        while pos < len(text):
+            escape = UIComponents.ANSI_ESCAPE.match(text, pos)
+            if escape:
+                result.append(escape.group())
+                pos = escape.end()
+                continue
+            char = text[pos]
+            char_width = 2 if '\u4e00' <= char <= '\u9fff' else 1
+            if width + char_width > max_width:
+                break
+            width += char_width
+            result.append(char)
+            pos += 1
+        return ''.join(result) + Colors.RESET
+
+# ═══════════════════════════════════════════════════════════════
+# 延迟直方图
+# ═══════════════════════════════════════════════════════════════
+
+class LatencyHistogram:
+    """对数分桶延迟直方图 - 固定内存，O(1)记录，给出整轮的精确计数、均值与分位数（相对误差不超过precision）"""
+    
+    def __init__(self, lowest=0.01, highest=60000, precision=0.01):
+        self.lowest = lowest
+        self.precision = precision
+        self.log_base = math.log1p(precision)
+        self.counts = [0] * (self.index(highest) + 1)  # 1%精度下约1600个桶
+        self.total = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+        self.lock = threading.Lock()
+    
+    def index(self, value):
+        """值所在的桶：第i个桶覆盖 [lowest·(1+p)^i, lowest·(1+p)^(i+1))"""
+        if value <= self.lowest:
+            return 0
+        return int(math.log(value / self.lowest) / self.log_base)
+    
+    def bucket_value(self, index):
+        """桶的代表值（几何中点）"""
+        return self.lowest * (1 + self.precision) ** (index + 0.5)
+    
+    def record(self, value):
+        """记录一个延迟(ms)，超出上限的计入最后一个桶"""
+        index = min(self.index(value), len(self.counts) - 1)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += 1
+            self.sum += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+    
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+    
+    def percentiles(self, points=(50, 90, 99)):
+        """一次扫描求多个分位数，返回 {p: ms}；结果夹在实际最小/最大值之间"""
+        with self.lock:
+            if not self.total:
+                return {}
+            ranks = sorted((max(math.ceil(p / 100 * self.total), 1), p) for p in points)
+            result = {}
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                while ranks and seen >= ranks[0][0]:
+                    result[ranks.pop(0)[1]] = min(max(self.bucket_value(index), self.min), self.max)
+                if not ranks:
+                    break
+            return result
+    
+    def count_between(self, low, high):
+        """[low, high) 区间内的记录数（按桶代表值归属，误差在边界桶内）"""
+        def first_above(value):
+            # 代表值不小于value的第一个桶
+            if value <= self.lowest:
+                return 0
+            return max(int(math.log(value / self.lowest) / self.log_base + 0.5), 0)
+        
+        with self.lock:
+            return sum(self.counts[first_above(low):first_above(high)])
+    
+    def summary(self):
+        """计数、均值、最小/最大与p50/p90/p99"""
+        pct = self.percentiles()
+        return {
+            'count': self.total,
+            'mean': round(self.mean(), 2),
+            'min': round(self.min, 2) if self.total else None,
+            'max': round(self.max, 2) if self.total else None,
+            'p50': round(pct[50], 2) if pct else None,
+            'p90': round(pct[90], 2) if pct else None,
+            'p99': round(pct[99], 2) if pct else None,
+        }
+    
+    def to_dict(self):
+        """导出为JSON可序列化的字典，只保留非空桶 [下界ms, 上界ms, 计数]"""
+        with self.lock:
+            buckets = [[round(self.lowest * (1 + self.precision) ** i, 3),
+                        round(self.lowest * (1 + self.precision) ** (i + 1), 3), count]
+                       for i, count in enumerate(self.counts) if count]
+        return dict(self.summary(), unit='ms', precision=self.precision, buckets=buckets)
+    
+    def merge(self, other):
+        """并入另一个同参数的直方图"""
+        with other.lock:
+            counts = list(other.counts)
+            total, total_sum, low, high = other.total, other.sum, other.min, other.max
+        with self.lock:
+            self.counts = [mine + theirs for mine, theirs in zip(self.counts, counts)]
+            self.total += total
+            self.sum += total_sum
+            self.min = min(self.min, low)
+            self.max = max(self.max, high)
+    
+    def export(self, path):
+        """写出JSON文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+# ═══════════════════════════════════════════════════════════════
+# 分片计数
+# ═══════════════════════════════════════════════════════════════
+
+class ProbeCounters:
+    """分片计数器 - 每个线程只写自己的分片（计数、延迟直方图、最近节点环形缓冲），探测热路径不争用共享锁；
+    UI线程与结束统计时汇总各分片，总数精确"""
+    
+    def __init__(self, recent=100):
+        self.local = threading.local()
+        self.shards = []
+        self.recent_size = recent
+        self.sequence = itertools.count()  # 跨分片的完成顺序
+        self.lock = threading.Lock()  # 仅在线程首次登记分片时使用
+    
+    def shard(self):
+        """当前线程的分片，首次调用时创建并登记"""
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = {'counts': {}, 'histogram': LatencyHistogram(), 'recent': deque(maxlen=self.recent_size)}
+            with self.lock:
+                self.shards.append(shard)
+            self.local.shard = shard
+        return shard
+    
+    def add(self, *keys):
+        """各计数键加一"""
+        counts = self.shard()['counts']
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+    
+    def record_latency(self, latency, info=None):
+        """记录延迟，传入节点信息时同时放入最近节点缓冲"""
+        shard = self.shard()
+        shard['histogram'].record(latency)
+        if info is not None:
+            shard['recent'].append((next(self.sequence), info))
+    
+    def totals(self):
+        """汇总各分片计数（dict复制在C层完成，不会读到写了一半的分片）"""
+        total = {}
+        for shard in list(self.shards):
+            for key, value in dict(shard['counts']).items():
+                total[key] = total.get(key, 0) + value
+        return total
+    
+    def total(self, key):
+        return sum(shard['counts'].get(key, 0) for shard in list(self.shards))
+    
+    def histogram(self):
+        """合并各分片的延迟直方图"""
+        merged = LatencyHistogram()
+        for shard in list(self.shards):
+            merged.merge(shard['histogram'])
+        return merged
+    
+    def recent(self, count=None):
+        """各分片最近节点按完成顺序合并，返回最后count个"""
+        items = []
+        for shard in list(self.shards):
+            items.extend(list(shard['recent']))
+        items.sort(key=lambda item: item[0])
+        return [info for _, info in items[-count if count else 0:]]
+
 # ═══════════════════════════════════════════════════════════════
 # 可视化仪表盘
 # ═══════════════════════════════════════════════════════════════
@@ -284,7 +497,7 @@ class UIComponents:
 class Dashboard:
     """实时仪表盘"""
     
-    def __init__(self):
+    def __init__(self, histogram=None, render_budget=0.05, update_interval=0.5):
         self.start_time = datetime.now()
         self.last_update = time.time()
         self.spinner_index = 0
@@ -294,17 +507,33 @@ class Dashboard:
             'tested': 0,
             'success': 0,
             'failed': 0,
+            'slow': 0,
+            'unreachable': 0,
             'speed': 0,
             'eta': 'N/A',
             'memory': 0,
             'threads': 0,
-            'avg_latency': 0,
-            'min_latency': float('inf'),
-            'max_latency': 0,
+            'latency': None,  # 整轮延迟摘要（直方图）
+            'sources_done': 0,
+            'sources_total': 0,
+            'dns': None,
+            'target': None,   # (达标数, 目标数, 达标延迟)
+            'leaders': None,  # 目标模式排行榜前几名
         }
         self.recent_nodes = deque(maxlen=5)
         self.speed_history = deque(maxlen=20)
-        self.latency_history = deque(maxlen=100)
+        self.histogram = histogram or LatencyHistogram()  # 整轮成功延迟，由测速器记录
+        
+        # 差量渲染：整帧先写入缓冲，与上一帧逐行比较，只重写变化的行
+        self.frame = []
+        self.previous_frame = None  # None时下一帧整屏重绘
+        self.terminal_size = None
+        self.render_budget = render_budget  # 渲染最多占用的CPU比例，超出时自动降低帧率
+        self.update_interval = update_interval  # UI线程的刷新间隔(秒)，帧率不会高于其倒数
+        self.render_ms = 0.0  # 每帧渲染的CPU耗时(平滑)
+        self.next_frame = 0.0
+        self.last_full_redraw = 0.0
+        self.phase_history = {phase: deque(maxlen=100) for phase in ('dns_ms', 'tcp_ms', 'tls_ms', 'tls_resumed_ms', 'udp_ms')}
         
     def update_stats(self, **kwargs):
         """更新统计数据"""
@@ -317,32 +546,38 @@ class Dashboard:
                 self.stats['speed'] = self.stats['tested'] / elapsed
                 self.speed_history.append(self.stats['speed'])
         
-        # 计算ETA
-        if self.stats['speed'] > 0 and self.stats['total'] > self.stats['tested']:
+        # 计算ETA（订阅仍在解析时总数未定）
+        if self.stats['sources_done'] < self.stats['sources_total']:
+            self.stats['eta'] = '解析中'
+        elif self.stats['speed'] > 0 and self.stats['total'] > self.stats['tested']:
             remaining = self.stats['total'] - self.stats['tested']
             eta_seconds = remaining / self.stats['speed']
             self.stats['eta'] = str(timedelta(seconds=int(eta_seconds)))
         
-        # 计算平均延迟
-        if self.latency_history:
-            self.stats['avg_latency'] = statistics.mean(self.latency_history)
+        # 延迟摘要：扫描固定数量的桶，开销与已测节点数无关
+        if self.histogram.total:
+            self.stats['latency'] = self.histogram.summary()
     
-    def add_recent_node(self, node_info):
-        """添加最近测试的节点"""
-        self.recent_nodes.append(node_info)
-        if 'latency' in node_info:
-            self.latency_history.append(node_info['latency'])
-            self.stats['min_latency'] = min(self.stats['min_latency'], node_info['latency'])
-            self.stats['max_latency'] = max(self.stats['max_latency'], node_info['latency'])
+    def set_recent_nodes(self, nodes):
+        """最近成功的节点（UI线程从各分片汇总，按完成顺序）"""
+        self.recent_nodes.extend(nodes[-self.recent_nodes.maxlen:])
+        for phase, history in self.phase_history.items():
+            history.extend(node[phase] for node in nodes if node.get(phase) is not None)
+    
+    def _emit(self, text=''):
+        """向当前帧追加一行或多行"""
+        self.frame.extend(str(text).split('\n'))
     
     def render(self):
-        """渲染仪表盘"""
+        """渲染仪表盘：按渲染耗时自动限帧，每帧只写一次终端"""
+        now = time.perf_counter()
+        if now < self.next_frame:
+            return
+        cpu_start = time.thread_time()
+        
         self.animation_frame += 1
         self.spinner_index += 1
-        
-        # 清屏并隐藏光标
-        UIComponents.clear_screen()
-        UIComponents.hide_cursor()
+        self.frame = []
         
         # 渲染标题
         self._render_header()
@@ -364,6 +599,42 @@ class Dashboard:
         
         # 渲染底部信息
         self._render_footer()
+        
+        self._flush_frame(now)
+        
+        # 渲染的CPU耗时占比不超过render_budget：耗时越长，下一帧越晚（按CPU时间计，不受其他线程抢占影响）
+        cost = time.thread_time() - cpu_start
+        self.render_ms = cost * 1000 if not self.render_ms else self.render_ms * 0.8 + cost * 200
+        self.next_frame = now + cost / self.render_budget
+    
+    def _flush_frame(self, now):
+        """与上一帧逐行比较，只用光标定位重写变化的行，整帧一次写出"""
+        size = shutil.get_terminal_size()
+        # 终端尺寸变化或定期(防止其他输出打乱画面)整屏重绘
+        if size != self.terminal_size or now - self.last_full_redraw > 10:
+            self.terminal_size = size
+            self.previous_frame = None
+        
+        # 超出终端的行会滚屏、过宽的行会折行，都会让按行号定位的差量重写错位：先裁剪到终端尺寸
+        self.frame = [UIComponents.clip_ansi(line, size.columns) for line in self.frame[:size.lines]]
+        
+        previous = self.previous_frame
+        if previous is None:
+            self.last_full_redraw = now
+            out = ['\033[?25l\033[H\033[2J']
+            out.extend(f'\033[{row};1H{line}' for row, line in enumerate(self.frame, 1))
+        else:
+            out = ['\033[?25l']
+            for row, line in enumerate(self.frame, 1):
+                if row > len(previous) or previous[row - 1] != line:
+                    out.append(f'\033[{row};1H{line}\033[K')
+            if len(self.frame) < len(previous):
+                # 新帧更短：清除多余的旧行
+                out.append(f'\033[{len(self.frame) + 1};1H\033[J')
+        
+        sys.stdout.write(''.join(out))
+        sys.stdout.flush()
+        self.previous_frame = self.frame
     
     def _render_header(self):
         """渲染标题 - 简洁样式"""
@@ -373,26 +644,26 @@ class Dashboard:
         gradient_title = Colors.gradient_text(title, (64, 150, 250), (149, 117, 205))
         
         width = 72
-        print("\n")
+        self._emit("\n")
         
         # 使用更简洁的边框
-        print("  " + Colors.PRIMARY + "━" * width + Colors.RESET)
+        self._emit("  " + Colors.PRIMARY + "━" * width + Colors.RESET)
         
         clean_title = re.sub(r'\033\[[0-9;]*m', '', title)
         padding_total = width - len(clean_title)
         pad_left = padding_total // 2
         pad_right = padding_total - pad_left
         
-        print(f"  {' ' * pad_left}{gradient_title}{' ' * pad_right}")
+        self._emit(f"  {' ' * pad_left}{gradient_title}{' ' * pad_right}")
         
-        print("  " + Colors.PRIMARY + "━" * width + Colors.RESET)
-        print()
+        self._emit("  " + Colors.PRIMARY + "━" * width + Colors.RESET)
+        self._emit()
     
     def _render_main_stats(self):
         """渲染主要统计"""
         # 第一行：基础统计
-        print(f"  {UIComponents.status_icon('rocket')} {Colors.BOLD}测试进度{Colors.RESET}")
-        print()
+        self._emit(f"  {UIComponents.status_icon('rocket')} {Colors.BOLD}测试进度{Colors.RESET}")
+        self._emit()
         
         # 使用不同颜色显示数字
         tested_color = Colors.BRIGHT_CYAN if self.stats['tested'] < self.stats['total'] else Colors.BRIGHT_GREEN
@@ -402,35 +673,67 @@ class Dashboard:
             f"  {Colors.BRIGHT_WHITE}总节点:{Colors.RESET} {Colors.BRIGHT_YELLOW}{self.stats['total']:,}{Colors.RESET}  "
             f"{Colors.BRIGHT_WHITE}已测试:{Colors.RESET} {tested_color}{self.stats['tested']:,}{Colors.RESET}  "
             f"{Colors.BRIGHT_WHITE}成功:{Colors.RESET} {success_color}{self.stats['success']:,}{Colors.RESET}  "
-            f"{Colors.BRIGHT_WHITE}失败:{Colors.RESET} {Colors.BRIGHT_RED}{self.stats['failed']:,}{Colors.RESET}"
+            f"{Colors.BRIGHT_WHITE}失败:{Colors.RESET} {Colors.BRIGHT_RED}{self.stats['failed']:,}{Colors.RESET} "
+            f"{Colors.DIM}(过慢 {self.stats['slow']:,} / 不可达 {self.stats['unreachable']:,}){Colors.RESET}"
         )
-        print(stats_line1)
+        self._emit(stats_line1)
         
         # 第二行：性能统计
         speed_color = Colors.BRIGHT_GREEN if self.stats['speed'] > 10 else Colors.BRIGHT_YELLOW if self.stats['speed'] > 5 else Colors.BRIGHT_RED
         
         stats_line2 = (
             f"  {Colors.BRIGHT_WHITE}速度:{Colors.RESET} {speed_color}{self.stats['speed']:.1f}/s{Colors.RESET}  "
-            f"{Colors.BRIGHT_WHITE}线程:{Colors.RESET} {Colors.BRIGHT_MAGENTA}{self.stats['threads']}{Colors.RESET}  "
+            f"{Colors.BRIGHT_WHITE}并发:{Colors.RESET} {Colors.BRIGHT_MAGENTA}{self.stats['threads']}{Colors.RESET}  "
             f"{Colors.BRIGHT_WHITE}剩余时间:{Colors.RESET} {Colors.BRIGHT_CYAN}{self.stats['eta']}{Colors.RESET}  "
             f"{UIComponents.spinner(self.spinner_index)}"
         )
-        print(stats_line2)
-        
-        # 第三行：延迟统计
-        if self.stats['avg_latency'] > 0:
-            avg_color = Colors.BRIGHT_GREEN if self.stats['avg_latency'] < 100 else Colors.BRIGHT_YELLOW if self.stats['avg_latency'] < 300 else Colors.BRIGHT_RED
+        self._emit(stats_line2)
+        
+        # 目标模式进度
+        if self.stats['target']:
+            qualified, size, target_latency = self.stats['target']
+            self._emit(f"  {Colors.BRIGHT_WHITE}目标:{Colors.RESET} {Colors.BRIGHT_GREEN}{min(qualified, size):,}/{size:,}{Colors.RESET} "
+                       f"个 ≤{target_latency:.0f}ms 节点")
+        
+        # 订阅解析进度
+        if self.stats['sources_done'] < self.stats['sources_total']:
+            self._emit(f"  {Colors.BRIGHT_WHITE}订阅解析:{Colors.RESET} "
+                       f"{Colors.BRIGHT_CYAN}{self.stats['sources_done']}/{self.stats['sources_total']}{Colors.RESET}")
+        
+        # 第三行：延迟统计（整轮）
+        latency = self.stats['latency']
+        if latency:
+            avg_color = Colors.BRIGHT_GREEN if latency['mean'] < 100 else Colors.BRIGHT_YELLOW if latency['mean'] < 300 else Colors.BRIGHT_RED
             stats_line3 = (
-                f"  {Colors.BRIGHT_WHITE}平均延迟:{Colors.RESET} {avg_color}{self.stats['avg_latency']:.0f}ms{Colors.RESET}  "
-                f"{Colors.BRIGHT_WHITE}最低:{Colors.RESET} {Colors.BRIGHT_GREEN}{self.stats['min_latency']:.0f}ms{Colors.RESET}  "
-                f"{Colors.BRIGHT_WHITE}最高:{Colors.RESET} {Colors.BRIGHT_RED}{self.stats['max_latency']:.0f}ms{Colors.RESET}"
+                f"  {Colors.BRIGHT_WHITE}平均延迟:{Colors.RESET} {avg_color}{latency['mean']:.0f}ms{Colors.RESET}  "
+                f"{Colors.BRIGHT_WHITE}P50/P90/P99:{Colors.RESET} {Colors.BRIGHT_CYAN}{latency['p50']:.0f}/{latency['p90']:.0f}/{latency['p99']:.0f}ms{Colors.RESET}  "
+                f"{Colors.BRIGHT_WHITE}最低:{Colors.RESET} {Colors.BRIGHT_GREEN}{latency['min']:.0f}ms{Colors.RESET}  "
+                f"{Colors.BRIGHT_WHITE}最高:{Colors.RESET} {Colors.BRIGHT_RED}{latency['max']:.0f}ms{Colors.RESET}"
             )
-            print(stats_line3)
-        print()
+            self._emit(stats_line3)
+        
+        # 分段耗时：慢在解析、建连还是握手
+        if self.phase_history['tcp_ms'] or self.phase_history['udp_ms']:
+            phases = [(label, statistics.mean(self.phase_history[phase]))
+                      for phase, label in (('dns_ms', 'DNS'), ('tcp_ms', 'TCP'), ('tls_ms', 'TLS'),
+                                           ('tls_resumed_ms', 'TLS复用'), ('udp_ms', 'UDP'))
+                      if self.phase_history[phase]]
+            self._emit(f"  {Colors.BRIGHT_WHITE}分段耗时:{Colors.RESET} " + "  ".join(
+                f"{Colors.BRIGHT_WHITE}{label}{Colors.RESET} {Colors.BRIGHT_CYAN}{value:.1f}ms{Colors.RESET}"
+                for label, value in phases))
+        
+        # 第四行：DNS统计（不计入延迟）
+        dns = self.stats['dns']
+        if dns and dns['lookups']:
+            self._emit(f"  {Colors.BRIGHT_WHITE}DNS解析:{Colors.RESET} {Colors.BRIGHT_CYAN}{dns['lookups']:,}{Colors.RESET} 个主机  "
+                       f"{Colors.BRIGHT_WHITE}平均:{Colors.RESET} {Colors.BRIGHT_CYAN}{dns['avg_ms']:.0f}ms{Colors.RESET}  "
+                       f"{Colors.BRIGHT_WHITE}缓存命中:{Colors.RESET} {Colors.BRIGHT_GREEN}{dns['hits']:,}{Colors.RESET}  "
+                       f"{Colors.BRIGHT_WHITE}失败:{Colors.RESET} {Colors.BRIGHT_RED}{dns['failures']:,}{Colors.RESET}")
+        self._emit()
     
     def _render_progress(self):
         """渲染进度条"""
-        print(f"  {UIComponents.status_icon('chart')} {Colors.BOLD}整体进度{Colors.RESET}")
+        self._emit(f"  {UIComponents.status_icon('chart')} {Colors.BOLD}整体进度{Colors.RESET}")
         
         # 主进度条
         progress = UIComponents.progress_bar(
@@ -439,7 +742,7 @@ class Dashboard:
             width=60, 
             style='gradient'
         )
-        print(f"  {progress}")
+        self._emit(f"  {progress}")
         
         # 成功率进度条
         if self.stats['tested'] > 0:
@@ -450,13 +753,13 @@ class Dashboard:
                 width=60,
                 style='rainbow'
             )
-            print(f"  {Colors.DIM}成功率: {success_bar}{Colors.RESET}")
-        print()
+            self._emit(f"  {Colors.DIM}成功率: {success_bar}{Colors.RESET}")
+        self._emit()
     
     def _render_performance(self):
         """渲染性能图表"""
         if len(self.speed_history) > 1:
-            print(f"  {UIComponents.status_icon('lightning')} {Colors.BOLD}速度趋势{Colors.RESET} (节点/秒)")
+            self._emit(f"  {UIComponents.status_icon('lightning')} {Colors.BOLD}速度趋势{Colors.RESET} (节点/秒)")
             
             # 简单的ASCII图表
             max_speed = max(self.speed_history) if self.speed_history else 1
@@ -486,16 +789,17 @@ class Dashboard:
                 chart.append(line)
             
             for line in chart:
-                print(line)
+                self._emit(line)
             
             # 添加坐标轴
-            print("  " + Colors.DIM + "└" + "─" * width + Colors.RESET)
-            print()
+            self._emit("  " + Colors.DIM + "└" + "─" * width + Colors.RESET)
+            self._emit()
     
     def _render_latency_distribution(self):
-        """渲染延迟分布"""
-        if len(self.latency_history) > 5:
-            print(f"  {UIComponents.status_icon('globe')} {Colors.BOLD}延迟分布{Colors.RESET}")
+        """渲染延迟分布（整轮直方图）"""
+        total = self.histogram.total
+        if total > 5:
+            self._emit(f"  {UIComponents.status_icon('globe')} {Colors.BOLD}延迟分布{Colors.RESET}")
             
             # 创建延迟分组
             ranges = [(0, 50, '极快', Colors.BRIGHT_GREEN),
@@ -507,7 +811,7 @@ class Dashboard:
             # 统计每个范围的节点数
             distribution = {}
             for min_lat, max_lat, label, color in ranges:
-                count = sum(1 for lat in self.latency_history if min_lat <= lat < max_lat)
+                count = self.histogram.count_between(min_lat, max_lat)
                 if count > 0:
                     distribution[label] = (count, color)
             
@@ -517,17 +821,20 @@ class Dashboard:
                 for label, (count, color) in distribution.items():
                     bar_width = int((count / max_count) * 40)
                     bar = color + "█" * bar_width + Colors.RESET
-                    percentage = (count / len(self.latency_history)) * 100
-                    print(f"  {label:6} {bar} {count:3} ({percentage:.1f}%)")
-            print()
+                    percentage = (count / total) * 100
+                    self._emit(f"  {label:6} {bar} {count:3,} ({percentage:.1f}%)")
+            self._emit()
     
     def _render_recent_nodes(self):
         """渲染最近测试的节点"""
         if self.recent_nodes:
-            print(f"  {UIComponents.status_icon('star')} {Colors.BOLD}最新发现的优质节点{Colors.RESET}")
-            
-            # 获取最好的节点
-            best_nodes = sorted(list(self.recent_nodes), key=lambda x: x.get('latency', 999999))[:3]
+            # 目标模式显示排行榜，否则显示最近节点中最好的
+            if self.stats['leaders']:
+                self._emit(f"  {UIComponents.status_icon('trophy')} {Colors.BOLD}实时排行榜{Colors.RESET}")
+                best_nodes = self.stats['leaders']
+            else:
+                self._emit(f"  {UIComponents.status_icon('star')} {Colors.BOLD}最新发现的优质节点{Colors.RESET}")
+                best_nodes = sorted(list(self.recent_nodes), key=lambda x: x.get('latency', 999999))[:3]
             
             for i, node in enumerate(best_nodes):
                 latency = node.get('latency', 0)
@@ -560,8 +867,8 @@ class Dashboard:
                 display_width = UIComponents.get_display_width(truncated_name)
                 padding = ' ' * (max_name_width - display_width)
                 
-                print(f"  {icon} {truncated_name}{padding} {latency_bar} {latency_color}{latency:.0f}ms{Colors.RESET} {badge}")
-            print()
+                self._emit(f"  {icon} {truncated_name}{padding} {latency_bar} {latency_color}{latency:.0f}ms{Colors.RESET} {badge}")
+            self._emit()
     
     def _render_footer(self):
         """渲染底部信息"""
@@ -569,13 +876,17 @@ class Dashboard:
         
         # 添加装饰性分隔线
         separator = Colors.gradient_text("─" * 74, (100, 100, 255), (255, 100, 100))
-        print("  " + separator)
+        self._emit("  " + separator)
         
         # 底部信息带图标
-        print(f"  {UIComponents.status_icon('shield')} {Colors.DIM}运行时间: {runtime}  |  "
-              f"按 {Colors.BRIGHT_YELLOW}Ctrl+C{Colors.DIM} 保存并退出  |  "
-              f"自动保存: 每5000个节点{Colors.RESET}")
-        print()
+        self._emit(f"  {UIComponents.status_icon('shield')} {Colors.DIM}运行时间: {runtime}  |  "
+                   f"按 {Colors.BRIGHT_YELLOW}Ctrl+C{Colors.DIM} 保存并退出  |  "
+                   f"自动保存: 每5000个节点{Colors.RESET}")
+        # 实际帧率同时受刷新间隔与渲染预算限制
+        fps = min(1 / max(self.update_interval, 0.001), 1000 * self.render_budget / max(self.render_ms, 0.001))
+        self._emit(f"  {Colors.DIM}渲染耗时: {self.render_ms:.1f}ms/帧  |  "
+                   f"实际帧率: {fps:.1f} 帧/秒{Colors.RESET}")
+        self._emit()
 
 # ═══════════════════════════════════════════════════════════════
 # 依赖安装
@@ -661,272 +972,2564 @@ class SystemResourceManager:
             return 10
 
 # ═══════════════════════════════════════════════════════════════
-# 可视化节点测速类
+# 订阅下载
 # ═══════════════════════════════════════════════════════════════
 
-class VisualNodeTester:
-    def __init__(self, config=None):
-        optimal_workers = SystemResourceManager.get_optimal_thread_count()
-        
-        self.config = {
-            'timeout': 3,
-            'max_workers': optimal_workers,
-            'max_latency': 500,
-            'batch_size': 1000,
-            'max_nodes': 100000,
-            'save_interval': 5000,
-            'visual_mode': True,  # 可视化模式
-            'update_interval': 0.5,  # UI更新间隔
-        }
-        
-        if config:
-            self.config.update(config)
-        
-        self.available_nodes = []
-        self.total_nodes = 0
-        self.tested_nodes = 0
-        self.success_nodes = 0
-        self.failed_nodes = 0
-        self.start_time = None
-        self.stop_flag = threading.Event()
-        self.lock = threading.Lock()
-        self.actual_workers = 0
-        
-        # 仪表盘
-        self.dashboard = Dashboard()
-        
-        # 设置信号处理
-        signal.signal(signal.SIGINT, self.signal_handler)
-        signal.signal(signal.SIGTERM, self.signal_handler)
+class SubscriptionCache:
+    """订阅磁盘缓存 - 按URL保存ETag/Last-Modified元数据，解码后的节点逐行存放在同名.nodes文件中"""
     
-    def signal_handler(self, signum, frame):
-        """处理中断信号"""
-        UIComponents.show_cursor()
-        print(f"\n\n{Colors.BRIGHT_YELLOW}⚠️  收到中断信号，正在安全退出...{Colors.RESET}")
-        self.stop_flag.set()
-        self.save_results(final=True)
-        print(f"{Colors.BRIGHT_GREEN}✅ 已保存当前结果{Colors.RESET}")
-        print(f"{Colors.BRIGHT_CYAN}📊 测试统计：{Colors.RESET}")
-        print(f"    • 总共测试: {self.tested_nodes:,} 个节点")
-        print(f"    • 发现可用: {self.success_nodes:,} 个节点")
-        print(f"    • 成功率: {(self.success_nodes/max(self.tested_nodes,1)*100):.1f}%")
-        sys.exit(0)
+    def __init__(self, directory='subscribe_cache', ttl=0):
+        self.directory = directory
+        self.ttl = ttl  # 秒，缓存在此时间内直接使用，不发请求
     
-    def read_subscribe_links(self, filename="subscribe.txt"):
-        """读取订阅链接"""
+    def _path(self, url, suffix='.json'):
+        return os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest() + suffix)
+    
+    def get(self, url):
+        """读取缓存条目，不存在、损坏或缺少节点文件时返回None"""
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                links = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-            return links
-        except FileNotFoundError:
-            print(f"{Colors.BRIGHT_RED}❌ 找不到文件 {filename}{Colors.RESET}")
-            print(f"{Colors.BRIGHT_YELLOW}📝 正在创建示例文件 {filename}...{Colors.RESET}")
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write("# 添加订阅链接，每行一个\n")
-                f.write("# 支持多种格式：vmess://, vless://, trojan://, ss://, hy2://\n")
-                f.write("# 也可以直接添加HTTP/HTTPS订阅链接\n")
-            return []
+            with open(self._path(url), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url or not os.path.exists(self._path(url, '.nodes')):
+            return None
+        return entry
     
-    def save_valid_subscribe_links(self, links, filename="subscribe.txt"):
-        """保存有效的订阅链接"""
+    def is_fresh(self, entry):
+        """是否在TTL内"""
+        return self.ttl > 0 and time.time() - entry.get('fetched_at', 0) < self.ttl
+    
+    def nodes(self, url):
+        """逐行读取缓存的节点"""
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write("# 有效的订阅链接\n")
-                f.write(f"# 更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-                for link in links:
-                    f.write(f"{link}\n")
-            print(f"{Colors.BRIGHT_GREEN}✅ 有效的订阅链接已保存回 {filename}{Colors.RESET}")
-        except Exception as e:
-            print(f"{Colors.BRIGHT_RED}❌ 保存有效订阅链接失败: {e}{Colors.RESET}")
+            with open(self._path(url, '.nodes'), 'r', encoding='utf-8') as f:
+                for line in f:
+                    node = line.strip()
+                    if node:
+                        yield node
+        except OSError:
+            return
     
-    def decode_subscribe_fast(self, link):
-        """快速解码订阅"""
-        nodes = []
+    def tee(self, url, etag, last_modified, nodes):
+        """透传节点并逐行写入缓存：全部产出且至少有一个节点时，节点文件与元数据原子替换；中途停止则丢弃"""
+        nodes_path = self._path(url, '.nodes')
+        tmp_path = f"{nodes_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        f = None
         try:
-            if link.startswith('http'):
-                if HAS_REQUESTS:
-                    response = requests.get(link, timeout=5, headers={'User-Agent': 'Mozilla/5.0'})
-                    content = response.text
-                else:
-                    req = urllib.request.Request(link, headers={'User-Agent': 'Mozilla/5.0'})
-                    with urllib.request.urlopen(req, timeout=5) as response:
-                        content = response.read().decode('utf-8')
-                
+            os.makedirs(self.directory, exist_ok=True)
+            f = open(tmp_path, 'w', encoding='utf-8')
+        except OSError:
+            pass
+        
+        count = 0
+        try:
+            for node in nodes:
+                if f is not None:
+                    try:
+                        f.write(node + '\n')
+                    except OSError:
+                        f.close()
+                        f = None
+                count += 1
+                yield node
+            
+            if f is not None and count:
+                f.close()
                 try:
-                    decoded = base64.b64decode(content).decode('utf-8')
-                    nodes = decoded.split('\n')
-                except:
-                    nodes = content.split('\n')
-            else:
+                    os.replace(tmp_path, nodes_path)
+                except OSError:
+                    return
+                self._write(url, {
+                    'url': url,
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'fetched_at': time.time(),
+                })
+        finally:
+            if f is not None:
+                f.close()
+            if os.path.exists(tmp_path):
                 try:
-                    decoded = base64.b64decode(link).decode('utf-8')
-                    nodes = decoded.split('\n')
-                except:
-                    nodes = [link]
-        except:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    
+    def touch(self, url, entry):
+        """304时刷新缓存时间"""
+        entry['fetched_at'] = time.time()
+        self._write(url, entry)
+    
+    def _write(self, url, entry):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(url)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError:
             pass
-        
-        return [n.strip() for n in nodes if n.strip()]
+
+
+class SubscriptionFetcher:
+    """并发订阅下载器 - 按来源复用长连接，限制单主机与全局并发"""
     
-    def parse_node_minimal(self, node):
-        """最小化节点解析"""
-        info = {'raw': node, 'server': '', 'port': 0, 'name': ''}
-        
+    SPOOL_SIZE = 1024 * 1024  # 正文超过此大小转存磁盘临时文件
+    
+    def __init__(self, timeout=5, max_in_flight=32, per_host=4, user_agent='Mozilla/5.0',
+                 cache=None, offline=False):
+        self.timeout = timeout
+        self.cache = cache
+        self.offline = offline  # 离线模式：只使用缓存
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.per_host = max(int(per_host), 1)
+        self.headers = {'User-Agent': user_agent}
+        self.timings = []  # (链接, 耗时秒, 是否成功, 来源)
+        self.wall_time = 0
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        
+        # requests.Session为每个来源维护keep-alive连接池；urllib无连接复用
+        self.session = None
+        if HAS_REQUESTS:
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=64, pool_maxsize=self.per_host)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+    
+    @staticmethod
+    def origin(link):
+        """来源标识 (scheme, host:port)"""
+        parts = urllib.parse.urlsplit(link)
+        return parts.scheme, parts.netloc
+    
+    def _host_slot(self, link):
+        origin = self.origin(link)
+        with self._lock:
+            slot = self._host_slots.get(origin)
+            if slot is None:
+                slot = self._host_slots[origin] = threading.BoundedSemaphore(self.per_host)
+        return slot
+    
+    def _get(self, link, headers):
+        """发送GET请求，正文分块读入临时文件（超过SPOOL_SIZE落盘），返回 (状态码, 正文文件, ETag, Last-Modified)"""
+        body = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE)
         try:
-            if node.startswith('vmess://'):
-                encoded = node[8:]
-                decoded = base64.b64decode(encoded + '=' * (4 - len(encoded) % 4)).decode('utf-8')
-                data = json.loads(decoded)
-                info['server'] = data.get('add', '')
-                info['port'] = int(data.get('port', 0))
-                info['name'] = data.get('ps', '')[:30]
-            elif node.startswith(('vless://', 'trojan://', 'ss://', 'hy2://')):
-                parsed = urllib.parse.urlparse(node)
-                info['server'] = parsed.hostname or ''
-                info['port'] = parsed.port or 443
-                # 解析节点名称
-                if '#' in node:
-                    info['name'] = urllib.parse.unquote(node.split('#')[1])[:30]
+            if self.session is not None:
+                with self.session.get(link, timeout=self.timeout, headers=headers, stream=True) as response:
+                    for chunk in response.iter_content(SubscriptionDecoder.CHUNK_SIZE):
+                        body.write(chunk)
+                    status, etag, last_modified = (response.status_code, response.headers.get('ETag'),
+                                                   response.headers.get('Last-Modified'))
+            else:
+                req = urllib.request.Request(link, headers=headers)
+                try:
+                    with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                        for chunk in iter(lambda: response.read(SubscriptionDecoder.CHUNK_SIZE), b''):
+                            body.write(chunk)
+                        status, etag, last_modified = (response.status, response.headers.get('ETag'),
+                                                       response.headers.get('Last-Modified'))
+                except urllib.error.HTTPError as e:
+                    if e.code == 304:
+                        body.close()
+                        return 304, None, None, None
+                    raise
+        except BaseException:
+            body.close()
+            raise
+        
+        body.seek(0)
+        return status, body, etag, last_modified
+    
+    def _record(self, link, elapsed, result):
+        ok = result['body'] is not None or result['nodes'] is not None
+        with self._lock:
+            self.timings.append((link, elapsed, ok, result['source']))
+    
+    def timed_fetch(self, link):
+        """下载单个订阅，返回 (结果, 耗时秒)
+        
+        结果中body为新下载正文的临时文件；命中缓存(TTL内/304/离线)时nodes为逐行读取缓存节点的迭代器
+        """
+        result = {'body': None, 'nodes': None, 'status': None,
+                  'etag': None, 'last_modified': None, 'source': 'network'}
+        
+        entry = self.cache.get(link) if self.cache else None
+        if entry is not None and (self.offline or self.cache.is_fresh(entry)):
+            result.update(nodes=self.cache.nodes(link), source='cache')
+            self._record(link, 0, result)
+            return result, 0
+        
+        if self.offline:
+            self._record(link, 0, result)
+            return result, 0
+        
+        # 条件请求
+        headers = dict(self.headers)
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        
+        with self._host_slot(link):
+            start_time = time.time()
+            try:
+                status, body, etag, last_modified = self._get(link, headers)
+                if status == 304 and entry is not None:
+                    self.cache.touch(link, entry)
+                    result.update(nodes=self.cache.nodes(link), status=status, source='304')
                 else:
-                    info['name'] = f"{parsed.scheme}://{info['server']}"[:30]
-        except:
-            pass
+                    result.update(body=body, status=status, etag=etag, last_modified=last_modified)
+            except Exception:
+                pass
+            elapsed = time.time() - start_time
         
-        return info
+        self._record(link, elapsed, result)
+        return result, elapsed
     
-    def test_gfw_real_latency(self, host, port, sni=None):
-        """通过测试TLS握手延迟来模拟GFW环境下的真实延迟"""
-        if not host or not port:
-            return None
+    def interleave(self, links):
+        """按来源轮转排列，避免全局并发槽被同一主机占满"""
+        by_origin = {}
+        for link in links:
+            by_origin.setdefault(self.origin(link), []).append(link)
+        return [link for group in itertools.zip_longest(*by_origin.values())
+                for link in group if link is not None]
+    
+    def fetch_all(self, links):
+        """并发下载，按完成顺序产出 (链接, 结果, 耗时秒)"""
+        if not links:
+            return
         
-        sni_host = sni if sni else host
+        start_time = time.time()
+        executor = ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(links)))
+        try:
+            futures = {executor.submit(self.timed_fetch, link): link for link in self.interleave(links)}
+            for future in as_completed(futures):
+                result, elapsed = future.result()
+                yield futures[future], result, elapsed
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.wall_time += time.time() - start_time
+    
+    def summary(self):
+        """下载统计：数量、成功数、缓存命中、实际耗时、串行耗时之和、最慢链接"""
+        with self._lock:
+            timings = list(self.timings)
+        slowest = sorted(timings, key=lambda t: t[1], reverse=True)[:3]
+        return {
+            'count': len(timings),
+            'ok': sum(1 for t in timings if t[2]),
+            'cached': sum(1 for t in timings if t[3] != 'network'),
+            'wall': self.wall_time,
+            'total': sum(t[1] for t in timings),
+            'slowest': slowest,
+        }
+
+# ═══════════════════════════════════════════════════════════════
+# 订阅解码
+# ═══════════════════════════════════════════════════════════════
 
+class SubscriptionDecoder:
+    """流式订阅解码 - 正文分块喂入、节点链接逐个产出，内存只保留未完成的一行或一个代理条目；
+    识别 base64 / 明文链接 / Clash YAML / SIP008 JSON 四种正文，base64解出的内容再按格式识别"""
+    
+    CHUNK_SIZE = 64 * 1024
+    SNIFF_SIZE = 4096  # 用开头这么多字节判定格式
+    BASE64_ALPHABET = frozenset(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=-_ \t\r\n')
+    URLSAFE = bytes.maketrans(b'-_', b'+/')
+    CLASH_KEYS = re.compile(r'^(proxies|proxy-groups|proxy-providers|rules|port|mixed-port|socks-port|'
+                            r'allow-lan|mode|log-level|dns)\s*:', re.M)
+    SERVERS = re.compile(r'"servers"\s*:\s*\[')
+    SEPARATORS = re.compile(r'[\s,]*')
+    JSON = json.JSONDecoder()
+    
+    def __init__(self, allow_base64=True):
+        self.allow_base64 = allow_base64
+        self.format = None  # 'base64' / 'lines' / 'clash' / 'sip008'
+        self.head = b''  # 判定格式前缓冲的开头
+        self.text = codecs.getincrementaldecoder('utf-8')('replace')
+        self.pending = ''  # 未完成的一行 / SIP008未解析完的片段
+        self.b64 = b''  # base64不足4个字符的尾部
+        self.inner = None  # base64解出内容的解码器
+        self.in_proxies = False  # Clash：位于顶层proxies列表内
+        self.proxy = []  # Clash：当前代理条目的 (缩进, 文本) 行
+        self.proxy_indent = 0
+        self.servers = None  # SIP008：None=未找到servers数组，True=数组内，False=数组已结束
+    
+    @classmethod
+    def iter_file(cls, f):
+        """分块读取二进制文件对象，逐个产出节点"""
+        decoder = cls()
+        for chunk in iter(lambda: f.read(cls.CHUNK_SIZE), b''):
+            yield from decoder.feed(chunk)
+        yield from decoder.close()
+    
+    @classmethod
+    def decode(cls, data):
+        """一次性解码短内容（本地条目）"""
+        decoder = cls()
+        nodes = decoder.feed(data.encode('utf-8') if isinstance(data, str) else data)
+        return nodes + decoder.close()
+    
+    def feed(self, chunk):
+        """喂入一块正文（bytes），返回已完整解出的节点"""
+        if self.format is None:
+            self.head += chunk
+            if len(self.head) < self.SNIFF_SIZE:
+                return []
+            chunk, self.head = self.head, b''
+            self.format = self.sniff(chunk)
+        return self._feed(chunk, False)
+    
+    def close(self):
+        """正文结束，返回剩余节点"""
+        nodes = []
+        if self.format is None:
+            chunk, self.head = self.head, b''
+            self.format = self.sniff(chunk)
+            nodes = self._feed(chunk, False)
+        return nodes + self._feed(b'', True)
+    
+    def sniff(self, head):
+        """按开头判定正文格式"""
+        text = head.decode('utf-8', 'ignore').lstrip('\ufeff \t\r\n')
+        if self.CLASH_KEYS.search(text):
+            return 'clash'
+        if text.startswith('{'):
+            return 'sip008'
+        if '://' in text or not self.allow_base64 or not set(head) <= self.BASE64_ALPHABET:
+            return 'lines'
+        return 'base64'
+    
+    def _feed(self, chunk, final):
+        if self.format == 'base64':
+            return self._feed_base64(chunk, final)
+        text = self.text.decode(chunk, final)
+        if self.format == 'sip008':
+            return self._feed_sip008(text, final)
+        lines = (self.pending + text).split('\n')
+        self.pending = '' if final else lines.pop()
+        if self.format == 'clash':
+            return self._feed_clash(lines, final)
+        return [line.strip() for line in lines if line.strip()]
+    
+    def _feed_base64(self, chunk, final):
+        """增量base64解码（兼容换行、URL安全字符与缺失的填充），解出内容交给内层解码器"""
+        data = self.b64 + chunk.translate(self.URLSAFE, b' \t\r\n=')
+        cut = len(data) if final else len(data) - len(data) % 4
+        block, self.b64 = data[:cut], data[cut:]
+        if len(block) % 4 == 1:
+            block = block[:-1]
+        block += b'=' * (-len(block) % 4)
+        
+        if self.inner is None:
+            self.inner = SubscriptionDecoder(allow_base64=False)
         try:
-            start_time = time.time()
+            decoded = base64.b64decode(block)
+        except ValueError:
+            decoded = b''
+        nodes = self.inner.feed(decoded)
+        return nodes + self.inner.close() if final else nodes
+    
+    def _feed_sip008(self, text, final):
+        """SIP008：在servers数组内逐个解析服务器对象，不完整的对象留到下一块"""
+        if self.servers is False:
+            return []
+        buffer = self.pending + text
+        if self.servers is None:
+            match = self.SERVERS.search(buffer)
+            if match is None:
+                self.pending = '' if final else buffer[-32:]  # 键名可能跨块
+                return []
+            self.servers = True
+            buffer = buffer[match.end():]
+        
+        nodes = []
+        pos = 0
+        while True:
+            pos = self.SEPARATORS.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == ']':
+                self.servers = False
+                pos = len(buffer)
+                break
+            try:
+                server, pos = self.JSON.raw_decode(buffer, pos)
+            except ValueError:
+                break
+            uri = self.sip008_uri(server)
+            if uri:
+                nodes.append(uri)
+        self.pending = '' if final else buffer[pos:]
+        return nodes
+    
+    def _feed_clash(self, lines, final):
+        """Clash：收集顶层proxies列表中的每个条目，条目结束时转换为节点链接"""
+        nodes = []
+        for line in lines:
+            line = line.rstrip()
+            text = line.lstrip(' ')
+            if not text or text.startswith('#'):
+                continue
+            indent = len(line) - len(text)
+            item = text == '-' or text.startswith('- ')
             
-            sock = socket.create_connection((host, port), timeout=self.config['timeout'])
+            if indent == 0 and not item:
+                # 顶层键：proxies列表开始或结束
+                nodes.extend(self._flush_proxy())
+                self.in_proxies = text.startswith('proxies:')
+                continue
+            if not self.in_proxies:
+                continue
             
-            context = ssl.create_default_context()
-            context.check_hostname = False
-            context.verify_mode = ssl.CERT_NONE
-
-            with context.wrap_socket(sock, server_hostname=sni_host) as ssock:
-                latency = (time.time() - start_time) * 1000
-                return latency
-        except (socket.timeout, ssl.SSLError, ConnectionRefusedError, OSError):
+            if item and (not self.proxy or indent <= self.proxy_indent):
+                nodes.extend(self._flush_proxy())
+                self.proxy_indent = indent
+                content = text[1:].lstrip(' ')
+                indent += len(text) - len(content)
+                text = content
+                if not text:
+                    continue
+            self.proxy.append((indent, text))
+        
+        if final:
+            nodes.extend(self._flush_proxy())
+        return nodes
+    
+    def _flush_proxy(self):
+        lines, self.proxy = self.proxy, []
+        if not lines:
+            return []
+        if lines[0][1].startswith('{'):
+            proxy = self.yaml_scalar(' '.join(text for _, text in lines))
+        else:
+            proxy = self.yaml_block(lines)
+        uri = self.clash_uri(proxy) if isinstance(proxy, dict) else None
+        return [uri] if uri else []
+    
+    @staticmethod
+    def flow_items(text):
+        """按顶层逗号切分YAML流式集合（忽略引号与嵌套括号内的逗号）"""
+        items, depth, quote, start = [], 0, None, 0
+        for i, ch in enumerate(text):
+            if quote:
+                if ch == quote:
+                    quote = None
+            elif ch in '"\'':
+                quote = ch
+            elif ch in '{[':
+                depth += 1
+            elif ch in '}]':
+                depth -= 1
+            elif ch == ',' and depth == 0:
+                items.append(text[start:i])
+                start = i + 1
+        items.append(text[start:])
+        return [item.strip() for item in items if item.strip()]
+    
+    @classmethod
+    def yaml_scalar(cls, value):
+        """YAML值：流式映射/列表、引号字符串、布尔、整数，其余为字符串"""
+        value = value.strip()
+        if value.startswith('{') and value.endswith('}'):
+            result = {}
+            for item in cls.flow_items(value[1:-1]):
+                key, sep, item = item.partition(':')
+                if sep:
+                    result[str(cls.yaml_scalar(key))] = cls.yaml_scalar(item)
+            return result
+        if value.startswith('[') and value.endswith(']'):
+            return [cls.yaml_scalar(item) for item in cls.flow_items(value[1:-1])]
+        if value.startswith('"'):
+            try:
+                return json.loads(value[:value.rindex('"') + 1])
+            except ValueError:
+                return value.strip('"')
+        if value.startswith("'"):
+            end = value.rfind("'")
+            return value[1:end if end > 0 else None].replace("''", "'")
+        
+        value = value.split(' #', 1)[0].strip()  # 行尾注释
+        lower = value.lower()
+        if lower in ('true', 'false'):
+            return lower == 'true'
+        if lower in ('', 'null', '~'):
             return None
-        except Exception:
+        if value.isdigit() and str(int(value)) == value:  # 前导零（如short-id）保留为字符串
+            return int(value)
+        return value
+    
+    @classmethod
+    def yaml_block(cls, lines):
+        """缩进块映射 → dict（支持代理条目中常见的子映射与列表）"""
+        root = {}
+        stack = [(lines[0][0], root)]
+        opened = None  # 值为空、等待子块的 (所属映射, 键, 缩进)
+        for indent, text in lines:
+            item = text == '-' or text.startswith('- ')
+            if opened is not None:
+                parent, key, key_indent = opened
+                opened = None
+                if indent > key_indent or (item and indent == key_indent):
+                    child = [] if item else {}
+                    parent[key] = child
+                    stack.append((indent, child))
+            while len(stack) > 1 and (indent < stack[-1][0] or
+                                      (indent == stack[-1][0] and isinstance(stack[-1][1], list) and not item)):
+                stack.pop()
+            
+            container = stack[-1][1]
+            if isinstance(container, list):
+                if item:
+                    container.append(cls.yaml_scalar(text[1:]))
+                continue
+            key, sep, value = text.partition(':')
+            if item or not sep:
+                continue
+            key = str(cls.yaml_scalar(key))
+            if value.strip():
+                container[key] = cls.yaml_scalar(value)
+            else:
+                container[key] = None
+                opened = (container, key, indent)
+        return root
+    
+    @staticmethod
+    def ss_uri(method, password, server, port, name, plugin=''):
+        """SIP002格式的ss链接"""
+        userinfo = base64.urlsafe_b64encode(f"{method}:{password}".encode('utf-8')).decode('ascii').rstrip('=')
+        host = f"[{server}]" if ':' in str(server) else server
+        query = f"/?{urllib.parse.urlencode({'plugin': plugin})}" if plugin else ''
+        return f"ss://{userinfo}@{host}:{port}{query}#{urllib.parse.quote(str(name or ''), safe='')}"
+    
+    @classmethod
+    def sip008_uri(cls, server):
+        """SIP008服务器对象 → ss链接"""
+        if not isinstance(server, dict) or not server.get('server') or not server.get('server_port'):
             return None
+        plugin = server.get('plugin') or ''
+        if plugin and server.get('plugin_opts'):
+            plugin = f"{plugin};{server['plugin_opts']}"
+        return cls.ss_uri(server.get('method', ''), server.get('password', ''), server['server'],
+                          server['server_port'], server.get('remarks', ''), plugin)
     
-    def process_node(self, node):
-        """处理单个节点"""
-        if self.stop_flag.is_set():
+    @classmethod
+    def clash_uri(cls, proxy):
+        """Clash代理条目 → 节点链接（ss / vmess / vless / trojan / hysteria2，其余类型跳过）"""
+        kind = str(proxy.get('type', '')).lower()
+        server, port, name = proxy.get('server'), proxy.get('port'), proxy.get('name', '')
+        if not server or not port:
             return None
-        
-        info = self.parse_node_minimal(node)
-        if info['server'] and info['port']:
-            latency = self.test_gfw_real_latency(info['server'], info['port'], info.get('sni'))
-            
-            with self.lock:
-                self.tested_nodes += 1
-                
-                if latency and latency <= self.config['max_latency']:
-                    info['latency'] = latency
-                    self.success_nodes += 1
-                    self.dashboard.add_recent_node(info)
-                    return info
-                else:
-                    self.failed_nodes += 1
+        if kind == 'ss':
+            opts = proxy.get('plugin-opts')
+            plugin = proxy.get('plugin') or ''
+            if plugin and isinstance(opts, dict):
+                plugin = ';'.join([plugin] + [f"{key}={value}" for key, value in opts.items()])
+            return cls.ss_uri(proxy.get('cipher', ''), proxy.get('password', ''), server, port, name, plugin)
+        
+        sni = proxy.get('servername') or proxy.get('sni') or ''
+        network = proxy.get('network') or 'tcp'
+        alpn = proxy.get('alpn') or ''
+        if isinstance(alpn, list):
+            alpn = ','.join(str(value) for value in alpn)
+        ws = proxy.get('ws-opts') if isinstance(proxy.get('ws-opts'), dict) else {}
+        headers = ws.get('headers') if isinstance(ws.get('headers'), dict) else {}
+        grpc = proxy.get('grpc-opts') if isinstance(proxy.get('grpc-opts'), dict) else {}
+        
+        if kind == 'vmess':
+            data = {
+                'v': '2', 'ps': str(name), 'add': server, 'port': port, 'id': str(proxy.get('uuid', '')),
+                'aid': proxy.get('alterId', 0), 'scy': proxy.get('cipher', 'auto'), 'net': network,
+                'type': 'none', 'host': headers.get('Host', ''), 'path': ws.get('path', '') or grpc.get('grpc-service-name', ''),
+                'tls': 'tls' if proxy.get('tls') else '', 'sni': sni, 'alpn': alpn,
+            }
+            return 'vmess://' + base64.b64encode(json.dumps(data, ensure_ascii=False).encode('utf-8')).decode('ascii')
+        
+        params = {'sni': sni, 'alpn': alpn}
+        if kind == 'vless':
+            reality = proxy.get('reality-opts') if isinstance(proxy.get('reality-opts'), dict) else {}
+            userinfo = proxy.get('uuid', '')
+            params.update(encryption='none', flow=proxy.get('flow', ''), fp=proxy.get('client-fingerprint', ''),
+                          security='reality' if reality else ('tls' if proxy.get('tls') else 'none'),
+                          pbk=reality.get('public-key', ''), sid=reality.get('short-id', ''))
+        elif kind == 'trojan':
+            userinfo = proxy.get('password', '')
+        elif kind in ('hysteria2', 'hy2'):
+            kind = 'hysteria2'
+            userinfo = proxy.get('password', '') or proxy.get('auth', '')
+            params.update(obfs=proxy.get('obfs', ''), **{'obfs-password': proxy.get('obfs-password', '')})
+            network = ''
         else:
-            with self.lock:
-                self.tested_nodes += 1
-                self.failed_nodes += 1
+            return None
+        if proxy.get('skip-cert-verify'):
+            params['insecure'] = 1
+        params.update(type=network, path=ws.get('path', ''), host=headers.get('Host', ''),
+                      serviceName=grpc.get('grpc-service-name', ''))
+        
+        query = urllib.parse.urlencode({key: value for key, value in params.items() if value not in (None, '')})
+        host = f"[{server}]" if ':' in str(server) else server
+        return (f"{kind}://{urllib.parse.quote(str(userinfo), safe='')}@{host}:{port}"
+                f"?{query}#{urllib.parse.quote(str(name), safe='')}")
+
+# ═══════════════════════════════════════════════════════════════
+# TLS探测
+# ═══════════════════════════════════════════════════════════════
+
+class TLSProbe:
+    """TLS探测上下文 - 每种配置(ALPN, 最低版本)只构建一次SSLContext供所有工作者共用，可选测量会话复用握手"""
+    
+    VERSIONS = {'TLSv1.2': ssl.TLSVersion.TLSv1_2, 'TLSv1.3': ssl.TLSVersion.TLSv1_3}
+    
+    def __init__(self, min_version='TLSv1.2', resumption=False, ticket_wait=0.2):
+        self.min_version = self.VERSIONS.get(min_version, ssl.TLSVersion.TLSv1_2)
+        self.resumption = resumption
+        self.ticket_wait = ticket_wait  # 等待TLS 1.3会话票据的时间(秒)
+        self.contexts = {}  # ALPN -> SSLContext
+        self.sessions = {}  # (主机, 端口, SNI, ALPN) -> SSLSession
+        self.lock = threading.Lock()
         
-        return None
+        # 统计
+        self.resume_attempts = 0
+        self.resumed = 0
     
-    def ui_update_thread(self):
-        """UI更新线程"""
-        while not self.stop_flag.is_set():
+    def context(self, alpn=''):
+        """取共享上下文，alpn为逗号分隔的协议列表"""
+        ctx = self.contexts.get(alpn)
+        if ctx is None:
             with self.lock:
-                self.dashboard.update_stats(
-                    total=self.total_nodes,
-                    tested=self.tested_nodes,
-                    success=self.success_nodes,
-                    failed=self.failed_nodes,
-                    threads=self.actual_workers
-                )
-            
-            if self.config['visual_mode']:
-                self.dashboard.render()
-            
-            time.sleep(self.config['update_interval'])
+                ctx = self.contexts.get(alpn)
+                if ctx is None:
+                    ctx = self.contexts[alpn] = self._build(alpn)
+        return ctx
     
-    def save_results(self, final=False):
-        """保存结果"""
-        if not self.available_nodes:
+    def _build(self, alpn):
+        # 不校验证书，也就不必加载系统CA证书库
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+        ctx.minimum_version = self.min_version
+        if alpn:
+            try:
+                ctx.set_alpn_protocols([proto for proto in alpn.split(',') if proto])
+            except (NotImplementedError, ssl.SSLError):
+                pass
+        return ctx
+    
+    def handshake(self, sock, server_hostname, alpn='', session=None):
+        """在已连接的套接字上握手，返回 (SSLSocket, 握手耗时ms)"""
+        start_ns = time.perf_counter_ns()
+        ssock = self.context(alpn).wrap_socket(sock, server_hostname=server_hostname, session=session)
+        return ssock, (time.perf_counter_ns() - start_ns) / 1e6
+    
+    def remember(self, key, ssock):
+        """复用模式：收取会话票据并缓存会话"""
+        if not self.resumption:
             return
-        
-        # 按延迟排序
-        self.available_nodes.sort(key=lambda x: x.get('latency', 999999))
-        
-        filename = 'node.txt' if final else 'node_temp.txt'
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(f"# 可用节点 (共 {len(self.available_nodes)} 个)\n")
-                f.write(f"# 生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"# 测试统计: 总测试 {self.tested_nodes} 个，成功 {self.success_nodes} 个\n")
-                f.write("#" + "="*50 + "\n\n")
+            # TLS 1.3的NewSessionTicket在握手后才到达，需读一次让OpenSSL处理
+            ssock.settimeout(self.ticket_wait)
+            ssock.recv(1)
+        except (OSError, ssl.SSLError):
+            pass
+        session = ssock.session
+        if session is not None:
+            with self.lock:
+                self.sessions[key] = session
+    
+    def measure_resumed(self, connect, key, server_hostname, alpn=''):
+        """用缓存会话重新握手，返回复用握手耗时(ms)；无会话时先完整握手一次，服务端未复用返回None；会话用后即删除"""
+        try:
+            if key not in self.sessions:
+                with connect() as sock:
+                    ssock, _ = self.handshake(sock, server_hostname, alpn)
+                    with ssock:
+                        self.remember(key, ssock)
+            
+            # 每个会话只用于本次复用测量，取出即删除，缓存不随节点数增长
+            with self.lock:
+                session = self.sessions.pop(key, None)
+            if session is None:
+                return None
+            
+            with connect() as sock:
+                ssock, elapsed = self.handshake(sock, server_hostname, alpn, session)
+                with ssock:
+                    reused = ssock.session_reused
+        except (OSError, ssl.SSLError, ValueError):
+            return None
+        
+        with self.lock:
+            self.resume_attempts += 1
+            if reused:
+                self.resumed += 1
+        return elapsed if reused else None
+    
+    def summary(self):
+        with self.lock:
+            return {'contexts': len(self.contexts), 'attempts': self.resume_attempts, 'resumed': self.resumed}
+
+# ═══════════════════════════════════════════════════════════════
+# QUIC探测
+# ═══════════════════════════════════════════════════════════════
+
+class QUICProbe:
+    """QUIC可达性探测 - 发送保留版本号的Initial包，服务端按RFC 9000回复版本协商包，无需完成握手"""
+    
+    VERSION = b'\x1a\x2a\x3a\x4a'  # RFC 9000 保留的协商触发版本(0x?a?a?a?a)
+    PACKET_SIZE = 1200  # 客户端Initial包的最小长度，过短的包服务端直接丢弃
+    
+    @classmethod
+    def initial_packet(cls):
+        """构造探测包，返回 (数据, 源连接ID)"""
+        dcid = os.urandom(8)
+        scid = os.urandom(8)
+        # 长包头 + 固定位 + Initial类型
+        header = bytes([0xC0]) + cls.VERSION + bytes([len(dcid)]) + dcid + bytes([len(scid)]) + scid
+        return header + b'\x00' * (cls.PACKET_SIZE - len(header)), scid
+    
+    @staticmethod
+    def is_version_negotiation(data, scid):
+        """是否为回应本次探测的版本协商包（版本为0，目标连接ID为我们的源连接ID）"""
+        if len(data) < 7 or not data[0] & 0x80 or data[1:5] != b'\x00\x00\x00\x00':
+            return False
+        dcid_len = data[5]
+        return data[6:6 + dcid_len] == scid
+    
+    class Protocol(asyncio.DatagramProtocol):
+        """asyncio数据报协议：收到版本协商包时记录时间"""
+        
+        def __init__(self, scid):
+            self.scid = scid
+            self.reply = asyncio.get_running_loop().create_future()
+        
+        def datagram_received(self, data, addr):
+            if not self.reply.done() and QUICProbe.is_version_negotiation(data, self.scid):
+                self.reply.set_result(time.perf_counter_ns())
+        
+        def error_received(self, exc):
+            # ICMP端口不可达等
+            if not self.reply.done():
+                self.reply.set_exception(exc)
+
+# ═══════════════════════════════════════════════════════════════
+# 异步探测引擎
+# ═══════════════════════════════════════════════════════════════
+
+class AsyncProbeEngine:
+    """asyncio探测引擎 - 单线程内维持数千个并发握手"""
+    
+    TIMEOUT_ERRORS = (socket.timeout, asyncio.TimeoutError)  # 截止前未完成（过慢），区别于连接被拒等不可达
+    END = object()  # 节点流耗尽标记
+    
+    def __init__(self, timeout=3, concurrency=1000, controller=None, budget=None, tls=None):
+        self.timeout = timeout
+        self.budget = budget  # 套接字预算，None时不限制
+        self.concurrency = budget.cap(concurrency) if budget else max(int(concurrency), 1)
+        self.controller = controller  # 自适应并发控制，None时固定并发
+        self.tls = tls or TLSProbe()  # 共享SSL上下文
+        self._active = 0
+        self._cond = None
+    
+    async def _connect(self, host, port, timeout):
+        """建立TCP连接并计时，返回 (writer, 耗时ms)；本机资源耗尽时退避重试，其余错误原样抛出"""
+        retries = self.budget.retries if self.budget else 0
+        for attempt in range(retries + 1):
+            try:
+                start_ns = time.perf_counter_ns()
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(host, port,
+                                            local_addr=self.budget.source_for(host) if self.budget else None),
+                    timeout=timeout
+                )
+                elapsed = (time.perf_counter_ns() - start_ns) / 1e6
+                if self.budget:
+                    self.budget.prepare(writer.get_extra_info('socket'))
+                return writer, elapsed
+            except OSError as e:
+                if self.controller is not None:
+                    self.controller.on_error(e)
+                if attempt == retries or not (self.budget and self.budget.is_exhaustion(e)):
+                    raise
+                # 本机资源耗尽不是节点的问题：退避后重试
+                await asyncio.sleep(0.1 * (attempt + 1))
+    
+    async def tcp_timings(self, host, port, info, timeout):
+        """TCP策略：只计TCP建连，返回 {'tcp_ms'}"""
+        timings = {'tcp_ms': None}
+        try:
+            writer, timings['tcp_ms'] = await self._connect(host, port, timeout)
+            writer.transport.abort()
+        except Exception as e:
+            timings['timed_out'] = isinstance(e, self.TIMEOUT_ERRORS)
+        return timings
+    
+    async def tls_timings(self, host, port, info, timeout):
+        """TLS策略：TCP连接与TLS握手分段计时，返回 {'tcp_ms', 'tls_ms'}（失败阶段为None）"""
+        timings = {'tcp_ms': None, 'tls_ms': None}
+        sni = info.get('sni') or info['server'] or host
+        alpn = info.get('alpn', '')
+        loop = asyncio.get_running_loop()
+        
+        try:
+            writer, timings['tcp_ms'] = await self._connect(host, port, timeout)
+            connected_ns = time.perf_counter_ns()
+            
+            # 在已建立的连接上握手，单独计时；超时按剩余时间计算
+            try:
+                transport = await asyncio.wait_for(
+                    loop.start_tls(writer.transport, writer.transport.get_protocol(), self.tls.context(alpn),
+                                   server_hostname=sni),
+                    timeout=max(timeout - timings['tcp_ms'] / 1000, 0.001)
+                )
+                timings['tls_ms'] = (time.perf_counter_ns() - connected_ns) / 1e6
+                transport.abort()
+            finally:
+                writer.transport.abort()
+            
+            if self.tls.resumption:
+                # asyncio握手不支持指定会话，复用握手在线程池中用阻塞套接字测量
+                timings['tls_resumed_ms'] = await loop.run_in_executor(
+                    None, self.tls.measure_resumed,
+                    lambda: self.budget.connect(host, port, timeout) if self.budget
+                    else socket.create_connection((host, port), timeout=timeout),
+                    (host, port, sni, alpn), sni, alpn
+                )
+        except Exception as e:
+            timings['timed_out'] = isinstance(e, self.TIMEOUT_ERRORS)
+        return timings
+    
+    async def quic_timings(self, host, port, info, timeout):
+        """QUIC策略：UDP版本协商往返时间，返回 {'udp_ms'}"""
+        timings = {'udp_ms': None}
+        packet, scid = QUICProbe.initial_packet()
+        loop = asyncio.get_running_loop()
+        
+        try:
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda: QUICProbe.Protocol(scid), remote_addr=(host, port),
+                local_addr=self.budget.source_for(host) if self.budget else None
+            )
+        except OSError as e:
+            if self.controller is not None:
+                self.controller.on_error(e)
+            return timings
+        
+        try:
+            start_ns = time.perf_counter_ns()
+            transport.sendto(packet)
+            received_ns = await asyncio.wait_for(protocol.reply, timeout=timeout)
+            timings['udp_ms'] = (received_ns - start_ns) / 1e6
+        except Exception as e:
+            timings['timed_out'] = isinstance(e, self.TIMEOUT_ERRORS)
+        finally:
+            transport.close()
+        return timings
+    
+    async def _acquire(self):
+        """等待在途数低于自适应上限"""
+        if self.controller is None:
+            return
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self.controller.current())
+            self._active += 1
+    
+    async def _release(self):
+        if self.controller is None:
+            return
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+    
+    async def _worker(self, next_item, handler, on_result, stop_flag):
+        """从共享节点流取任务，直到耗尽或收到停止信号"""
+        while stop_flag is None or not stop_flag.is_set():
+            item = await next_item()
+            if item is self.END:
+                break
+            await self._acquire()
+            try:
+                result = await handler(item)
+            finally:
+                await self._release()
+            if on_result:
+                on_result(item, result)
+    
+    def run(self, items, handler, on_result=None, stop_flag=None):
+        """运行探测：handler为协程函数，on_result在事件循环线程中回调"""
+        async def main():
+            self._cond = asyncio.Condition()
+            source = iter(items)
+            loop = asyncio.get_running_loop()
+            
+            if isinstance(items, (list, tuple)):
+                async def next_item():
+                    return next(source, self.END)
+            else:
+                # 节点流可能阻塞等待订阅解析：在单独的线程里取下一个，事件循环上的握手计时不受影响；
+                # 单线程同时也保证生成器不会被并发推进
+                async def next_item():
+                    return await loop.run_in_executor(feeder, next, source, self.END)
+            
+            workers = [
+                asyncio.create_task(self._worker(next_item, handler, on_result, stop_flag))
+                for _ in range(self.concurrency)
+            ]
+            
+            # 收到停止信号时取消仍在进行的握手
+            pending = set(workers)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=0.2)
+                if pending and stop_flag is not None and stop_flag.is_set():
+                    for task in pending:
+                        task.cancel()
+                    await asyncio.wait(pending)
+                    break
+            
+            for task in workers:
+                if not task.cancelled():
+                    task.result()
+        
+        feeder = ThreadPoolExecutor(max_workers=1)
+        try:
+            asyncio.run(main())
+        finally:
+            feeder.shutdown(wait=False, cancel_futures=True)
+
+# ═══════════════════════════════════════════════════════════════
+# DNS解析
+# ═══════════════════════════════════════════════════════════════
+
+class DNSResolver:
+    """DNS解析阶段 - 独立线程池并行解析唯一主机名，带TTL与失败缓存"""
+    
+    def __init__(self, workers=32, ttl=300, negative_ttl=30):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.executor = ThreadPoolExecutor(max_workers=max(int(workers), 1))
+        self.cache = {}     # 主机 -> (IP或None, 过期时间, 解析耗时ms)
+        self.inflight = {}  # 主机 -> Future
+        self.lock = threading.Lock()
+        
+        # 统计
+        self.lookups = 0
+        self.hits = 0
+        self.failures = 0
+        self.total_ms = 0.0
+    
+    @staticmethod
+    def is_ip(host):
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+    
+    @staticmethod
+    def _done(value):
+        future = Future()
+        future.set_result(value)
+        return future
+    
+    def submit(self, host):
+        """提交解析，返回结果为IP(失败为None)的Future；同一主机只解析一次"""
+        if not host or self.is_ip(host):
+            return self._done(host or None)
+        
+        with self.lock:
+            cached = self.cache.get(host)
+            if cached is not None and cached[1] > time.time():
+                self.hits += 1
+                return self._done(cached[0])
+            
+            future = self.inflight.get(host)
+            if future is None:
+                future = self.inflight[host] = self.executor.submit(self._lookup, host)
+            else:
+                self.hits += 1
+            return future
+    
+    def _lookup(self, host):
+        start_ns = time.perf_counter_ns()
+        ip = None
+        try:
+            infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+            # 优先IPv4
+            infos.sort(key=lambda info: info[0] != socket.AF_INET)
+            ip = infos[0][4][0] if infos else None
+        except (OSError, UnicodeError):
+            ip = None
+        elapsed = (time.perf_counter_ns() - start_ns) / 1e6
+        
+        with self.lock:
+            self.lookups += 1
+            self.total_ms += elapsed
+            if ip is None:
+                self.failures += 1
+            self.cache[host] = (ip, time.time() + (self.ttl if ip else self.negative_ttl), elapsed)
+            self.inflight.pop(host, None)
+        return ip
+    
+    def resolve(self, host, timeout=None):
+        """阻塞解析，返回IP或None；超过timeout(秒)仍未完成也返回None，解析在后台继续并写入缓存"""
+        try:
+            return self.submit(host).result(timeout=timeout)
+        except FutureTimeoutError:
+            return None
+    
+    async def resolve_async(self, host, timeout=None):
+        """resolve的协程版本；同一主机的Future由多个节点共享，超时不取消它"""
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self.submit(host))), timeout)
+        except asyncio.TimeoutError:
+            return None
+    
+    def elapsed(self, host):
+        """主机的解析耗时(ms)：IP字面量为0，尚未解析为None"""
+        if not host or self.is_ip(host):
+            return 0.0
+        with self.lock:
+            cached = self.cache.get(host)
+        return cached[2] if cached else None
+    
+    def summary(self):
+        """解析统计"""
+        with self.lock:
+            return {
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'failures': self.failures,
+                'avg_ms': self.total_ms / self.lookups if self.lookups else 0,
+            }
+
+# ═══════════════════════════════════════════════════════════════
+# 端点去重
+# ═══════════════════════════════════════════════════════════════
+
+class EndpointIndex:
+    """探测端点索引 - 相同(主机, 端口, SNI, 传输)的节点只探测一次，结果分发给组内所有节点"""
+    
+    PROBE = 'probe'      # 新端点，需要探测
+    PENDING = 'pending'  # 端点探测中，等待结果
+    DONE = 'done'        # 端点已有结果
+    
+    PHASES = ('dns_ms', 'tcp_ms', 'tls_ms', 'tls_resumed_ms', 'udp_ms')  # 分段耗时字段
+    SHARED = PHASES + ('timed_out',)  # 分发给同端点节点的字段
+    
+    def __init__(self):
+        self.pending = {}  # 端点 -> 等待结果的节点
+        self.results = {}  # 端点 -> (延迟, 分段耗时)
+        self.probed = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def probe_key(info):
+        """探测键"""
+        return (info['server'].lower(), info['port'], info.get('sni') or '', info.get('transport', 'tls'))
+    
+    def add(self, info):
+        """登记节点，返回 (状态, 已有延迟)"""
+        key = self.probe_key(info)
+        with self.lock:
+            if key in self.results:
+                latency, phases = self.results[key]
+                info.update(phases)
+                return self.DONE, latency
+            
+            followers = self.pending.get(key)
+            if followers is not None:
+                followers.append(info)
+                return self.PENDING, None
+            
+            self.pending[key] = []
+            self.probed += 1
+            return self.PROBE, None
+    
+    def complete(self, info, latency):
+        """记录端点结果（含分段耗时），返回共享该结果的所有节点"""
+        key = self.probe_key(info)
+        phases = {field: info[field] for field in self.SHARED if field in info}
+        with self.lock:
+            self.results[key] = (latency, phases)
+            followers = self.pending.pop(key, [])
+        for follower in followers:
+            follower.update(phases)
+        return [info] + followers
+
+# ═══════════════════════════════════════════════════════════════
+# 延迟历史
+# ═══════════════════════════════════════════════════════════════
+
+class LatencyHistory:
+    """延迟历史库(SQLite) - 记录每次端点探测，支持增量复测"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS probes (
+            key TEXT NOT NULL,
+            ts REAL NOT NULL,
+            latency_ms REAL,
+            connect_ms REAL,
+            tls_ms REAL,
+            ok INTEGER NOT NULL
+        )
+    """
+    
+    def __init__(self, path='latency_history.db', flush_size=500):
+        self.path = path
+        self.flush_size = flush_size
+        self.conn = None
+        self.pending = []
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def node_key(info):
+        """节点键：与端点去重使用同一探测键"""
+        return '|'.join(str(part) for part in EndpointIndex.probe_key(info))
+    
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.execute(self.SCHEMA)
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_probes_key_ts ON probes (key, ts)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_probes_ts ON probes (ts)')  # 增量复测按时间窗口扫描
+        return self.conn
+    
+    def record(self, info, latency):
+        """记录一次探测，累积到flush_size后批量写入"""
+        row = (self.node_key(info), time.time(), latency, info.get('tcp_ms'), info.get('tls_ms'),
+               1 if latency is not None else 0)
+        with self.lock:
+            self.pending.append(row)
+            if len(self.pending) >= self.flush_size:
+                self._flush_locked()
+    
+    def flush(self):
+        """写入所有待保存记录"""
+        with self.lock:
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        if not self.pending:
+            return
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    'INSERT INTO probes (key, ts, latency_ms, connect_ms, tls_ms, ok) VALUES (?, ?, ?, ?, ?, ?)',
+                    self.pending
+                )
+        except sqlite3.Error:
+            pass
+        self.pending.clear()
+    
+    def recent_successes(self, window):
+        """窗口期内最近一次探测成功的端点 {节点键: 延迟}"""
+        latest = {}
+        try:
+            with self.lock:
+                rows = self._connect().execute(
+                    'SELECT key, latency_ms, ok FROM probes WHERE ts >= ? ORDER BY ts',
+                    (time.time() - window,)
+                ).fetchall()
+        except sqlite3.Error:
+            return {}
+        
+        for key, latency, ok in rows:
+            latest[key] = latency if ok else None
+        return {key: latency for key, latency in latest.items() if latency is not None}
+    
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+# ═══════════════════════════════════════════════════════════════
+# 断点续测
+# ═══════════════════════════════════════════════════════════════
+
+class CheckpointJournal:
+    """断点续测日志 - 追加记录每个已测节点及结果，分批刷盘"""
+    
+    def __init__(self, path='node_journal.jsonl', flush_size=200):
+        self.path = path
+        self.flush_size = flush_size
+        self.file = None
+        self.pending = []
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def digest(raw):
+        """节点标识：原始链接的短哈希"""
+        return hashlib.blake2b(raw.encode('utf-8'), digest_size=8).hexdigest()
+    
+    def exists(self):
+        return os.path.exists(self.path)
+    
+    def replay(self):
+        """逐条读取已有日志，跳过损坏的行（如中断时写了一半）"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except OSError:
+            return
+    
+    def open(self, resume=False):
+        """续测时追加，否则重新开始"""
+        self.file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+    
+    def append(self, info, latency, outcome):
+        """记录一个已测节点及其分类(ok/slow/unreachable)；可用节点保存完整信息以便恢复，失败节点只记分类"""
+        entry = {'h': self.digest(info['raw'])}
+        if outcome != 'ok':
+            entry['f'] = outcome
+        else:
+            entry.update(raw=info['raw'], name=info.get('name', ''), latency=round(latency, 1))
+            for phase in EndpointIndex.PHASES:
+                if info.get(phase) is not None:
+                    entry[phase] = round(info[phase], 2)
+        
+        with self.lock:
+            self.pending.append(json.dumps(entry, ensure_ascii=False))
+            if len(self.pending) >= self.flush_size:
+                self._flush_locked()
+    
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        if self.file is None or not self.pending:
+            return
+        try:
+            self.file.write('\n'.join(self.pending) + '\n')
+            self.file.flush()
+        except (OSError, ValueError):
+            pass
+        self.pending.clear()
+    
+    def remove(self):
+        """测试正常完成后删除日志"""
+        with self.lock:
+            self.pending.clear()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+# ═══════════════════════════════════════════════════════════════
+# 自适应并发
+# ═══════════════════════════════════════════════════════════════
+
+class AdaptiveConcurrency:
+    """自适应并发控制(AIMD) - 依据成功率、握手延迟漂移与资源错误实时调整在途探测数"""
+    
+    # 本机资源耗尽类错误（不是节点的问题）
+    RESOURCE_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.EADDRNOTAVAIL, errno.ENOBUFS, errno.ENOMEM}
+    
+    def __init__(self, initial, minimum=4, maximum=512, window=64,
+                 increase=4, decrease=0.7, latency_tolerance=1.5):
+        self.minimum = max(int(minimum), 1)
+        self.maximum = max(int(maximum), self.minimum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.window = window
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        
+        self.in_flight = 0
+        self.cond = threading.Condition()
+        
+        # 当前窗口
+        self.count = 0
+        self.samples = []
+        self.resource_errors = 0
+        
+        # 基线
+        self.baseline_latency = None
+        self.baseline_success = None
+        self.total_resource_errors = 0
+    
+    def current(self):
+        return int(self.limit)
+    
+    def acquire(self):
+        """线程引擎：等待在途数低于当前上限"""
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait(0.1)
+            self.in_flight += 1
+    
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify()
+    
+    def on_error(self, error):
+        """记录探测异常，只关心本机资源耗尽"""
+        if getattr(error, 'errno', None) in self.RESOURCE_ERRNOS:
+            with self.cond:
+                self.resource_errors += 1
+                self.total_resource_errors += 1
+    
+    def on_sample(self, latency):
+        """记录一次探测结果，每满一个窗口调整一次上限"""
+        with self.cond:
+            self.count += 1
+            if latency is not None:
+                self.samples.append(latency)
+            
+            if self.count >= self.window:
+                self._adjust()
+                self.count = 0
+                self.samples = []
+                self.resource_errors = 0
+                self.cond.notify_all()
+    
+    def _adjust(self):
+        success_rate = len(self.samples) / self.count
+        median = statistics.median(self.samples) if self.samples else None
+        
+        if self.resource_errors:
+            # 文件描述符/端口耗尽：立即大幅回退
+            self.limit = max(self.minimum, self.limit * self.decrease * self.decrease)
+        elif median and self.baseline_latency and median > self.baseline_latency * self.latency_tolerance:
+            # 握手延迟被自身负载推高
+            self.limit = max(self.minimum, self.limit * self.decrease)
+        elif self.baseline_success and success_rate < self.baseline_success * 0.5:
+            # 成功率骤降（超时风暴/连接被拒）
+            self.limit = max(self.minimum, self.limit * self.decrease)
+        else:
+            self.limit = min(self.maximum, self.limit + self.increase)
+        
+        # 延迟基线取历史窗口中位数的低点，允许缓慢上浮
+        if median:
+            self.baseline_latency = median if self.baseline_latency is None else min(median, self.baseline_latency * 1.02)
+        self.baseline_success = success_rate if self.baseline_success is None else self.baseline_success * 0.9 + success_rate * 0.1
+
+# ═══════════════════════════════════════════════════════════════
+# 套接字预算
+# ═══════════════════════════════════════════════════════════════
+
+class SocketBudget:
+    """套接字资源预算 - 提升文件描述符上限、限制在途套接字、RST关闭与源地址轮换"""
+    
+    def __init__(self, reserve=64, max_sockets=0, source_addresses=None, rst_close=True, retries=2):
+        self.rst_close = rst_close
+        self.retries = retries
+        self.fd_before, self.fd_limit = self.raise_fd_limit()
+        
+        # 预留部分描述符给DNS线程、日志、数据库等
+        capacity = self.fd_limit - reserve if self.fd_limit else 4096
+        if max_sockets:
+            capacity = min(capacity, max_sockets)
+        self.capacity = max(capacity, 16)
+        
+        # 源地址按地址族轮换
+        v4 = [addr for addr in source_addresses or [] if ':' not in addr]
+        v6 = [addr for addr in source_addresses or [] if ':' in addr]
+        self.sources = {
+            socket.AF_INET: itertools.cycle(v4) if v4 else None,
+            socket.AF_INET6: itertools.cycle(v6) if v6 else None,
+        }
+        
+        self.exhausted = 0  # 本机资源耗尽次数（不计入节点失败）
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def raise_fd_limit(target=65536):
+        """把软上限提升到硬上限(最多target)，返回 (原软上限, 当前软上限)"""
+        if resource is None:
+            return None, None
+        try:
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        except (ValueError, OSError):
+            return None, None
+        
+        if soft == resource.RLIM_INFINITY:
+            return soft, target
+        wanted = target if hard == resource.RLIM_INFINITY else min(target, hard)
+        
+        # macOS的内核上限(OPEN_MAX)低于硬上限时setrlimit会失败，退一步再试
+        for limit in (wanted, min(wanted, 10240)):
+            if limit <= soft:
+                break
+            try:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+                return soft, limit
+            except (ValueError, OSError):
+                continue
+        return soft, soft
+    
+    def cap(self, concurrency):
+        """把并发数限制在套接字预算内（每个工作者同时最多持有一个套接字）"""
+        return max(min(int(concurrency), self.capacity), 1)
+    
+    def source_for(self, host):
+        """轮换选取与目标同地址族的源地址，未配置时返回None"""
+        family = socket.AF_INET6 if ':' in str(host) else socket.AF_INET
+        sources = self.sources[family]
+        return (next(sources), 0) if sources else None
+    
+    def prepare(self, sock):
+        """SO_LINGER=0：关闭时直接发RST，不留TIME_WAIT占用本地端口"""
+        if self.rst_close and sock is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            except OSError:
+                pass
+    
+    def connect(self, host, port, timeout):
+        """建立探测用TCP连接"""
+        sock = socket.create_connection((host, port), timeout=timeout, source_address=self.source_for(host))
+        self.prepare(sock)
+        return sock
+    
+    def is_exhaustion(self, error):
+        """是否为本机资源耗尽（描述符/端口/缓冲区），是则计数"""
+        if getattr(error, 'errno', None) not in AdaptiveConcurrency.RESOURCE_ERRNOS:
+            return False
+        with self.lock:
+            self.exhausted += 1
+        return True
+
+# ═══════════════════════════════════════════════════════════════
+# 排行榜
+# ═══════════════════════════════════════════════════════════════
+
+class Leaderboard:
+    """实时排行榜 - 有界堆只保留延迟最低的size个节点，并统计达标节点数
+    
+    主线程(调度/回放)、订阅线程(直接探测)与UI线程共用，堆与计数都在内部锁下读写
+    """
+    
+    def __init__(self, size, target_latency):
+        self.size = size
+        self.target_latency = target_latency
+        self.heap = []  # (-延迟, 序号, 节点)：堆顶是榜内最慢的节点
+        self.counter = itertools.count()
+        self.qualified = 0  # 延迟不超过target_latency的节点数
+        self.lock = threading.Lock()
+    
+    def offer(self, info):
+        """提交一个可用节点，返回是否已找到足够的达标节点"""
+        latency = info['latency']
+        with self.lock:
+            if latency <= self.target_latency:
+                self.qualified += 1
+            
+            entry = (-latency, next(self.counter), info)
+            if len(self.heap) < self.size:
+                heapq.heappush(self.heap, entry)
+            elif latency < -self.heap[0][0]:
+                heapq.heapreplace(self.heap, entry)
+            return self.qualified >= self.size
+    
+    def reached(self):
+        """是否已找到足够的达标节点"""
+        with self.lock:
+            return self.qualified >= self.size
+    
+    def best(self, count=None):
+        """按延迟升序返回榜内节点"""
+        with self.lock:
+            entries = list(self.heap)
+        ranked = [entry[2] for entry in sorted(entries, key=lambda entry: (-entry[0], entry[1]))]
+        return ranked[:count] if count else ranked
+
+# ═══════════════════════════════════════════════════════════════
+# 紧凑节点记录
+# ═══════════════════════════════════════════════════════════════
+
+class NodeRecord:
+    """紧凑节点记录 - __slots__代替每节点一个dict，主机名/协议/传输层驻留为共享字符串；
+    保留 info['键'] / info.get / '键' in info / info.update 的dict式用法，未赋值的字段视为不存在"""
+    
+    FIELDS = ('raw', 'server', 'port', 'name', 'sni', 'protocol', 'transport', 'alpn', 'strategy',
+              'dns_ms', 'tcp_ms', 'tls_ms', 'tls_resumed_ms', 'udp_ms', 'timed_out', 'latency')
+    KEYS = frozenset(FIELDS)
+    __slots__ = FIELDS
+    
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            self[key] = value
+    
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def __setitem__(self, key, value):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
+    
+    def __contains__(self, key):
+        return key in self.KEYS and hasattr(self, key)
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def update(self, fields):
+        for key, value in fields.items():
+            self[key] = value
+    
+    def __getstate__(self):
+        return {key: getattr(self, key) for key in self.FIELDS if hasattr(self, key)}
+    
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+# ═══════════════════════════════════════════════════════════════
+# 结果落盘
+# ═══════════════════════════════════════════════════════════════
+
+class ResultSink:
+    """增量结果落盘 - 可用节点到达时按延迟档位追加到各档溢写文件；
+    检查点与结束时逐档排序合并出结果文件（写临时文件后原子替换），结束后删除溢写文件"""
+    
+    TIERS = [
+        (0, 50, "极速节点 (0-50ms)"),
+        (50, 100, "优质节点 (50-100ms)"),
+        (100, 200, "良好节点 (100-200ms)"),
+        (200, 300, "普通节点 (200-300ms)"),
+        (300, 500, "备用节点 (300-500ms)")
+    ]
+    
+    def __init__(self, prefix='node_spill', merge_interval=10):
+        self.paths = [f"{prefix}.{index}.jsonl" for index in range(len(self.TIERS))]
+        self.files = [None] * len(self.TIERS)
+        self.count = 0  # 收到的可用节点数（含不在任何档位的）
+        self.closed = False
+        self.merge_interval = merge_interval  # 检查点重新合并中间结果文件的最短间隔(秒)
+        self.last_merge = 0.0
+        self.lock = threading.Lock()
+    
+    @classmethod
+    def tier(cls, latency):
+        """延迟所在档位下标，超出全部档位时为None"""
+        for index, (low, high, _) in enumerate(cls.TIERS):
+            if low <= latency < high:
+                return index
+        return None
+    
+    def append(self, latency, comment, raw):
+        """追加一个可用节点到所在档位的溢写文件（首次写入时截断，上次运行的残留应先用recover()合并）"""
+        with self.lock:
+            if self.closed:
+                return
+            self.count += 1
+            index = self.tier(latency)
+            if index is None:
+                return
+            if self.files[index] is None:
+                self.files[index] = open(self.paths[index], 'w', encoding='utf-8')
+            self.files[index].write(json.dumps([latency, comment, raw], ensure_ascii=False) + '\n')
+    
+    def checkpoint(self, path, header):
+        """检查点：刷新溢写文件并合并出中间结果文件(node_temp.txt)
+        
+        每次合并都要重读并排序全部溢写文件，开销与已有结果总数成正比；
+        因此间隔不足merge_interval时只刷新，溢写文件本身已完整，异常退出后由recover()恢复
+        """
+        with self.lock:
+            if self.closed:
+                return
+            for f in self.files:
+                if f is not None:
+                    f.flush()
+            now = time.monotonic()
+            if now - self.last_merge < self.merge_interval:
+                return
+            self.write(path, header, self._read_tiers(f is not None for f in self.files))
+            self.last_merge = now
+    
+    def finish(self, path, header):
+        """逐档读取溢写文件并排序，合并写出最终文件后删除溢写文件；之后到达的结果不再写入"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            
+            opened = [f is not None for f in self.files]
+            for f in self.files:
+                if f is not None:
+                    f.close()
+            self.write(path, header, self._read_tiers(opened))
+            self._remove(opened)
+    
+    def recover(self, path):
+        """把上次未正常结束的运行残留的溢写文件合并到path（开始写入前调用），返回恢复的节点数
+        
+        恢复的节点不并入本次结果：path应是本次运行不会再写的独立文件
+        """
+        with self.lock:
+            leftover = [os.path.exists(spill) and f is None for spill, f in zip(self.paths, self.files)]
+            if not any(leftover):
+                return 0
+            tiers = self._read_tiers(leftover)
+            count = sum(len(entries) for entries in tiers)
+            if count:
+                self.write(path, [
+                    f"# 上次未完成运行的可用节点 (共 {count} 个)\n",
+                    f"# 恢复时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n",
+                    "#" + "="*50 + "\n\n",
+                ], tiers)
+            self._remove(leftover)
+            return count
+    
+    def _read_tiers(self, selected):
+        """读取选中档位的溢写文件并按延迟排序；崩溃时写了一半的末行跳过"""
+        tiers = []
+        for spill, chosen in zip(self.paths, selected):
+            entries = []
+            if chosen:
+                with open(spill, encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            pass
+                entries.sort(key=lambda entry: entry[0])
+            tiers.append(entries)
+        return tiers
+    
+    def _remove(self, selected):
+        for spill, chosen in zip(self.paths, selected):
+            if chosen:
+                try:
+                    os.remove(spill)
+                except OSError:
+                    pass
+    
+    @classmethod
+    def group(cls, entries):
+        """(延迟, 注释, 链接) 按延迟排序后分到各档位"""
+        tiers = [[] for _ in cls.TIERS]
+        for entry in sorted(entries, key=lambda entry: entry[0]):
+            index = cls.tier(entry[0])
+            if index is not None:
+                tiers[index].append(entry)
+        return tiers
+    
+    @classmethod
+    def write(cls, path, header, tiers):
+        """写临时文件后原子替换，读者不会看到写了一半的结果文件"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(header)
+            for (_, _, group_name), entries in zip(cls.TIERS, tiers):
+                if entries:
+                    f.write(f"# {group_name} - {len(entries)} 个\n")
+                    f.write("#" + "-"*50 + "\n")
+                    for _, comment, raw in entries:
+                        f.write(f"# {comment}\n")
+                        f.write(f"{raw}\n")
+                    f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+# ═══════════════════════════════════════════════════════════════
+# 流式导出
+# ═══════════════════════════════════════════════════════════════
+
+class ResultExporter:
+    """流式结果导出 - 每个结果到达即追加：JSON Lines / CSV 一行一个节点，订阅文件为base64编码的链接列表；
+    按行刷新到磁盘，长时间运行时下游工具可以边测边读"""
+    
+    FILES = {'json': 'node.jsonl', 'csv': 'node.csv', 'sub': 'node_sub.txt'}
+    COLUMNS = ('time', 'name', 'protocol', 'transport', 'strategy', 'server', 'port', 'latency',
+               'dns_ms', 'tcp_ms', 'tls_ms', 'tls_resumed_ms', 'udp_ms', 'raw')
+    
+    def __init__(self, formats):
+        self.formats = [fmt for fmt in self.FILES if fmt in formats]
+        self.files = {}
+        self.csv = None
+        self.pending = b''  # base64按3字节一组编码，不足一组的尾部留到下次
+        self.lock = threading.Lock()
+    
+    def open(self):
+        for fmt in self.formats:
+            if fmt == 'sub':
+                self.files[fmt] = open(self.FILES[fmt], 'wb')
+            else:
+                self.files[fmt] = open(self.FILES[fmt], 'w', encoding='utf-8', newline='', buffering=1)
+        if 'csv' in self.files:
+            self.csv = csv.writer(self.files['csv'], lineterminator='\n')
+            self.csv.writerow(self.COLUMNS)
+    
+    @staticmethod
+    def row(node):
+        """单个可用节点的完整探测信息"""
+        phase = lambda key: round(node[key], 2) if node.get(key) is not None else None
+        return {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'name': node.get('name', ''),
+            'protocol': node.get('protocol', ''),
+            'transport': node.get('transport', ''),
+            'strategy': node.get('strategy', ''),
+            'server': node.get('server', ''),
+            'port': node.get('port', 0),
+            'latency': phase('latency'),
+            'dns_ms': phase('dns_ms'),
+            'tcp_ms': phase('tcp_ms'),
+            'tls_ms': phase('tls_ms'),
+            'tls_resumed_ms': phase('tls_resumed_ms'),
+            'udp_ms': phase('udp_ms'),
+            'raw': node['raw'],
+        }
+    
+    def write(self, node):
+        """追加一个可用节点"""
+        if not self.formats:
+            return
+        row = self.row(node)
+        with self.lock:
+            if not self.files:
+                return
+            if 'json' in self.files:
+                self.files['json'].write(json.dumps(row, ensure_ascii=False) + '\n')
+            if self.csv is not None:
+                self.csv.writerow([row[column] for column in self.COLUMNS])
+            if 'sub' in self.files:
+                data = self.pending + (row['raw'] + '\n').encode('utf-8')
+                cut = len(data) - len(data) % 3
+                self.files['sub'].write(base64.b64encode(data[:cut]))
+                self.files['sub'].flush()
+                self.pending = data[cut:]
+    
+    def close(self):
+        """写出订阅文件的base64尾部并关闭全部文件，返回导出的文件名"""
+        with self.lock:
+            if 'sub' in self.files and self.pending:
+                self.files['sub'].write(base64.b64encode(self.pending))
+                self.pending = b''
+            for f in self.files.values():
+                f.close()
+            paths = [self.FILES[fmt] for fmt in self.files]
+            self.files = {}
+            self.csv = None
+        return paths
+
+# ═══════════════════════════════════════════════════════════════
+# 可视化节点测速类
+# ═══════════════════════════════════════════════════════════════
+
+class VisualNodeTester:
+    # 探测策略：先按协议，未登记的协议按传输层
+    PROTOCOL_STRATEGIES = {'ss': 'tcp', 'hy2': 'quic', 'hysteria2': 'quic'}
+    TRANSPORT_STRATEGIES = {'tls': 'tls', 'tcp': 'tcp', 'udp': 'quic'}
+    
+    def __init__(self, config=None):
+        optimal_workers = SystemResourceManager.get_optimal_thread_count()
+        
+        self.config = {
+            'timeout': 3,
+            'max_workers': optimal_workers,
+            'max_latency': 500,
+            'submit_window': 0,  # 线程引擎在途任务窗口(与增量窗口--window无关)，0=线程池大小的2倍
+            'max_nodes': 100000,
+            'save_interval': 5000,
+            'visual_mode': True,  # 可视化模式
+            'update_interval': 0.5,  # UI更新间隔
+            'engine': 'thread',  # 探测引擎: thread / async
+            'async_concurrency': 1000,  # async引擎并发握手数
+            'processes': 1,  # 分片进程数，>1时启用多进程
+            'queue_depth': 5000,  # 解析→探测队列深度
+            'fetch_timeout': 5,  # 订阅下载超时
+            'fetch_in_flight': 32,  # 订阅下载全局并发
+            'fetch_per_host': 4,  # 单主机并发
+            'use_cache': True,  # 订阅磁盘缓存（条件请求）
+            'cache_dir': 'subscribe_cache',
+            'cache_ttl': 0,  # 缓存有效期(秒)，0=每次都发条件请求
+            'offline': False,  # 离线模式：只使用缓存
+            'dns_workers': 32,  # DNS解析并发
+            'dns_ttl': 300,  # DNS缓存有效期(秒)
+            'dns_negative_ttl': 30,  # 解析失败缓存有效期(秒)
+            'history': True,  # 记录延迟历史(SQLite)
+            'history_db': 'latency_history.db',
+            'incremental': False,  # 增量模式：跳过窗口期内已成功探测的端点
+            'incremental_window': 3600,  # 增量窗口(秒)
+            'journal': 'node_journal.jsonl',  # 断点续测日志
+            'resume': False,  # 从日志恢复上次中断的测试
+            'adaptive': True,  # 自适应并发(AIMD)，max_workers为初始值
+            'max_concurrency': 256,  # 线程引擎自适应上限
+            'max_sockets': 0,  # 在途套接字上限，0=按文件描述符上限
+            'fd_reserve': 64,  # 为非探测用途预留的描述符
+            'source_addresses': [],  # 轮换使用的本地源地址
+            'rst_close': True,  # 探测连接以RST关闭，不留TIME_WAIT
+            'tls_min_version': 'TLSv1.2',  # 探测握手的最低TLS版本
+            'tls_resumption': False,  # 额外测量会话复用握手
+            'target': 0,  # 找到这么多达标节点后提前结束，0=测完全部
+            'target_latency': 0,  # 达标延迟(ms)，0=使用max_latency
+            'prioritize': True,  # 目标模式下按历史延迟优先探测
+            'strategy_timeouts': {'quic': 2},  # 各探测策略的超时(秒)，未配置的使用timeout
+            'deadline': True,  # 探测截止时间不超过 max_latency + 余量
+            'deadline_margin': 100,  # 截止余量(ms)
+            'histogram_json': '',  # 导出延迟直方图的JSON文件，空=不导出
+            'export': [],  # 边测边写的导出格式: json / csv / sub
+        }
+        
+        if config:
+            self.config.update(config)
+        
+        self.available_nodes = []
+        self.sink = ResultSink()  # 可用节点增量落盘
+        self.exporter = ResultExporter(self.config['export'])
+        self.total_nodes = 0
+        # 测试计数按线程分片：tested/success/failed，失败中再分 slow(过慢)/unreachable(不可达)
+        self.counters = ProbeCounters()
+        self.start_time = None
+        self.stop_flag = threading.Event()
+        self.interrupted = False  # 收到SIGINT/SIGTERM
+        self.histogram_exported = False  # 延迟直方图是否已成功导出
+        self.lock = threading.Lock()
+        self.actual_workers = 0
+        self.runner = None  # 多进程分片调度器
+        self.controller = None
+        self.budget = SocketBudget(
+            reserve=self.config['fd_reserve'],
+            max_sockets=self.config['max_sockets'],
+            source_addresses=self.config['source_addresses'],
+            rst_close=self.config['rst_close']
+        )
+        self.tls = TLSProbe(self.config['tls_min_version'], self.config['tls_resumption'])
+        # 策略 -> (阻塞探测, asyncio探测)
+        self.strategies = {
+            'tcp': (self.probe_tcp, AsyncProbeEngine.tcp_timings),
+            'tls': (self.probe_tls, AsyncProbeEngine.tls_timings),
+            'quic': (self.probe_quic, AsyncProbeEngine.quic_timings),
+        }
+        self.top = None  # 目标模式排行榜
+        if self.config['target']:
+            self.top = Leaderboard(self.config['target'],
+                                   self.config['target_latency'] or self.config['max_latency'])
+        self.target_reached = False
+        self.priorities = None  # 端点 -> 历史延迟，用于排序探测队列
+        self.queue_seq = itertools.count()
+        self.sources_total = 0
+        self.sources_done = 0
+        self.ingest_done = threading.Event()
+        self.endpoints = EndpointIndex()
+        self.history = LatencyHistory(self.config['history_db']) if self.config['history'] else None
+        self.reusable = {}  # 增量模式下可复用的历史延迟
+        self.reused_endpoints = 0
+        self.journal = None
+        self.resumed = set()  # 续测时已测节点的标识
+        self.resolver = DNSResolver(
+            workers=self.config['dns_workers'],
+            ttl=self.config['dns_ttl'],
+            negative_ttl=self.config['dns_negative_ttl']
+        )
+        
+        # 订阅缓存与下载器
+        self.cache = None
+        if self.config['use_cache'] or self.config['offline']:
+            self.cache = SubscriptionCache(self.config['cache_dir'], self.config['cache_ttl'])
+        self.fetcher = SubscriptionFetcher(
+            timeout=self.config['fetch_timeout'],
+            max_in_flight=self.config['fetch_in_flight'],
+            per_host=self.config['fetch_per_host'],
+            cache=self.cache,
+            offline=self.config['offline']
+        )
+        
+        # 仪表盘
+        self.dashboard = Dashboard(update_interval=self.config['update_interval'])
+        
+        # 设置信号处理
+        signal.signal(signal.SIGINT, self.signal_handler)
+        signal.signal(signal.SIGTERM, self.signal_handler)
+    
+    @property
+    def tested_nodes(self):
+        return self.counters.total('tested')
+    
+    @property
+    def success_nodes(self):
+        return self.counters.total('success')
+    
+    @property
+    def failed_nodes(self):
+        return self.counters.total('failed')
+    
+    @property
+    def slow_nodes(self):
+        return self.counters.total('slow')
+    
+    @property
+    def unreachable_nodes(self):
+        return self.counters.total('unreachable')
+    
+    def signal_handler(self, signum, frame):
+        """处理中断信号：只设置停止标志，由run()在主流程中保存结果后退出
+        
+        信号处理函数在主线程上运行，主线程此时可能正持有日志/历史/导出的锁，在这里保存会死锁
+        """
+        if self.interrupted:
+            # 再次中断：不等待在途探测，直接退出（断点日志保留，可 --resume 继续）
+            UIComponents.show_cursor()
+            os._exit(130)
+        self.interrupted = True
+        self.stop_flag.set()
+    
+    def print_interrupted(self):
+        """中断退出时的简要统计"""
+        UIComponents.show_cursor()
+        print(f"\n\n{Colors.BRIGHT_YELLOW}⚠️  收到中断信号，已安全退出{Colors.RESET}")
+        print(f"{Colors.BRIGHT_GREEN}✅ 已保存当前结果{Colors.RESET}")
+        print(f"{Colors.BRIGHT_CYAN}📊 测试统计：{Colors.RESET}")
+        print(f"    • 总共测试: {self.tested_nodes:,} 个节点")
+        print(f"    • 发现可用: {self.success_nodes:,} 个节点")
+        print(f"    • 成功率: {(self.success_nodes/max(self.tested_nodes,1)*100):.1f}%")
+    
+    def read_subscribe_links(self, filename="subscribe.txt"):
+        """读取订阅链接"""
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                links = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+            return links
+        except FileNotFoundError:
+            print(f"{Colors.BRIGHT_RED}❌ 找不到文件 {filename}{Colors.RESET}")
+            print(f"{Colors.BRIGHT_YELLOW}📝 正在创建示例文件 {filename}...{Colors.RESET}")
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write("# 添加订阅链接，每行一个\n")
+                f.write("# 支持多种格式：vmess://, vless://, trojan://, ss://, hy2://\n")
+                f.write("# 也可以直接添加HTTP/HTTPS订阅链接\n")
+            return []
+    
+    def save_valid_subscribe_links(self, links, filename="subscribe.txt"):
+        """保存有效的订阅链接"""
+        try:
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write("# 有效的订阅链接\n")
+                f.write(f"# 更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+                for link in links:
+                    f.write(f"{link}\n")
+            print(f"{Colors.BRIGHT_GREEN}✅ 有效的订阅链接已保存回 {filename}{Colors.RESET}")
+        except Exception as e:
+            print(f"{Colors.BRIGHT_RED}❌ 保存有效订阅链接失败: {e}{Colors.RESET}")
+    
+    def nodes_from_fetch(self, link, result):
+        """从下载结果逐个产出节点：命中缓存逐行读取，否则流式解码正文并同步写入缓存"""
+        if result['nodes'] is not None:
+            yield from result['nodes']
+            return
+        body = result['body']
+        if body is None:
+            return
+        
+        try:
+            nodes = SubscriptionDecoder.iter_file(body)
+            if self.cache is not None and result['status'] == 200:
+                nodes = self.cache.tee(link, result['etag'], result['last_modified'], nodes)
+            yield from nodes
+        except Exception:
+            pass
+        finally:
+            body.close()
+    
+    def decode_subscribe_fast(self, link):
+        """解码单个订阅条目，返回节点迭代器（HTTP订阅下载后流式解码，本地条目直接解码）"""
+        if link.startswith('http'):
+            result, elapsed = self.fetcher.timed_fetch(link)
+            return self.nodes_from_fetch(link, result)
+        return iter(SubscriptionDecoder.decode(link))
+    
+    def iter_subscriptions(self, links):
+        """产出 (链接, 节点迭代器)：本地条目先解码，HTTP订阅并发下载、按完成顺序产出；节点在消费时才逐块解码"""
+        http_links = [link for link in links if link.startswith('http')]
+        
+        for link in links:
+            if not link.startswith('http'):
+                yield link, self.decode_subscribe_fast(link)
+        
+        for link, result, elapsed in self.fetcher.fetch_all(http_links):
+            yield link, self.nodes_from_fetch(link, result)
+    
+    def ingest_subscriptions(self, links, node_queue):
+        """生产者：逐个解码订阅，按端点分组，新端点立即送入探测队列"""
+        seen = set()
+        valid_subscribe_links = []
+        
+        try:
+            for link, nodes in self.iter_subscriptions(links):
+                if self.stop_flag.is_set():
+                    return
                 
-                # 按延迟分组保存
-                groups = [
-                    (0, 50, "极速节点 (0-50ms)"),
-                    (50, 100, "优质节点 (50-100ms)"),
-                    (100, 200, "良好节点 (100-200ms)"),
-                    (200, 300, "普通节点 (200-300ms)"),
-                    (300, 500, "备用节点 (300-500ms)")
-                ]
+                valid = False
+                for node in nodes:
+                    # 节点流式产出，解出第一个节点即视为有效订阅
+                    if not valid:
+                        valid = True
+                        valid_subscribe_links.append(link)
+                    
+                    # 只保存哈希，去重集合不持有节点字符串
+                    key = hash(node)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    
+                    # 续测时跳过日志中已测的节点
+                    if self.resumed and CheckpointJournal.digest(node) in self.resumed:
+                        continue
+                    
+                    # 只有生产者线程写入
+                    self.total_nodes += 1
+                    
+                    info = self.parse_node_minimal(node)
+                    if not (info['server'] and info['port']):
+                        self.finish_node(info, None)
+                        continue
+                    
+                    # 同一端点只探测一次
+                    state, latency = self.endpoints.add(info)
+                    if state == EndpointIndex.DONE:
+                        self.finish_node(info, latency)
+                        continue
+                    if state == EndpointIndex.PENDING:
+                        continue
+                    
+                    # 增量模式：复用窗口期内的成功结果
+                    if self.reusable:
+                        latency = self.reusable.get(LatencyHistory.node_key(info))
+                        if latency is not None:
+                            self.reused_endpoints += 1
+                            self.complete_probe(info, latency, record=False)
+                            continue
+                    
+                    # 新端点立即开始解析，探测时直接使用解析结果
+                    if self.config['processes'] <= 1:
+                        self.resolver.submit(info['server'])
+                    
+                    while not self.stop_flag.is_set():
+                        try:
+                            node_queue.put(self.queue_item(info), timeout=0.5)
+                            break
+                        except queue.Full:
+                            continue
                 
-                for min_lat, max_lat, group_name in groups:
-                    group_nodes = [n for n in self.available_nodes 
-                                   if min_lat <= n.get('latency', 999999) < max_lat]
-                    if group_nodes:
-                        f.write(f"# {group_name} - {len(group_nodes)} 个\n")
-                        f.write("#" + "-"*50 + "\n")
-                        for node in group_nodes:
-                            f.write(f"# {node.get('name', 'Unknown')} - {node.get('latency', 0):.0f}ms\n")
-                            f.write(f"{node['raw']}\n")
-                        f.write("\n")
+                self.sources_done += 1
+            
+            # 离线模式下未缓存的订阅并非失效，不回写订阅文件
+            if not self.config['offline']:
+                self.save_valid_subscribe_links(valid_subscribe_links)
+        finally:
+            self.ingest_done.set()
+            try:
+                node_queue.put(self.queue_item(None), timeout=1)
+            except queue.Full:
+                pass
+    
+    def queue_item(self, info):
+        """探测队列条目：优先模式下按历史延迟排序（无历史的排在后面，结束标记最后）"""
+        if self.priorities is None:
+            return info
+        if info is None:
+            return (float('inf'), next(self.queue_seq), None)
+        priority = self.priorities.get(LatencyHistory.node_key(info), 1e9)
+        return (priority, next(self.queue_seq), info)
+    
+    def drain_queue(self, node_queue):
+        """消费者：从探测队列逐个取出节点，直到生产者结束"""
+        while not self.stop_flag.is_set():
+            try:
+                node = node_queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.ingest_done.is_set() and node_queue.empty():
+                    return
+                continue
+            
+            if isinstance(node, tuple):
+                node = node[2]
+            if node is None:
+                return
+            yield node
+    
+    def test_stream(self, stream):
+        """流式测试：两种引擎都惰性消费节点流，单个长期存在的调度器跑完全程"""
+        self.probe_all(stream, self.complete_probe)
+    
+    def parse_node_minimal(self, node):
+        """最小化节点解析"""
+        info = NodeRecord(raw=node, server='', port=0, name='', sni='', protocol='', transport='tls')
+        
+        try:
+            if node.startswith('vmess://'):
+                info['protocol'] = 'vmess'
+                encoded = node[8:]
+                decoded = base64.b64decode(encoded + '=' * (4 - len(encoded) % 4)).decode('utf-8')
+                data = json.loads(decoded)
+                info['server'] = sys.intern(data.get('add', ''))
+                info['port'] = int(data.get('port', 0))
+                info['name'] = data.get('ps', '')[:30]
+                info['sni'] = sys.intern(data.get('sni', ''))
+                info['alpn'] = sys.intern(data.get('alpn', ''))
+                info['transport'] = 'tls' if data.get('tls') == 'tls' else 'tcp'
+            elif node.startswith(('vless://', 'trojan://', 'ss://', 'hy2://', 'hysteria2://')):
+                parsed = urllib.parse.urlparse(node)
+                info['protocol'] = sys.intern(parsed.scheme)
+                info['server'] = sys.intern(parsed.hostname or '')
+                info['port'] = parsed.port or 443
+                
+                # SNI与传输层
+                params = urllib.parse.parse_qs(parsed.query)
+                info['sni'] = sys.intern((params.get('sni') or params.get('peer') or [''])[0])
+                info['alpn'] = sys.intern((params.get('alpn') or [''])[0])
+                if parsed.scheme in ('hy2', 'hysteria2'):
+                    info['transport'] = 'udp'
+                elif parsed.scheme == 'ss':
+                    info['transport'] = 'tcp'
+                else:
+                    default_security = 'tls' if parsed.scheme == 'trojan' else 'none'
+                    security = (params.get('security') or [default_security])[0]
+                    info['transport'] = 'tls' if security in ('tls', 'reality', 'xtls') else 'tcp'
+                
+                # 解析节点名称
+                if '#' in node:
+                    info['name'] = urllib.parse.unquote(node.split('#')[1])[:30]
+                else:
+                    info['name'] = f"{parsed.scheme}://{info['server']}"[:30]
+        except:
+            pass
+        
+        return info
+    
+    def connect_timed(self, host, port, timeout):
+        """建立探测用TCP连接并计时，返回 (套接字, 耗时ms)；本机资源耗尽时退避重试，其余错误原样抛出"""
+        for attempt in range(self.budget.retries + 1):
+            try:
+                start_ns = time.perf_counter_ns()
+                sock = self.budget.connect(host, port, timeout)
+                return sock, (time.perf_counter_ns() - start_ns) / 1e6
+            except OSError as e:
+                if self.controller is not None:
+                    self.controller.on_error(e)
+                if attempt == self.budget.retries or not self.budget.is_exhaustion(e):
+                    raise
+                # 本机资源耗尽不是节点的问题：退避后重试
+                time.sleep(0.1 * (attempt + 1))
+    
+    def probe_tcp(self, host, port, info, timeout):
+        """TCP策略(ss/无TLS的vless、vmess)：只计TCP建连，返回 {'tcp_ms'}"""
+        timings = {'tcp_ms': None}
+        try:
+            sock, timings['tcp_ms'] = self.connect_timed(host, port, timeout)
+            sock.close()
+        except Exception as e:
+            timings['timed_out'] = isinstance(e, AsyncProbeEngine.TIMEOUT_ERRORS)
+        return timings
+    
+    def probe_tls(self, host, port, info, timeout):
+        """TLS策略：通过TLS握手模拟GFW环境下的真实延迟，TCP连接与TLS握手分别计时(perf_counter_ns)
+        
+        返回 {'tcp_ms', 'tls_ms'}，未完成的阶段为None；会话复用模式另有 'tls_resumed_ms'
+        """
+        timings = {'tcp_ms': None, 'tls_ms': None}
+        sni = info.get('sni') or info['server'] or host
+        alpn = info.get('alpn', '')
+        session_key = (host, port, sni, alpn)
+        
+        try:
+            sock, timings['tcp_ms'] = self.connect_timed(host, port, timeout)
+            with sock:
+                # 建连与握手共用同一截止时间
+                sock.settimeout(max(timeout - timings['tcp_ms'] / 1000, 0.001))
+                ssock, timings['tls_ms'] = self.tls.handshake(sock, sni, alpn)
+                with ssock:
+                    self.tls.remember(session_key, ssock)
+            
+            if self.tls.resumption:
+                timings['tls_resumed_ms'] = self.tls.measure_resumed(
+                    lambda: self.budget.connect(host, port, timeout), session_key, sni, alpn)
+        except Exception as e:
+            timings['timed_out'] = isinstance(e, AsyncProbeEngine.TIMEOUT_ERRORS)
+        return timings
+    
+    def probe_quic(self, host, port, info, timeout):
+        """QUIC策略(hysteria2)：发送Initial探测包，返回版本协商往返时间 {'udp_ms'}"""
+        timings = {'udp_ms': None}
+        packet, scid = QUICProbe.initial_packet()
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        
+        try:
+            with socket.socket(family, socket.SOCK_DGRAM) as sock:
+                source = self.budget.source_for(host)
+                if source:
+                    sock.bind(source)
+                sock.connect((host, port))
+                
+                start_ns = time.perf_counter_ns()
+                deadline = start_ns + int(timeout * 1e9)
+                sock.send(packet)
+                
+                # 忽略无关数据报，直到收到版本协商包或超时
+                while True:
+                    remaining = (deadline - time.perf_counter_ns()) / 1e9
+                    if remaining <= 0:
+                        timings['timed_out'] = True
+                        break
+                    sock.settimeout(remaining)
+                    data = sock.recv(2048)
+                    if QUICProbe.is_version_negotiation(data, scid):
+                        timings['udp_ms'] = (time.perf_counter_ns() - start_ns) / 1e6
+                        break
+        except OSError as e:
+            # 超时或ICMP端口不可达
+            timings['timed_out'] = isinstance(e, AsyncProbeEngine.TIMEOUT_ERRORS)
+            if self.controller is not None:
+                self.controller.on_error(e)
+        return timings
+    
+    def probe_strategy(self, info):
+        """按协议、其次按传输层选择探测策略"""
+        return (self.PROTOCOL_STRATEGIES.get(info.get('protocol'))
+                or self.TRANSPORT_STRATEGIES.get(info.get('transport'), 'tls'))
+    
+    def strategy_timeout(self, strategy):
+        """策略超时(秒)，未单独配置时使用全局timeout
+        
+        截止模式下不超过 max_latency + 余量：超过max_latency的节点反正会被丢弃，不必等到timeout
+        """
+        timeout = self.config['strategy_timeouts'].get(strategy) or self.config['timeout']
+        if self.config['deadline']:
+            timeout = min(timeout, (self.config['max_latency'] + self.config['deadline_margin']) / 1000)
+        return timeout
+    
+    def classify(self, info, latency):
+        """探测结果分类：'ok' 可用，'slow' 超过max_latency或截止前未完成，'unreachable' 解析失败/连接被拒/不可达"""
+        if latency:
+            return 'ok' if latency <= self.config['max_latency'] else 'slow'
+        return 'slow' if info.get('timed_out') else 'unreachable'
+    
+    @staticmethod
+    def rank_latency(info):
+        """排序用延迟：TLS策略取TCP+TLS握手（会话可用的时间），TCP策略取建连，QUIC策略取UDP往返；失败为None"""
+        strategy = info.get('strategy', 'tls')
+        if strategy == 'tls':
+            if info.get('tcp_ms') is None or info.get('tls_ms') is None:
+                return None
+            return info['tcp_ms'] + info['tls_ms']
+        if strategy == 'tcp':
+            return info.get('tcp_ms')
+        return info.get('udp_ms')
+    
+    def apply_timings(self, info, timings):
+        """把分段耗时写入节点信息，返回排序用延迟"""
+        info.update(timings)
+        latency = self.rank_latency(info)
+        if self.controller is not None:
+            self.controller.on_sample(latency)
+        return latency
+    
+    def probe_node(self, node):
+        """探测单个节点（原始链接或已解析的节点信息），返回 (节点信息, 延迟)"""
+        info = node if isinstance(node, NodeRecord) else self.parse_node_minimal(node)
+        latency = None
+        if info['server'] and info['port']:
+            strategy = self.probe_strategy(info)
+            timeout = self.strategy_timeout(strategy)
+            # 解析等待同样受截止时间约束：解析卡住按不可达处理，不长期占用探测名额
+            ip = self.resolver.resolve(info['server'], timeout)
+            info['dns_ms'] = self.resolver.elapsed(info['server'])
+            if ip:
+                info['strategy'] = strategy
+                probe, _ = self.strategies[strategy]
+                latency = self.apply_timings(info, probe(ip, info['port'], info, timeout))
+        return info, latency
+    
+    async def probe_node_async(self, node, engine):
+        """探测单个节点（asyncio引擎）"""
+        info = node if isinstance(node, NodeRecord) else self.parse_node_minimal(node)
+        latency = None
+        if info['server'] and info['port']:
+            strategy = self.probe_strategy(info)
+            timeout = self.strategy_timeout(strategy)
+            ip = await self.resolver.resolve_async(info['server'], timeout)
+            info['dns_ms'] = self.resolver.elapsed(info['server'])
+            if ip:
+                info['strategy'] = strategy
+                _, probe_async = self.strategies[strategy]
+                timings = await probe_async(engine, ip, info['port'], info, timeout)
+                latency = self.apply_timings(info, timings)
+        return info, latency
+    
+    def process_node(self, node):
+        """处理单个节点"""
+        if self.stop_flag.is_set():
+            return None
+        
+        return self.record_result(*self.probe_node(node))
+    
+    def record_result(self, info, latency):
+        """记录单个节点的测试结果，可用时返回节点信息"""
+        outcome = self.classify(info, latency)
+        if outcome == 'ok':
+            info['latency'] = latency
+            self.counters.add('tested', 'success')
+            self.counters.record_latency(latency, info)
+            if self.top is not None:
+                self.offer_target(info)
+            return info
+        
+        self.counters.add('tested', 'failed', outcome)
+        return None
+    
+    def offer_target(self, info):
+        """目标模式：节点入榜，达标数量足够时停止调度新的探测"""
+        if self.top.offer(info) and not self.target_reached:
+            self.target_reached = True
+            self.stop_flag.set()
+    
+    def ui_update_thread(self):
+        """UI更新线程"""
+        while not self.stop_flag.is_set():
+            # 汇总各线程分片，探测线程不需要等待UI
+            totals = self.counters.totals()
+            self.dashboard.histogram = self.counters.histogram()
+            self.dashboard.set_recent_nodes(self.counters.recent(100))
+            self.dashboard.update_stats(
+                total=self.total_nodes,
+                tested=totals.get('tested', 0),
+                success=totals.get('success', 0),
+                failed=totals.get('failed', 0),
+                slow=totals.get('slow', 0),
+                unreachable=totals.get('unreachable', 0),
+                threads=self.controller.current() if self.controller else self.actual_workers,
+                sources_done=self.sources_done,
+                sources_total=self.sources_total,
+                dns=self.resolver.summary(),
+                target=(self.top.qualified, self.top.size, self.top.target_latency) if self.top else None,
+                leaders=self.top.best(3) if self.top else None
+            )
+            
+            if self.config['visual_mode']:
+                self.dashboard.render()
+            
+            time.sleep(self.config['update_interval'])
+    
+    def save_results(self, final=False):
+        """保存结果：检查点从溢写文件合并出 node_temp.txt，最终保存时合并出分组排序的 node.txt"""
+        if self.history is not None:
+            self.history.flush()
+        if self.journal is not None:
+            self.journal.flush()
+        if final:
+            for path in self.exporter.close():
+                print(f"{Colors.BRIGHT_GREEN}✅ 已导出测速结果到 {path}{Colors.RESET}")
+        
+        filename = 'node.txt' if final else 'node_temp.txt'
+        try:
+            if self.top is not None:
+                # 目标模式只保存排行榜内的节点（数量有上限，直接整体重写）
+                nodes = self.top.best()
+                if not nodes:
+                    return
+                ResultSink.write(filename, self.result_header(len(nodes)),
+                                 ResultSink.group(self.result_entry(node) for node in nodes))
+            elif not final:
+                self.sink.checkpoint(filename, self.result_header(self.sink.count))
+                return
+            else:
+                if not self.sink.count:
+                    return
+                self.sink.finish(filename, self.result_header(self.sink.count))
             
             if final:
+                # 结束统计按延迟展示最优节点
+                self.available_nodes.sort(key=lambda x: x.get('latency', 999999))
                 print(f"{Colors.BRIGHT_GREEN}✅ 结果已保存到 {filename}{Colors.RESET}")
         except Exception as e:
             print(f"{Colors.BRIGHT_RED}❌ 保存失败: {e}{Colors.RESET}")
     
-    def test_batch(self, nodes):
-        """批量测试节点"""
-        batch_results = []
+    def result_header(self, count):
+        """结果文件头部注释"""
+        return [
+            f"# 可用节点 (共 {count} 个)\n",
+            f"# 生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n",
+            f"# 测试统计: 总测试 {self.tested_nodes} 个，成功 {self.success_nodes} 个\n",
+            "#" + "="*50 + "\n\n",
+        ]
+    
+    def result_entry(self, node):
+        """落盘条目 (分组用延迟, 注释, 原始链接)"""
+        comment = f"{node.get('name', 'Unknown')} - {node.get('latency', 0):.0f}ms{self.format_phases(node)}"
+        return node.get('latency', 999999), comment, node['raw']
+    
+    @staticmethod
+    def format_phases(node):
+        """分段耗时注释，如 " (DNS 3.1 / TCP 40.2 / TLS 85.0 ms)"；无数据时为空"""
+        parts = [f"{label} {node[phase]:.1f}"
+                 for phase, label in (('dns_ms', 'DNS'), ('tcp_ms', 'TCP'), ('tls_ms', 'TLS'),
+                                      ('tls_resumed_ms', 'TLS复用'), ('udp_ms', 'UDP'))
+                 if node.get(phase) is not None]
+        return f" ({' / '.join(parts)} ms)" if parts else ""
+    
+    def collect_result(self, result):
+        """收集可用节点并定期保存"""
+        self.available_nodes.append(result)
+        self.exporter.write(result)
+        if self.top is None:
+            self.sink.append(*self.result_entry(result))
+        
+        # 定期保存
+        if len(self.available_nodes) % self.config['save_interval'] == 0:
+            self.save_results(final=False)
+    
+    def finish_node(self, info, latency):
+        """记录并收集单个节点"""
+        result = self.record_result(info, latency)
+        if result:
+            self.collect_result(result)
+        if self.journal is not None:
+            self.journal.append(info, latency, self.classify(info, latency))
+    
+    def resume_from_journal(self):
+        """回放断点日志，恢复可用节点与计数"""
+        for entry in self.journal.replay():
+            digest = entry.get('h')
+            if not digest or digest in self.resumed:
+                continue
+            self.resumed.add(digest)
+            
+            self.total_nodes += 1
+            if 'raw' in entry:
+                self.counters.add('tested', 'success')
+                node = NodeRecord(raw=entry['raw'], name=entry.get('name', ''), latency=entry['latency'])
+                for phase in EndpointIndex.PHASES:
+                    if phase in entry:
+                        node[phase] = entry[phase]
+                self.available_nodes.append(node)
+                self.exporter.write(node)
+                self.counters.record_latency(node['latency'])
+                if self.top is not None:
+                    self.offer_target(node)
+                else:
+                    self.sink.append(*self.result_entry(node))
+            elif entry.get('f') in ('slow', 'unreachable'):
+                self.counters.add('tested', 'failed', entry['f'])
+            else:
+                # 旧版日志未记录失败分类
+                self.counters.add('tested', 'failed')
+    
+    def complete_probe(self, info, latency, record=True):
+        """端点探测完成：记录历史，结果分发给同端点的所有节点"""
+        if record and self.history is not None:
+            self.history.record(info, latency)
         
-        with ThreadPoolExecutor(max_workers=self.config['max_workers']) as executor:
-            self.actual_workers = self.config['max_workers']
-            futures = [executor.submit(self.process_node, node) for node in nodes]
+        for member in self.endpoints.complete(info, latency):
+            self.finish_node(member, latency)
+    
+    def create_controller(self):
+        """按引擎创建自适应并发控制器（整个运行期间共用）"""
+        if self.controller is None and self.config['adaptive']:
+            if self.config['engine'] == 'async':
+                maximum = self.config['async_concurrency']
+            else:
+                maximum = max(self.config['max_concurrency'], self.config['max_workers'])
+            self.controller = AdaptiveConcurrency(self.config['max_workers'], maximum=self.budget.cap(maximum))
+        return self.controller
+    
+    def probe_node_gated(self, node):
+        """线程引擎：在自适应上限内探测"""
+        self.controller.acquire()
+        try:
+            # 等待名额期间可能已收到停止信号
+            if self.stop_flag.is_set():
+                return None
+            return self.probe_node(node)
+        finally:
+            self.controller.release()
+    
+    def probe_all(self, nodes, on_result):
+        """用配置的引擎探测节点，on_result(info, latency)在调度线程中回调"""
+        controller = self.create_controller()
+        
+        if self.config['engine'] == 'async':
+            engine = AsyncProbeEngine(self.config['timeout'], self.config['async_concurrency'], controller,
+                                      self.budget, self.tls)
+            self.actual_workers = engine.concurrency
+            engine.run(
+                nodes,
+                lambda node: self.probe_node_async(node, engine),
+                lambda node, outcome: on_result(*outcome),
+                self.stop_flag
+            )
+            return
+        
+        pool_size = controller.maximum if controller else self.budget.cap(self.config['max_workers'])
+        task = self.probe_node_gated if controller else self.probe_node
+        window = max(self.config['submit_window'] or pool_size * 2, pool_size)
+        
+        # 滑动窗口：提交线程每完成一个补交一个，线程池持续饱和，内存中只有窗口内的Future；
+        # 节点流可能阻塞等待订阅解析，所以提交与收取结果分在两个线程
+        slots = threading.Semaphore(window)
+        completed = queue.SimpleQueue()
+        submitted = 0
+        
+        def probe(node):
+            # 停止后仍在排队的任务直接跳过
+            return None if self.stop_flag.is_set() else task(node)
+        
+        def feed(executor):
+            nonlocal submitted
+            try:
+                for node in nodes:
+                    slots.acquire()
+                    if self.stop_flag.is_set():
+                        break
+                    executor.submit(probe, node).add_done_callback(completed.put)
+                    submitted += 1
+            finally:
+                completed.put(None)  # 提交结束标记，此后submitted不再变化
+        
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            self.actual_workers = pool_size
+            feeder = threading.Thread(target=feed, args=(executor,), daemon=True)
+            feeder.start()
             
-            for future in as_completed(futures):
-                if self.stop_flag.is_set():
-                    break
+            processed = 0
+            feeding = True
+            while feeding or processed < submitted:
+                future = completed.get()
+                if future is None:
+                    feeding = False
+                    continue
                 
+                processed += 1
+                slots.release()
                 try:
-                    result = future.result(timeout=self.config['timeout'])
-                    if result:
-                        batch_results.append(result)
-                        self.available_nodes.append(result)
-                        
-                        # 定期保存
-                        if len(self.available_nodes) % self.config['save_interval'] == 0:
-                            self.save_results(final=False)
-                except:
+                    result = future.result()
+                    if result is not None:
+                        on_result(*result)
+                except Exception:
                     pass
-        
-        return batch_results
+            
+            feeder.join()
+    
+    def test_sharded(self, stream, backlog):
+        """多进程分片测试：节点边解析边分发给已fork的分片进程，父进程汇总结果"""
+        for info, latency in self.runner.run(stream, self.stop_flag, backlog):
+            self.complete_probe(info, latency)
     
     def run(self):
         """主运行函数"""
@@ -946,46 +3549,78 @@ class VisualNodeTester:
         
         print(f"{Colors.BRIGHT_GREEN}✅ 发现 {len(subscribe_links)} 个订阅链接{Colors.RESET}")
         
-        # 解析所有节点
-        all_nodes = []
-        valid_subscribe_links = []
-        print(f"{Colors.BRIGHT_CYAN}🔍 解析节点...{Colors.RESET}")
-        
-        for i, link in enumerate(subscribe_links, 1):
-            print(f"  解析订阅 {i}/{len(subscribe_links)}...", end='\r')
-            nodes = self.decode_subscribe_fast(link)
-            if nodes:
-                valid_subscribe_links.append(link)
-                all_nodes.extend(nodes)
-        
-        self.save_valid_subscribe_links(valid_subscribe_links)
+        print(f"{Colors.BRIGHT_YELLOW}⏳ 边解析边测试，请稍候...{Colors.RESET}\n")
         
-        # 去重
-        all_nodes = list(set(all_nodes))
-        self.total_nodes = len(all_nodes)
+        # 多进程分片：在启动任何线程、打开历史库/日志/导出文件之前fork，子进程不会继承被持有的锁
+        if self.config['processes'] > 1 and ShardedProbeRunner.available():
+            self.runner = ShardedProbeRunner(self.config, self.config['processes'])
+            self.runner.start()
+            self.actual_workers = self.runner.total_workers()
         
-        if self.total_nodes == 0:
-            print(f"{Colors.BRIGHT_RED}❌ 没有解析到任何节点！{Colors.RESET}")
-            return
+        # 上次运行异常退出残留的溢写文件：先另存到带时间戳的独立文件，本次检查点与最终结果都不会覆盖它
+        recovered_path = f"node_recovered_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        try:
+            recovered = self.sink.recover(recovered_path)
+            if recovered:
+                print(f"{Colors.BRIGHT_YELLOW}⚠️  发现上次未完成运行的结果，已将 {recovered:,} 个可用节点另存到 {recovered_path}{Colors.RESET}")
+        except OSError as e:
+            print(f"{Colors.BRIGHT_RED}❌ 合并上次残留结果失败: {e}{Colors.RESET}")
         
-        print(f"{Colors.BRIGHT_GREEN}✅ 成功解析 {self.total_nodes:,} 个节点{Colors.RESET}")
-        print(f"{Colors.BRIGHT_YELLOW}⏳ 开始测试，请稍候...{Colors.RESET}\n")
+        # 流式导出（续测恢复的节点也重新写入）
+        try:
+            self.exporter.open()
+        except OSError as e:
+            print(f"{Colors.BRIGHT_RED}❌ 创建导出文件失败: {e}{Colors.RESET}")
+        
+        # 断点续测
+        self.journal = CheckpointJournal(self.config['journal'])
+        if self.config['resume'] and self.journal.exists():
+            self.resume_from_journal()
+            print(f"{Colors.BRIGHT_GREEN}✅ 断点续测：已恢复 {self.tested_nodes:,} 个已测节点，"
+                  f"{self.success_nodes:,} 个可用{Colors.RESET}")
+        elif self.journal.exists():
+            print(f"{Colors.BRIGHT_YELLOW}⚠️  发现未完成的测试，本次将重新开始（使用 --resume 可继续）{Colors.RESET}")
+        self.journal.open(resume=self.config['resume'])
+        
+        # 增量模式：载入窗口期内的成功结果
+        if self.config['incremental'] and self.history is not None:
+            self.reusable = self.history.recent_successes(self.config['incremental_window'])
+            print(f"{Colors.BRIGHT_GREEN}✅ 增量模式：{len(self.reusable):,} 个端点可复用历史结果{Colors.RESET}")
+        
+        # 目标模式：历史上越快的端点越先探测
+        if self.top is not None and self.config['prioritize'] and self.history is not None:
+            self.priorities = self.history.recent_successes(self.config['incremental_window'])
+        
+        # 生产者线程：订阅解析后的节点实时进入探测队列
+        if self.priorities:
+            node_queue = queue.PriorityQueue(maxsize=self.config['queue_depth'])
+        else:
+            self.priorities = None
+            node_queue = queue.Queue(maxsize=self.config['queue_depth'])
+        self.sources_total = len(subscribe_links)
+        producer = threading.Thread(
+            target=self.ingest_subscriptions,
+            args=(subscribe_links, node_queue),
+            daemon=True
+        )
+        producer.start()
         
         # 启动UI更新线程
         ui_thread = threading.Thread(target=self.ui_update_thread, daemon=True)
         ui_thread.start()
         
-        # 分批处理节点
-        for i in range(0, len(all_nodes), self.config['batch_size']):
-            if self.stop_flag.is_set():
-                break
-            
-            batch = all_nodes[i:i+self.config['batch_size']]
-            self.test_batch(batch)
-            
-            # 内存清理
-            if i % 10000 == 0:
-                gc.collect()
+        stream = self.drain_queue(node_queue)
+        if self.runner is not None:
+            self.test_sharded(stream, lambda: not node_queue.empty())
+        else:
+            self.test_stream(stream)
+        
+        if self.total_nodes == 0 and not self.stop_flag.is_set():
+            self.stop_flag.set()
+            self.journal.remove()
+            UIComponents.show_cursor()
+            print(f"{Colors.BRIGHT_RED}❌ 没有解析到任何节点！{Colors.RESET}")
+            return
         
         # 等待所有任务完成
         self.stop_flag.set()
@@ -993,6 +3628,21 @@ class VisualNodeTester:
         
         # 最终保存
         self.save_results(final=True)
+        if self.interrupted:
+            # 中断退出：保留断点日志供 --resume 继续
+            if self.history is not None:
+                self.history.close()
+            self.print_interrupted()
+            return
+        if self.config['histogram_json']:
+            try:
+                self.counters.histogram().export(self.config['histogram_json'])
+                self.histogram_exported = True
+            except OSError as e:
+                print(f"{Colors.BRIGHT_RED}❌ 导出延迟直方图失败: {e}{Colors.RESET}")
+        if self.history is not None:
+            self.history.close()
+        self.journal.remove()
         
         # 显示最终统计
         UIComponents.show_cursor()
@@ -1048,6 +3698,9 @@ class VisualNodeTester:
             print(f"  {Colors.BRIGHT_WHITE}可用内存:{Colors.RESET} {mem.available / (1024**3):.1f}GB")
         
         print(f"  {Colors.BRIGHT_WHITE}推荐线程:{Colors.RESET} {self.config['max_workers']}")
+        if self.budget.fd_limit:
+            print(f"  {Colors.BRIGHT_WHITE}文件描述符:{Colors.RESET} {self.budget.fd_before} → {self.budget.fd_limit}  "
+                  f"{Colors.BRIGHT_WHITE}套接字预算:{Colors.RESET} {self.budget.capacity}")
         print()
         
         # Feature list (existing logic)
@@ -1076,21 +3729,55 @@ class VisualNodeTester:
         # 统计信息
         runtime = str(datetime.now() - self.start_time).split('.')[0]
         success_rate = (self.success_nodes / max(self.tested_nodes, 1)) * 100
+        probed = self.endpoints.probed - self.reused_endpoints
         
         stats = [
             ("测试总数", f"{self.tested_nodes:,}"),
             ("成功节点", f"{self.success_nodes:,}"),
-            ("失败节点", f"{self.failed_nodes:,}"),
+            ("失败节点", f"{self.failed_nodes:,} (过慢 {self.slow_nodes:,} / 不可达 {self.unreachable_nodes:,})"),
             ("成功率", f"{success_rate:.1f}%"),
             ("运行时间", runtime),
-            ("平均速度", f"{self.tested_nodes / max((datetime.now() - self.start_time).total_seconds(), 1):.1f} 节点/秒")
+            ("平均速度", f"{self.tested_nodes / max((datetime.now() - self.start_time).total_seconds(), 1):.1f} 节点/秒"),
+            ("探测引擎", f"{self.config['engine']} × {self.config['processes']} 进程"),
+            ("探测端点", f"{probed:,} (节省 {(1 - probed / max(self.tested_nodes, 1)) * 100:.0f}% 握手)"),
+            ("历史复用", f"{self.reused_endpoints:,} 个端点"),
+            ("DNS解析", "{lookups:,} 个主机, 平均 {avg_ms:.0f}ms, 失败 {failures:,}".format(**self.resolver.summary())),
+            ("套接字预算", f"{self.budget.capacity:,} (本机资源耗尽重试 {self.budget.exhausted:,} 次)")
         ]
+        histogram = self.counters.histogram()
+        if histogram.total:
+            latency = histogram.summary()
+            stats.append(("延迟", f"平均 {latency['mean']:.0f}ms, P50 {latency['p50']:.0f} / P90 {latency['p90']:.0f} / "
+                                  f"P99 {latency['p99']:.0f}ms, 最低 {latency['min']:.0f} / 最高 {latency['max']:.0f}ms"))
+        if self.config['deadline']:
+            stats.append(("探测截止", f"{self.config['max_latency'] + self.config['deadline_margin']:,}ms "
+                                    f"(最大延迟 + {self.config['deadline_margin']}ms 余量)"))
+        if self.tls.resumption:
+            tls = self.tls.summary()
+            stats.append(("会话复用", f"{tls['resumed']:,}/{tls['attempts']:,} 次握手成功复用"))
+        if self.top is not None:
+            status = "已达成，提前结束" if self.target_reached else "未达成"
+            stats.append(("目标", f"{min(self.top.qualified, self.top.size):,}/{self.top.size:,} 个 "
+                                  f"≤{self.top.target_latency:.0f}ms 节点 ({status})"))
         
         for label, value in stats:
             print(f"  {Colors.BRIGHT_WHITE}{label}:{Colors.RESET} {Colors.BRIGHT_CYAN}{value}{Colors.RESET}")
         
         print()
         
+        # 订阅下载耗时
+        fetch = self.fetcher.summary()
+        if fetch['count']:
+            print(f"  {UIComponents.status_icon('globe')} {Colors.BOLD}订阅下载{Colors.RESET}")
+            print(f"  {Colors.BRIGHT_WHITE}成功/总数:{Colors.RESET} {Colors.BRIGHT_CYAN}{fetch['ok']}/{fetch['count']}{Colors.RESET}  "
+                  f"{Colors.BRIGHT_WHITE}缓存命中:{Colors.RESET} {Colors.BRIGHT_CYAN}{fetch['cached']}{Colors.RESET}  "
+                  f"{Colors.BRIGHT_WHITE}实际耗时:{Colors.RESET} {Colors.BRIGHT_CYAN}{fetch['wall']:.1f}s{Colors.RESET}  "
+                  f"{Colors.BRIGHT_WHITE}逐个下载需:{Colors.RESET} {Colors.BRIGHT_CYAN}{fetch['total']:.1f}s{Colors.RESET}")
+            for link, elapsed, ok, source in fetch['slowest']:
+                status = Colors.BRIGHT_GREEN + "✓" if ok else Colors.BRIGHT_RED + "✗"
+                print(f"  {status}{Colors.RESET} {Colors.DIM}{elapsed:5.2f}s  {UIComponents.truncate_by_width(link, 60)}{Colors.RESET}")
+            print()
+        
         # 显示最优节点
         if self.available_nodes:
             print(f"  {UIComponents.status_icon('star')} {Colors.BOLD}Top 5 最优节点{Colors.RESET}")
@@ -1115,14 +3802,157 @@ class VisualNodeTester:
                 display_width = UIComponents.get_display_width(truncated_name)
                 padding = ' ' * (max_name_width - display_width)
                 
-                print(f"  {medal} {i}. {truncated_name}{padding} {color}{latency:.0f}ms{Colors.RESET}")
+                print(f"  {medal} {i}. {truncated_name}{padding} {color}{latency:.0f}ms{Colors.RESET}"
+                      f"{Colors.DIM}{self.format_phases(node)}{Colors.RESET}")
         
         print()
         print(Colors.gradient_text("="*74, (255, 0, 255), (0, 255, 255)))
         print()
         print(f"  {Colors.BRIGHT_GREEN}✅ 结果已保存到 node.txt{Colors.RESET}")
+        if self.histogram_exported:
+            print(f"  {Colors.BRIGHT_GREEN}✅ 延迟直方图已导出到 {self.config['histogram_json']}{Colors.RESET}")
         print()
 
+# ═══════════════════════════════════════════════════════════════
+# 多进程分片测速
+# ═══════════════════════════════════════════════════════════════
+
+def shard_worker(config, task_queue, result_queue, flush_size=200, flush_interval=0.2):
+    """分片工作进程：从共享任务队列取节点批次，独立的线程池/事件循环探测，结果分批回传父进程"""
+    tester = VisualNodeTester(config)
+    # 中断由父进程统一处理
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    
+    buffer = []
+    lock = threading.Lock()
+    done = threading.Event()
+    
+    def flush():
+        with lock:
+            if buffer:
+                result_queue.put(buffer[:])
+                buffer.clear()
+    
+    def on_result(info, latency):
+        with lock:
+            buffer.append((info, latency))
+            full = len(buffer) >= flush_size
+        if full:
+            flush()
+    
+    def flusher():
+        # 订阅解析慢时批次凑不满，定时回传，父进程的界面与日志不会滞后
+        while not done.wait(flush_interval):
+            flush()
+    
+    def nodes():
+        while True:
+            batch = task_queue.get()
+            if batch is None:
+                return
+            yield from batch
+    
+    threading.Thread(target=flusher, daemon=True).start()
+    try:
+        tester.probe_all(nodes(), on_result)
+    finally:
+        done.set()
+        flush()
+        result_queue.put(None)
+
+
+class ShardedProbeRunner:
+    """多进程分片调度器 - 子进程在父进程启动任何线程之前fork，节点边解析边经共享任务队列分发，空闲的进程先取"""
+    
+    def __init__(self, config, processes, batch_size=64):
+        self.processes = max(int(processes), 1)
+        self.batch_size = batch_size  # 节点积压时每批发送的数量
+        # 子进程只做探测，不渲染界面、不再分片
+        self.worker_config = dict(config, visual_mode=False, processes=1)
+        self.workers = []
+        self.task_queue = None
+        self.result_queue = None
+    
+    @staticmethod
+    def available():
+        """分片依赖fork启动方式（脚本可能通过管道运行，无法spawn）"""
+        return 'fork' in multiprocessing.get_all_start_methods()
+    
+    def total_workers(self):
+        """所有进程的并发探测数之和"""
+        if self.worker_config['engine'] == 'async':
+            return self.processes * self.worker_config['async_concurrency']
+        return self.processes * self.worker_config['max_workers']
+    
+    def start(self):
+        """fork子进程：须在父进程启动UI/订阅/DNS线程、打开历史库与日志之前调用，子进程不会继承被其他线程持有的锁"""
+        ctx = multiprocessing.get_context('fork')
+        self.task_queue = ctx.Queue(maxsize=self.processes * 4)
+        self.result_queue = ctx.Queue(maxsize=self.processes * 64)
+        # 未写出的输出缓冲会被子进程继承，退出时再写一遍
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.workers = [
+            ctx.Process(target=shard_worker, args=(self.worker_config, self.task_queue, self.result_queue), daemon=True)
+            for _ in range(self.processes)
+        ]
+        for worker in self.workers:
+            worker.start()
+    
+    def _put(self, item, stop_flag):
+        while not stop_flag.is_set():
+            try:
+                self.task_queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+    
+    def feed(self, nodes, backlog, stop_flag):
+        """把节点流分批放入任务队列：积压时凑满一批，否则已解析的立即发出，不等订阅解析"""
+        batch = []
+        try:
+            for node in nodes:
+                batch.append(node)
+                if len(batch) >= self.batch_size or not backlog():
+                    self._put(batch, stop_flag)
+                    batch = []
+            if batch:
+                self._put(batch, stop_flag)
+        finally:
+            for _ in self.workers:
+                self._put(None, stop_flag)
+    
+    def run(self, nodes, stop_flag, backlog=lambda: False):
+        """分发节点流（backlog()为真表示还有已解析的节点可立即取出），逐个产出 (节点信息, 延迟)"""
+        feeder = threading.Thread(target=self.feed, args=(nodes, backlog, stop_flag), daemon=True)
+        feeder.start()
+        
+        finished = 0
+        try:
+            while finished < len(self.workers) and not stop_flag.is_set():
+                try:
+                    batch = self.result_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in self.workers):
+                        break
+                    continue
+                
+                if batch is None:
+                    finished += 1
+                    continue
+                
+                for item in batch:
+                    yield item
+        finally:
+            for worker in self.workers:
+                if worker.is_alive():
+                    worker.terminate()
+            for worker in self.workers:
+                worker.join(timeout=1)
+            # 子进程已退出，队列中未送出的批次无人读取：退出时不等待其写完
+            self.task_queue.cancel_join_thread()
+
 # ═══════════════════════════════════════════════════════════════
 # 主程序入口
 # ═══════════════════════════════════════════════════════════════
@@ -1131,23 +3961,94 @@ def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='超高性能节点测速工具 V1.0')
     parser.add_argument('-t', '--timeout', type=int, default=3, help='连接超时时间(秒)')
-    parser.add_argument('-w', '--workers', type=int, help='并发线程数')
+    parser.add_argument('-w', '--workers', type=int, help='并发线程数（自适应模式下为初始并发）')
     parser.add_argument('-m', '--max-latency', type=int, default=500, help='最大延迟(ms)')
     parser.add_argument('--no-visual', action='store_true', help='禁用可视化界面')
     parser.add_argument('-f', '--file', default='subscribe.txt', help='订阅文件路径')
+    parser.add_argument('-e', '--engine', choices=['thread', 'async'], default='thread',
+                       help='探测引擎: thread(线程池) / async(asyncio)')
+    parser.add_argument('--concurrency', type=int, default=1000, help='async引擎并发握手数')
+    parser.add_argument('-p', '--processes', type=int, default=1,
+                       help='分片进程数(0=CPU核心数)')
+    parser.add_argument('--cache-ttl', type=int, default=0,
+                       help='订阅缓存有效期(秒)，期内不重新请求')
+    parser.add_argument('--offline', action='store_true', help='离线模式：只使用订阅缓存')
+    parser.add_argument('--no-cache', action='store_true', help='禁用订阅缓存')
+    parser.add_argument('--incremental', action='store_true',
+                       help='增量模式：复用窗口期内已成功探测的结果')
+    parser.add_argument('--window', type=int, default=60, help='增量窗口(分钟)')
+    parser.add_argument('--no-history', action='store_true', help='不记录延迟历史')
+    parser.add_argument('--resume', action='store_true', help='从断点日志继续上次中断的测试')
+    parser.add_argument('--no-adaptive', action='store_true', help='禁用自适应并发，使用固定线程数')
+    parser.add_argument('--max-concurrency', type=int, default=256, help='自适应并发上限(线程引擎)')
+    parser.add_argument('--max-sockets', type=int, default=0, help='在途套接字上限(0=按文件描述符上限)')
+    parser.add_argument('--source-address', action='append', default=[], help='本地源地址，可多次指定以轮换')
+    parser.add_argument('--no-rst', action='store_true', help='正常关闭探测连接(默认RST关闭，不留TIME_WAIT)')
+    parser.add_argument('--tls-min', choices=['TLSv1.2', 'TLSv1.3'], default='TLSv1.2', help='探测握手的最低TLS版本')
+    parser.add_argument('--tls-resume', action='store_true', help='额外测量会话复用握手延迟(客户端实际体验)')
+    parser.add_argument('--target', type=int, default=0, help='找到N个达标节点后提前结束并只保存这N个')
+    parser.add_argument('--target-latency', type=int, default=0, help='达标延迟(ms)，默认同--max-latency')
+    parser.add_argument('--no-prioritize', action='store_true', help='目标模式下不按历史延迟排序探测')
+    parser.add_argument('--no-deadline', action='store_true', help='探测等待完整timeout，不按最大延迟提前放弃')
+    parser.add_argument('--deadline-margin', type=int, default=100, help='探测截止 = 最大延迟 + 余量(毫秒)')
+    parser.add_argument('--histogram-json', default='', metavar='文件', help='导出整轮延迟直方图(含p50/p90/p99)为JSON')
+    parser.add_argument('--export', action='append', default=[], choices=['json', 'csv', 'sub'],
+                        help='边测边写的导出格式(可多次指定): json(JSON Lines) / csv / sub(base64订阅)')
+    parser.add_argument('--probe-timeout', action='append', default=[], metavar='策略=秒',
+                       help='单独设置探测策略超时，如 quic=1.5（策略: tcp/tls/quic）')
     
     args = parser.parse_args()
     
+    if args.incremental and args.no_history:
+        parser.error("--incremental 依赖延迟历史，不能与 --no-history 同时使用")
+    
     # 配置参数
     config = {
         'timeout': args.timeout,
         'max_latency': args.max_latency,
         'visual_mode': not args.no_visual,
+        'engine': args.engine,
+        'async_concurrency': args.concurrency,
+        'processes': args.processes or multiprocessing.cpu_count(),
+        'cache_ttl': args.cache_ttl,
+        'offline': args.offline,
+        'use_cache': not args.no_cache,
+        'incremental': args.incremental,
+        'incremental_window': args.window * 60,
+        'history': not args.no_history,
+        'resume': args.resume,
+        'adaptive': not args.no_adaptive,
+        'max_concurrency': args.max_concurrency,
+        'max_sockets': args.max_sockets,
+        'source_addresses': args.source_address,
+        'rst_close': not args.no_rst,
+        'tls_min_version': args.tls_min,
+        'tls_resumption': args.tls_resume,
+        'target': args.target,
+        'target_latency': args.target_latency,
+        'prioritize': not args.no_prioritize,
+        'deadline': not args.no_deadline,
+        'deadline_margin': args.deadline_margin,
+        'histogram_json': args.histogram_json,
+        'export': args.export,
     }
     
     if args.workers:
         config['max_workers'] = args.workers
     
+    strategy_timeouts = {'quic': 2}
+    strategies = set(VisualNodeTester.PROTOCOL_STRATEGIES.values()) | set(VisualNodeTester.TRANSPORT_STRATEGIES.values())
+    for item in args.probe_timeout:
+        strategy, _, seconds = item.partition('=')
+        strategy = strategy.strip()
+        if strategy not in strategies:
+            parser.error(f"无效的 --probe-timeout 策略: {strategy}（可选: {'/'.join(sorted(strategies))}）")
+        try:
+            strategy_timeouts[strategy] = float(seconds)
+        except ValueError:
+            parser.error(f"无效的 --probe-timeout: {item}")
+    config['strategy_timeouts'] = strategy_timeouts
+    
     # 创建测试器并运行
     tester = VisualNodeTester(config)
     
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+探测策略测试 - 用本地替身服务器验证 TCP / TLS / QUIC 三种探测
+
+替身服务器：
+  - TLS服务器（自签名证书 keycert.pem）
+  - 纯TCP监听（接受连接后立即关闭，不握手）
+  - UDP应答器（按RFC 9000回复版本协商包，回显客户端的源连接ID）
+  - 已关闭的端口
+
+运行: python -m pytest -q tests  或  python -m unittest discover tests
+"""
+
+import asyncio
+import importlib.util
+import os
+import signal
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(os.path.dirname(HERE), 'node-speed-tester-fixed_v1.py')
+CERT = os.path.join(HERE, 'keycert.pem')
+
+
+def load_tester():
+    """按文件路径导入脚本（文件名含连字符），导入时不自动安装依赖"""
+    spec = importlib.util.spec_from_file_location('node_speed_tester_v1', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    with mock.patch.object(subprocess, 'check_call', side_effect=subprocess.CalledProcessError(1, 'pip')), \
+            mock.patch('builtins.print'):
+        spec.loader.exec_module(module)
+    return module
+
+
+nst = load_tester()
+
+# ═══════════════════════════════════════════════════════════════
+# 替身服务器
+# ═══════════════════════════════════════════════════════════════
+
+def serve(handler, sock):
+    """后台线程循环接受连接，每个连接交给handler"""
+    def loop():
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=handler, args=(conn,), daemon=True).start()
+    threading.Thread(target=loop, daemon=True).start()
+
+
+def start_tls_server():
+    """TLS服务器：完成握手后等待客户端关闭"""
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(CERT)
+    sock = socket.create_server(('127.0.0.1', 0))
+
+    def handle(conn):
+        try:
+            with ctx.wrap_socket(conn, server_side=True) as tls:
+                tls.recv(1)
+        except (OSError, ssl.SSLError):
+            conn.close()
+
+    serve(handle, sock)
+    return sock
+
+
+def start_tcp_server():
+    """纯TCP监听：接受后立即关闭，TLS握手在此失败"""
+    sock = socket.create_server(('127.0.0.1', 0))
+    serve(lambda conn: conn.close(), sock)
+    return sock
+
+
+def start_quic_responder():
+    """UDP应答器：收到足长的Initial包时先回一个无关数据报，再回版本协商包"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+
+    def loop():
+        while True:
+            try:
+                data, addr = sock.recvfrom(2048)
+            except OSError:
+                return
+            if len(data) < nst.QUICProbe.PACKET_SIZE:
+                continue
+            dcid = data[6:6 + data[5]]
+            offset = 6 + data[5]
+            scid = data[offset + 1:offset + 1 + data[offset]]
+            # 版本协商包：目标连接ID = 客户端源连接ID，源连接ID = 客户端目标连接ID
+            reply = b'\x80' + b'\x00' * 4 + bytes([len(scid)]) + scid + bytes([len(dcid)]) + dcid + b'\x00\x00\x00\x01'
+            sock.sendto(b'noise', addr)
+            sock.sendto(reply, addr)
+
+    threading.Thread(target=loop, daemon=True).start()
+    return sock
+
+
+def closed_port(kind=socket.SOCK_STREAM):
+    """取一个当前无人监听的端口"""
+    with socket.socket(socket.AF_INET, kind) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+# ═══════════════════════════════════════════════════════════════
+# 测试
+# ═══════════════════════════════════════════════════════════════
+
+class ProbeStrategyTest(unittest.TestCase):
+
+    HOST = '127.0.0.1'
+    TIMEOUT = 2
+
+    @classmethod
+    def setUpClass(cls):
+        cls.servers = [start_tls_server(), start_tcp_server(), start_quic_responder()]
+        cls.tls_port, cls.tcp_port, cls.quic_port = (s.getsockname()[1] for s in cls.servers)
+        cls.closed_tcp = closed_port()
+        cls.closed_udp = closed_port(socket.SOCK_DGRAM)
+
+        # 测试器会在当前目录建缓存并接管信号，放到临时目录里并在结束后恢复
+        cls.cwd = os.getcwd()
+        cls.tmp = tempfile.TemporaryDirectory()
+        os.chdir(cls.tmp.name)
+        cls.handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGINT, signal.SIGTERM)}
+        cls.tester = nst.VisualNodeTester({
+            'visual_mode': False,
+            'timeout': cls.TIMEOUT,
+            'deadline': False,
+            'history': False,
+            'use_cache': False,
+            'strategy_timeouts': {'quic': 1},
+        })
+
+    @classmethod
+    def tearDownClass(cls):
+        for sig, handler in cls.handlers.items():
+            signal.signal(sig, handler)
+        os.chdir(cls.cwd)
+        cls.tmp.cleanup()
+        for sock in cls.servers:
+            sock.close()
+
+    def info(self, port, **extra):
+        return dict({'server': self.HOST, 'port': port}, **extra)
+
+    def run_async(self, timings, port, info=None):
+        """在新事件循环中运行异步引擎的一种策略"""
+        engine = nst.AsyncProbeEngine(self.TIMEOUT, 10, budget=self.tester.budget, tls=self.tester.tls)
+        return asyncio.run(timings(engine, self.HOST, port, info or self.info(port), self.TIMEOUT))
+
+    # ── 同步探测 ──
+
+    def test_probe_tcp(self):
+        timings = self.tester.probe_tcp(self.HOST, self.tcp_port, self.info(self.tcp_port), self.TIMEOUT)
+        self.assertGreater(timings['tcp_ms'], 0)
+
+    def test_probe_tls(self):
+        timings = self.tester.probe_tls(self.HOST, self.tls_port, self.info(self.tls_port, sni='localhost'), self.TIMEOUT)
+        self.assertGreater(timings['tcp_ms'], 0)
+        self.assertGreater(timings['tls_ms'], 0)
+
+    def test_probe_tls_without_handshake(self):
+        # 端口可连但不说TLS：TCP阶段有耗时，握手阶段为None
+        timings = self.tester.probe_tls(self.HOST, self.tcp_port, self.info(self.tcp_port), self.TIMEOUT)
+        self.assertGreater(timings['tcp_ms'], 0)
+        self.assertIsNone(timings['tls_ms'])
+
+    def test_probe_quic(self):
+        timings = self.tester.probe_quic(self.HOST, self.quic_port, self.info(self.quic_port), self.TIMEOUT)
+        self.assertGreater(timings['udp_ms'], 0)
+
+    # ── 异步探测 ──
+
+    def test_async_tcp_timings(self):
+        timings = self.run_async(nst.AsyncProbeEngine.tcp_timings, self.tcp_port)
+        self.assertGreater(timings['tcp_ms'], 0)
+
+    def test_async_tls_timings(self):
+        timings = self.run_async(nst.AsyncProbeEngine.tls_timings, self.tls_port, self.info(self.tls_port, sni='localhost'))
+        self.assertGreater(timings['tcp_ms'], 0)
+        self.assertGreater(timings['tls_ms'], 0)
+
+    def test_async_quic_timings(self):
+        timings = self.run_async(nst.AsyncProbeEngine.quic_timings, self.quic_port)
+        self.assertGreater(timings['udp_ms'], 0)
+
+    # ── 策略路由 ──
+
+    def test_probe_strategy_routing(self):
+        cases = {
+            f'ss://YWVzLTEyOC1nY206cHc=@{self.HOST}:{self.tcp_port}#ss': ('tcp', 'tcp_ms'),
+            f'trojan://pw@{self.HOST}:{self.tls_port}?sni=localhost#trojan': ('tls', 'tls_ms'),
+            f'hy2://pw@{self.HOST}:{self.quic_port}#hy2': ('quic', 'udp_ms'),
+        }
+        for link, (strategy, phase) in cases.items():
+            with self.subTest(link=link):
+                info, latency = self.tester.probe_node(link)
+                self.assertEqual(info['strategy'], strategy)
+                self.assertEqual(self.tester.probe_strategy(info), strategy)
+                self.assertGreater(info[phase], 0)
+                self.assertIsNotNone(latency)
+                self.assertEqual(self.tester.classify(info, latency), 'ok')
+
+    # ── 已关闭端口 ──
+
+    def test_closed_port(self):
+        for probe in (self.tester.probe_tcp, self.tester.probe_tls):
+            with self.subTest(probe=probe.__name__):
+                timings = probe(self.HOST, self.closed_tcp, self.info(self.closed_tcp), self.TIMEOUT)
+                self.assertIsNone(timings['tcp_ms'])
+                self.assertFalse(timings['timed_out'])  # 连接被拒，不是超时
+
+        timings = self.run_async(nst.AsyncProbeEngine.tcp_timings, self.closed_tcp)
+        self.assertIsNone(timings['tcp_ms'])
+        self.assertFalse(timings['timed_out'])
+
+        timings = self.tester.probe_quic(self.HOST, self.closed_udp, self.info(self.closed_udp), 0.5)
+        self.assertIsNone(timings['udp_ms'])
+
+        info, latency = self.tester.probe_node(f'trojan://pw@{self.HOST}:{self.closed_tcp}#closed')
+        self.assertIsNone(latency)
+        self.assertEqual(self.tester.classify(info, latency), 'unreachable')
+
+
+if __name__ == '__main__':
+    unittest.main()